@@ -30,6 +30,7 @@ class AS3935_Base:
     REG_03 = 0x03
     REG_04 = 0x04
     REG_05 = 0x05
+    INT_SETTLE_SECONDS = 0.002  # wait before reading the interrupt reason (per the datasheet)
     def __init__(self, irq, bus=1, address=0x03):
         """
         Configure the main parameters of AS3935.
@@ -44,6 +45,9 @@ class AS3935_Base:
         self.pi = pigpio.pi()
         self.device = None
         self.debug = False
+        # our copy of the writable bits of register 0x03 (LCO_FDIV, MASK_DIST) so changing them
+        #  is a single write: the read-only INT bits share this register and reading them clears them
+        self.reg03_shadow = None
         # Let our derived classes handle this!
         #self.i2c_device = self.pi.i2c_open(bus, address)
 
@@ -76,6 +80,42 @@ class AS3935_Base:
         NOTHING this is only used in SPI
         """
 
+    # ------ IRQ PIN FUNCTIONS ------ #
+
+    def configure_irq_pin(self):
+        """
+        Configures the IRQ GPIO pin as an input with a pull-down
+        """
+        self.pi.set_mode(self.irq, pigpio.INPUT)
+        self.pi.set_pull_up_down(self.irq, pigpio.PUD_DOWN)
+
+    def irq_pending(self):
+        """
+        Checks the level of the IRQ pin (without touching the I2C/SPI bus)
+
+        :return: (bool) whether an interrupt is waiting to be read
+        """
+        return self.pi.read(self.irq) == 1
+
+    def add_irq_callback(self, callback):
+        """
+        Calls callback(gpio, level, tick) on each rising edge of the IRQ pin. tick is the pigpio
+        hardware timestamp of the edge in microseconds (wraps every ~72 minutes)
+
+        :param callback: (function) the function to call
+        :return: (pigpio._callback) cancel() this when done
+        """
+        return self.pi.callback(self.irq, pigpio.RISING_EDGE, callback)
+
+    def microseconds_since_tick(self, tick):
+        """
+        Returns how long ago (in microseconds) a pigpio tick was
+
+        :param tick: (int) a tick as handed to our IRQ callback
+        :return: (int) microseconds between tick and now
+        """
+        return pigpio.tickDiff(tick, self.pi.get_current_tick())
+
     # ------ CROSS FUNCTIONS ------ #
 
     def read_byte(self, address):
@@ -90,6 +130,17 @@ class AS3935_Base:
         raise AssertionError('The read_byte() method must be overridden by the derived class, base should not be called!')
         pass
 
+    def read_bytes(self, address, count=1):
+        """
+        Returns the values of count bytes starting at address.
+        (derived classes override this with a single burst read)
+
+        :param address: (int) the address to read from
+        :param count: (int) the number of bytes to be read
+        :return: (list) the values read
+        """
+        return [self.read_byte(address + offset) for offset in range(count)]
+
     def write_byte(self, address, value):
         """
         Writes value at address. Raises ValueError if the value is not correct.
@@ -137,6 +188,7 @@ class AS3935_Base:
         """
         self.print_line('++ reset chip to default values', debug=True)
         self.write_byte(0x3C, 0x96)
+        self.reg03_shadow = None
 
     def calibrate_rco(self):
         """
@@ -294,9 +346,31 @@ class AS3935_Base:
             self.print_line('++ returning [{}] for [{}]'.format(distInterp, dist), debug=True)
         return distInterp
 
+    def get_strike(self):
+        """
+        Reads the last lightning strike's energy and distance with one burst read of
+        registers 0x04-0x07 (instead of the four single reads of get_energy() + get_distance())
+
+        :return: (tuple) (distance, energy) as returned by get_distance() and get_energy()
+        """
+        return self.decode_strike(self.read_bytes(0x04, 4))
+
+    def decode_strike(self, regs):
+        """
+        Decodes a strike's energy and distance from the values of registers 0x04-0x07
+
+        :param regs: (list) the values of registers 0x04, 0x05, 0x06 and 0x07
+        :return: (tuple) (distance, energy) as returned by get_strike()
+        """
+        energy = ((regs[2] & 0x1F) << 16) | (regs[1] << 8) | regs[0]
+        dist = regs[3] & 0b00111111
+        if dist == 0b111111:
+            return (None, energy)
+        return (dist, energy)
+
     # ------------- 8.9.4- INTERRUPTION MANAGEMENT ------------ #
 
-    def get_interrupt(self):
+    def get_interrupt(self, settle=True):
         """
         Checks the reason of the interruption (INT). To know what it is, use the constants:
             INT_NH: noise level too high
@@ -305,10 +379,30 @@ class AS3935_Base:
 
         It sleeps for 2 ms before retrieving the value, as specified at the datasheet.
 
+        :param settle: (bool, optional) False if the caller already waited 2 ms since INT went high. Default = True
         :return: (int) the interruption reason
         """
-        time.sleep(0.002)
-        return self.read_byte(0x03) & 0x0F
+        if settle and self.INT_SETTLE_SECONDS > 0:
+            time.sleep(self.INT_SETTLE_SECONDS)
+        value = self.read_byte(0x03)
+        self.reg03_shadow = value & 0b11100000
+        return value & 0x0F
+
+    def get_interrupt_registers(self, settle=True):
+        """
+        Reads registers 0x03-0x08 with one burst read: the interruption reason (the low 4 bits
+        of the first) and, for a lightning interrupt, the strike (decode_strike() of the next four)
+
+        It sleeps for 2 ms before retrieving the values, as get_interrupt() does.
+
+        :param settle: (bool, optional) False if the caller already waited 2 ms since INT went high. Default = True
+        :return: (list) the values of registers 0x03 to 0x08
+        """
+        if settle and self.INT_SETTLE_SECONDS > 0:
+            time.sleep(self.INT_SETTLE_SECONDS)
+        regs = self.read_bytes(0x03, 6)
+        self.reg03_shadow = regs[0] & 0b11100000
+        return regs
 
     def set_mask_disturber(self, mask_dist):
         """
@@ -317,9 +411,9 @@ class AS3935_Base:
         :param mask_dist: (bool) whether disturbers should be masked
         """
         if mask_dist:
-            self.write_byte(0x03, self.read_byte(0x03) | 0b100000)
+            self._write_reg03(self._reg03() | 0b100000)
         else:
-            self.write_byte(0x03, self.read_byte(0x03) & 0b11011111)
+            self._write_reg03(self._reg03() & 0b11011111)
 
     def get_mask_disturber(self):
         """
@@ -327,7 +421,18 @@ class AS3935_Base:
 
         :return: (bool) whether disturbers are currently masked
         """
-        return self.read_byte(0x03) & 0b100000 == 0b100000
+        return self._reg03() & 0b100000 == 0b100000
+
+    def _reg03(self):
+        # the writable bits of register 0x03, read from the chip only when we don't know them
+        if self.reg03_shadow is None:
+            self.reg03_shadow = self.read_byte(0x03) & 0b11100000
+        return self.reg03_shadow
+
+    def _write_reg03(self, value):
+        value = value & 0b11100000
+        self.write_byte(0x03, value)
+        self.reg03_shadow = value
 
     def get_min_strikes(self):
         """
@@ -504,8 +609,8 @@ class AS3935_Base:
         values = {16: 0b0, 32: 0b01000000, 64: 0b10000000, 128: 0b11000000}
         if divisor not in values:
             raise ValueError("Accepted values: 16, 32, 64, 128")
-        new_lco_fdiv = (self.read_byte(0x03) & 0b00111111) | values[divisor]
-        self.write_byte(0x03, new_lco_fdiv)
+        new_lco_fdiv = (self._reg03() & 0b00111111) | values[divisor]
+        self._write_reg03(new_lco_fdiv)
 
     # ------------- 8.11- CLOCK GENERATION ------------ #
 
@@ -594,6 +699,19 @@ class AS3935_I2C(AS3935_Base):
         self.print_line('---::  addr({}):   ({:08b})'.format(hex(address), value), debug=True)
         return value
 
+    def read_bytes(self, address, count=1):
+        """
+        Returns the values of count bytes starting at address (one I2C transaction).
+
+        :param address: (int) the address to read from
+        :param count: (int) the number of bytes to be read
+        :return: (list) the values read
+        """
+        (bytesCount, bytesRead) = self.pi.i2c_read_i2c_block_data(self.device, address, count)
+        if not bytesCount == count:
+            raise AssertionError('Failed to read {} byte(s) from I2C device (got {})!'.format(count, bytesCount))
+        return list(bytesRead)
+
     def write_byte(self, address, value):
         """
         Writes value at address. Raises ValueError if the value is not correct.
@@ -716,3 +834,101 @@ class AS3935_SPI(AS3935_Base):
 
     def print_line(self, text, className='AS3935_SPI', error=False, warning=False, info=False, verbose=False, debug=False):
         super().print_line(text, className=className, error=error, warning=warning, info=info, verbose=verbose, debug=debug)
+
+"""
+    This class overrides the base replaying recorded interrupts instead of talking to a chip
+"""
+from collections import deque
+
+class AS3935_Replay(AS3935_Base):
+    INT_SETTLE_SECONDS = 0  # as fast as we can
+    # register values after a reset (PRESET_DEFAULT) of a real chip
+    DEFAULT_REGISTERS = { 0x00: 0b00100100, 0x01: 0b00100010, 0x02: 0b11000010 }
+
+    def __init__(self):
+        """
+        Emulate the registers of an AS3935 (no GPIO, no bus). Each interrupt we are given to
+        replay is latched into the read-only registers (0x03 INT, 0x04-0x07) by the read of
+        register 0x03 which handles it, just as reading it clears the interrupt on a real chip.
+        Writes are kept so settings read back as set.
+        """
+        self.address = None
+        self.bus = None
+        self.irq = None
+        self.pi = None
+        self.device = None
+        self.debug = False
+        self.reg03_shadow = None
+        self.registers = bytearray(0x40)
+        self.pending = deque()  # interrupts raised but not yet read
+        self.reset_registers()
+
+    def reset_registers(self):
+        self.registers[:] = bytes(0x40)
+        for (address, value) in self.DEFAULT_REGISTERS.items():
+            self.registers[address] = value
+
+    def raise_interrupt(self, registers):
+        """
+        Queue a recorded interrupt: the next read of register 0x03 returns it
+
+        :param registers: (list) the recorded values of registers 0x03-0x08
+        """
+        self.pending.append(registers)
+
+    def _latch_interrupt(self):
+        registers = self.pending.popleft()
+        # only the read-only bits come from the recording: INT and the strike's energy and distance
+        self.registers[0x03] = (self.registers[0x03] & 0xF0) | (registers[0] & 0x0F)
+        self.registers[0x04:0x08] = bytes(registers[1:5])
+
+    def _reg03(self):
+        # (never read our register 0x03 for this, that would take a pending interrupt)
+        return self.registers[0x03] & 0b11100000
+
+    def close(self):
+        self.pending.clear()
+
+    def configure_irq_pin(self):
+        pass
+
+    def irq_pending(self):
+        return len(self.pending) > 0
+
+    def add_irq_callback(self, callback):
+        raise AssertionError('AS3935_Replay has no IRQ pin, replayed interrupts must be queued by our caller')
+
+    def microseconds_since_tick(self, tick):
+        return 0
+
+    # ------ CROSS FUNCTIONS ------ #
+
+    def read_byte(self, address):
+        if address == 0x03 and self.pending:
+            self._latch_interrupt()
+        value = self.registers[address]
+        if address == 0x03:
+            self.registers[0x03] = value & 0xF0    # read clears INT
+        return value
+
+    def read_bytes(self, address, count=1):
+        if address <= 0x03 < address + count and self.pending:
+            self._latch_interrupt()
+        values = list(self.registers[address:address + count])
+        if address <= 0x03 < address + count:
+            self.registers[0x03] &= 0xF0
+        return values
+
+    def write_byte(self, address, value):
+        if not 0 <= value <= 255:
+            raise ValueError("The value should be between 0x00 and 0xFF")
+        self.print_line('---::  addr({}) <= ({:08b})'.format(hex(address), value), debug=True)
+        if address == 0x3C and value == 0x96:
+            self.reset_registers()
+        elif address == 0x03:
+            self.registers[0x03] = (value & 0xF0) | (self.registers[0x03] & 0x0F)
+        elif address < 0x3C:
+            self.registers[address] = value
+
+    def print_line(self, text, className='AS3935_Replay', error=False, warning=False, info=False, verbose=False, debug=False):
+        super().print_line(text, className=className, error=error, warning=warning, info=info, verbose=verbose, debug=debug)
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import RPi.GPIO as GPIO
 import _thread
-from datetime import datetime
+import asyncio
 from tzlocal import get_localzone
 
 import threading
@@ -16,16 +15,34 @@ import sys
 import re
 import json
 import os.path
+import resource
 import argparse
-from time import time, sleep, localtime, strftime
-from collections import OrderedDict
+from time import time, sleep, localtime, strftime, perf_counter_ns
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from colorama import init as colorama_init
 from colorama import Fore, Back, Style
-from configparser import ConfigParser
+from configparser import ConfigParser, Error as ConfigParserError
 from unidecode import unidecode
 import paho.mqtt.client as mqtt
 import sdnotify
-from signal import signal, SIGPIPE, SIG_DFL
+from signal import signal, SIGPIPE, SIG_DFL, SIGUSR1, SIGHUP
+from lightning.outbox import MqttOutbox
+from lightning.metrics import MetricsRegistry, MetricsServer
+from lightning.trace import InterruptTracer, STAGE_SETTLE, STAGE_REASON, STAGE_READ, STAGE_SERIALIZE, STAGE_ENQUEUE, STAGE_ACK
+from lightning.events import EventQueue, DetectorEvent, SOURCE_EDGE, SOURCE_POLL, SOURCE_TIMER, SOURCE_TEST, SOURCE_COMMAND, SOURCE_NAMES
+from lightning.accumulator import StormAccumulator, REPORT_DETECT, REPORT_CURRENT_RINGS, REPORT_PAST_RINGS, REPORT_WINDOW_RINGS, REPORT_HISTOGRAM, REPORT_CELLS, CELL_COUNT_KEY, windowRingsKey, RING_MODE_WINDOW, RING_MODE_DECAY
+from lightning.rollup import RollupStore
+from lightning.clock import WallClock, NS_PER_SECOND
+from lightning.distances import detector_distance
+from lightning.journal import StrikeJournal
+from lightning.history import HistoryQuery, request_from_query_string
+from lightning.aiomqtt import MqttSocketAdapter, supports_socket_callbacks
+from lightning.connect import Backoff, BrokerConnector
+from lightning.noisefloor import NoiseFloorController, DIRECTION_RAISE, DIRECTION_LOWER
+from lightning.disturbers import DisturberShedder
+from lightning.rates import StrikeRates, rateKey
+from lightning.registers import RegisterRecorder, read_header, read_records, RECORD_SOURCE_EDGE, RECORD_SOURCE_POLL
 
 signal(SIGPIPE,SIG_DFL)
 
@@ -42,6 +59,9 @@ if False:
     # will be caught by python 2.7 to be illegal syntax
     print_line('Sorry, this script requires a python3 runtime environment.', file=sys.stderr)
 
+# when we started: our startup milestones (armed, connected) are timed from here
+startup_ns = perf_counter_ns()
+
 # Argparse
 opt_debug = False
 opt_verbose = False
@@ -88,6 +108,8 @@ parser = argparse.ArgumentParser(description=script_info, epilog='For further de
 parser.add_argument("-v", "--verbose", help="increase output (v)erbosity", action="store_true")
 parser.add_argument("-d", "--debug", help="show (d)ebug output", action="store_true")
 parser.add_argument("-t", '--test_filename', help='load detections from (t)est filename instead of using sensor', default='')
+parser.add_argument("-p", '--replay_filename', help='re(p)lay interrupts recorded with --record_filename instead of using sensor', default='')
+parser.add_argument("-r", '--record_filename', help='(r)ecord the registers of every interrupt to this file', default='')
 parser.add_argument("-s", '--test_scale', help='adjust test (s)peed to run a ?x [Default 1x]', default='1')
 parser.add_argument("-a", "--calc_tuning_cap", help="run routine to calclulate tuning c(a)p value for your board", action="store_true")
 parser.add_argument("-c", '--config_dir', help='set directory where (c)onfig.ini is located', default=sys.path[0])
@@ -95,9 +117,12 @@ parse_args = parser.parse_args()
 
 config_dir = parse_args.config_dir
 test_filename = parse_args.test_filename
+replay_filename = parse_args.replay_filename
+record_filename = parse_args.record_filename
 opt_debug = parse_args.debug
 opt_verbose = parse_args.verbose
-opt_testing = len(test_filename) > 0
+opt_replaying = len(replay_filename) > 0
+opt_testing = len(test_filename) > 0 or opt_replaying
 opt_scale = int(parse_args.test_scale)
 opt_calc_tuning_cap = parse_args.calc_tuning_cap
 
@@ -107,7 +132,9 @@ if opt_verbose:
     print_line('Verbose enabled', info=True)
 if opt_debug:
     print_line('Debug enabled', debug=True)
-if opt_testing:
+if opt_replaying:
+    print_line('* Mode REPLAYING "{}"... as fast as we can'.format(replay_filename))
+elif opt_testing:
     print_line('* Mode TESTING... @ {}x speed'.format(opt_scale))
 if opt_calc_tuning_cap:
     print_line('* Mode: Calculate Tuning Cap value and exit')
@@ -120,7 +147,9 @@ if opt_calc_tuning_cap:
 # Eclipse Paho callbacks - http://www.eclipse.org/paho/clients/python/docs/#callbacks
 mqtt_client_connected = False
 print_line('* init mqtt_client_connected=[{}]'.format(mqtt_client_connected), debug=True)
-mqtt_client_should_attempt_reconnect = True
+mqtt_command_topic = None   # subscribed to (on each connect) once we are ready for commands
+discoveryReady = False      # our discovery entries are published (on each connect) once defined
+settingsReady = False       # our settings are republished (on each connect) once first published
 
 # Eclipse Paho callbacks - http://www.eclipse.org/paho/clients/python/docs/#callbacks
 def on_connect(client, userdata, flags, rc):
@@ -130,17 +159,56 @@ def on_connect(client, userdata, flags, rc):
         print_line('')  # blank line?!
         mqtt_client_connected = True
         print_line('on_connect() mqtt_client_connected=[{}]'.format(mqtt_client_connected), debug=True)
+        mqttBackoff.reset()
+        noteStartupMilestone(STARTUP_CONNECTED)
+        client.publish(lwt_topic, payload=lwt_online_val, retain=False)
+        if discoveryReady:
+            publishAllDiscovery()
+        if settingsReady:
+            # (read from our detector, so by our event worker)
+            queueDetectorEvent(SOURCE_COMMAND, SETTINGS_COMMAND)
+        # send anything we held while the broker was away
+        startOutboxDrain()
+        if mqtt_command_topic is not None:
+            client.subscribe(mqtt_command_topic, 1)
     else:
         print_line('Connection error with result code {} - {}'.format(str(rc), mqtt.connack_string(rc)), error=True)
         print_line('MQTT Connection error with result code {} - {}'.format(str(rc), mqtt.connack_string(rc)), error=True, sd_notify=True)
         mqtt_client_connected = False   # technically NOT useful but readying possible new shape...
         print_line('on_connect() mqtt_client_connected=[{}]'.format(mqtt_client_connected), debug=True)
-        #kill main thread
-        os._exit(1)
+        if rc != mqtt.CONNACK_REFUSED_SERVER_UNAVAILABLE:
+            # our settings are wrong, retrying won't help... kill main thread
+            os._exit(1)
+        # broker is (re)starting, paho keeps retrying while our outbox holds our detections
+
+def on_disconnect(client, userdata, rc):
+    global mqtt_client_connected
+    mqtt_client_connected = False
+    if rc != 0:
+        print_line('MQTT connection lost ({}), holding detections in outbox until reconnect'.format(mqtt.error_string(rc)), warning=True, sd_notify=True)
+    print_line('on_disconnect() mqtt_client_connected=[{}]'.format(mqtt_client_connected), debug=True)
 
 def on_publish(client, userdata, mid):
     #print_line('Data successfully published.')
-    pass
+    publishStart = publishStartTimes.pop(mid, None)
+    if publishStart is not None:
+        (publishStartNs, trace) = publishStart
+        ackNs = perf_counter_ns()
+        metricPublishAck.observe_ns(ackNs - publishStartNs)
+        if trace is not None:
+            trace.mark(STAGE_ACK, ackNs)
+            tracer.release(trace)
+
+def on_message(client, userdata, message):
+    try:
+        command = json.loads(message.payload.decode('utf-8'))
+    except ValueError:
+        print_line('Ignoring unreadable command "{}" on "{}"'.format(message.payload, message.topic), warning=True)
+        return
+    if not isinstance(command, dict):
+        print_line('Ignoring unknown command "{}" on "{}"'.format(command, message.topic), warning=True)
+        return
+    handleMqttCommand(command)
 
 def on_log(client, userdata, level, buf):
     #print_line('* Data successfully published.')
@@ -148,11 +216,16 @@ def on_log(client, userdata, level, buf):
 
 
 # Load configuration file
-config = ConfigParser(delimiters=('=', ), inline_comment_prefixes=('#'))
-config.optionxform = str
-try:
+def readConfig():
+    # (re)read our configuration file
+    newConfig = ConfigParser(delimiters=('=', ), inline_comment_prefixes=('#'))
+    newConfig.optionxform = str
     with open(os.path.join(config_dir, 'config.ini')) as config_file:
-        config.read_file(config_file)
+        newConfig.read_file(config_file)
+    return newConfig
+
+try:
+    config = readConfig()
 except IOError:
     print_line('No configuration file "config.ini"', error=True, sd_notify=True)
     sys.exit(1)
@@ -165,39 +238,185 @@ base_topic = config['MQTT'].get('base_topic', default_base_topic).lower()
 default_sensor_name = 'lightningdetector'
 sensor_name = config['MQTT'].get('sensor_name', default_sensor_name).lower()
 
-# Broker connection-failure recovery
-#  Rety connection attempts
+# Broker connection-failure recovery (we connect in the background, detecting meanwhile)
+#  Give up after retrying a failed connection attempt this many times (-1 = never give up)
+RETRY_FOREVER = -1
 default_retry_count = '5'
 mqtt_client_retry_count = int(config['MQTT'].get('retry_count', default_retry_count))
 
-#  Retry after waiting N seconds
+#  Retry after waiting N seconds, doubling (with jitter) up to retry_wait_in_seconds
+default_retry_initial_wait_in_seconds = '1'
+mqtt_client_retry_initial_delay_in_seconds = float(config['MQTT'].get('retry_initial_wait_in_seconds', default_retry_initial_wait_in_seconds))
 default_retry_wait_in_seconds = '30'
 mqtt_client_retry_delay_in_seconds = int(config['MQTT'].get('retry_wait_in_seconds', default_retry_wait_in_seconds))
 
+# Store-and-forward of our detections while the broker is unreachable
+default_outbox_file = os.path.join(config_dir, 'mqtt-outbox.sqlite')
+outbox_file = config['MQTT'].get('outbox_file', default_outbox_file)
+
+default_outbox_max_messages = 2000
+outbox_max_messages = int(config['MQTT'].get('outbox_max_messages', default_outbox_max_messages))
+
+default_outbox_drain_per_second = 10
+outbox_drain_per_second = int(config['MQTT'].get('outbox_drain_per_second', default_outbox_drain_per_second))
+
 # Read/clear the detector data every 10s in case we missed an interrupt (interrupts happening too fast ?)
 sleep_period = config['Daemon'].getint('period', 10)
+#  ...but check more often while a storm is active
+default_sleep_period_in_storm = 1
+sleep_period_in_storm = config['Daemon'].getint('period_in_storm', default_sleep_period_in_storm)
+
+# Optional OpenMetrics (Prometheus) endpoint, 0 = disabled
+default_metrics_port = 0
+metrics_port = config['Daemon'].getint('metrics_port', default_metrics_port)
+default_metrics_address = '127.0.0.1'
+metrics_address = config['Daemon'].get('metrics_address', default_metrics_address)
+
+# Optional per-stage latency tracing of our interrupt handling
+trace_enabled = config['Daemon'].getboolean('trace', False)
+default_trace_buffer_size = 1024
+trace_buffer_size = config['Daemon'].getint('trace_buffer_size', default_trace_buffer_size)
+trace_file = config['Daemon'].get('trace_file', '')
+default_trace_dump_file = '/tmp/lightning-trace.csv'
+trace_dump_file = config['Daemon'].get('trace_dump_file', default_trace_dump_file)
+
+# Interrupt events waiting for our worker before new ones are dropped
+default_event_queue_size = 1024
+event_queue_size = config['Daemon'].getint('event_queue_size', default_event_queue_size)
+
+# Run on threads (paho network thread, event worker, timer threads) or on one asyncio event loop
+val_runtime_threads = 'threads'
+val_runtime_asyncio = 'asyncio'
+default_runtime = val_runtime_threads
+daemon_runtime = config['Daemon'].get('runtime', default_runtime).lower()
 
 
 # Script Accumulation and reporting behavior
 min_period_in_minutes = 2
 max_period_in_minutes = 10
 default_period_in_minutes = 5   # [2-10]
-period_in_minutes = int(config['Behavior'].get('period_in_minutes', default_period_in_minutes))
 
 min_number_of_rings = 3
 max_number_of_rings = 7
 default_number_of_rings = 5 # [3-7]
-number_of_rings = int(config['Behavior'].get('number_of_rings', default_number_of_rings))
 
 min_end_storm_after_minutes = 10
 max_end_storm_after_minutes = 60
 default_end_storm_after_minutes = 30   # [10-60]
-end_storm_after_minutes = int(config['Behavior'].get('end_storm_after_minutes', default_end_storm_after_minutes))
 
 val_distance_as_km = 'km'
 val_distance_as_mi = 'mi'
 default_distance_as = val_distance_as_km  # [km|mi]
-distance_as = config['Behavior'].get('distance_as', default_distance_as)
+
+# ...and the settings of our detector chip
+min_tuning_capacitor = 0
+max_tuning_capacitor = 15
+default_tuning_capacitor = '1'
+
+default_detector_afr_gain_indoor = True
+
+# noise_floor (0-7)
+min_detector_noise_floor = 0
+max_detector_noise_floor = 7
+default_detector_noise_floor = 1
+
+# number of strikes (def: 5, value 1,5,9,16), then are fired normally.
+val_detector_min_strikes = (1, 5, 9, 16)
+default_detector_min_strikes = 5
+
+# These can be changed while we run (SIGHUP, or {"reload": true} on our command topic, re-reads
+#  them) so they are kept together in one immutable Settings which a reload replaces as a whole
+Settings = namedtuple('Settings', 'period_in_minutes number_of_rings end_storm_after_minutes distance_as '
+                                  'tuning_capacitor detector_afr_gain_indoor detector_noise_floor detector_min_strikes')
+
+def loadSettings(config):
+    # read and check our reloadable settings, raises ValueError describing the first bad one
+    period_in_minutes = int(config['Behavior'].get('period_in_minutes', default_period_in_minutes))
+    number_of_rings = int(config['Behavior'].get('number_of_rings', default_number_of_rings))
+    end_storm_after_minutes = int(config['Behavior'].get('end_storm_after_minutes', default_end_storm_after_minutes))
+    distance_as = config['Behavior'].get('distance_as', default_distance_as)
+
+    config_tuning_capacitor = config['Sensor'].get('tuning_capacitor', default_tuning_capacitor)
+    if config_tuning_capacitor.startswith('0x'):
+        tuning_capacitor = int(config_tuning_capacitor,16)
+    else:
+        tuning_capacitor = int(config_tuning_capacitor)
+    detector_afr_gain_indoor = config['Sensor'].getboolean('detector_afr_gain_indoor', default_detector_afr_gain_indoor)
+    detector_noise_floor = int(config['Sensor'].get('detector_noise_floor', default_detector_noise_floor))
+    detector_min_strikes = int(config['Sensor'].get('detector_min_strikes', default_detector_min_strikes))
+
+    if (tuning_capacitor < min_tuning_capacitor) or (tuning_capacitor > max_tuning_capacitor):
+        raise ValueError('Invalid "tuning_capacitor" value found in configuration file: "config.ini"! Must be [{} - {}]'.format(min_tuning_capacitor, max_tuning_capacitor))
+    if (detector_noise_floor < min_detector_noise_floor) or (detector_noise_floor > max_detector_noise_floor):
+        raise ValueError('Invalid "detector_noise_floor" value found in configuration file: "config.ini"! Must be [{} - {}]'.format(min_detector_noise_floor, max_detector_noise_floor))
+    if detector_min_strikes not in val_detector_min_strikes:
+        raise ValueError('Invalid "detector_min_strikes" value found in configuration file: "config.ini"! Must be one of {}'.format(val_detector_min_strikes))
+    if (period_in_minutes < min_period_in_minutes) or (period_in_minutes > max_period_in_minutes):
+        raise ValueError('Invalid "period_in_minutes" found in configuration file: "config.ini"! Must be [{}-{}]'.format(min_period_in_minutes, max_period_in_minutes))
+    if (end_storm_after_minutes < min_end_storm_after_minutes) or (end_storm_after_minutes > max_end_storm_after_minutes):
+        raise ValueError('Invalid "end_storm_after_minutes" found in configuration file: "config.ini"! Must be [{}-{}]'.format(min_end_storm_after_minutes, max_end_storm_after_minutes))
+    if (number_of_rings < min_number_of_rings) or (number_of_rings > max_number_of_rings):
+        raise ValueError('Invalid "number_of_rings" found in configuration file: "config.ini"! Must be [{}-{}]'.format(min_number_of_rings, max_number_of_rings))
+    if (distance_as != val_distance_as_km) and (distance_as != val_distance_as_mi):
+        raise ValueError('Invalid "distance_as" found in configuration file: "config.ini"! Must be ["{}" or "{}"]'.format(val_distance_as_km, val_distance_as_mi))
+
+    return Settings(period_in_minutes, number_of_rings, end_storm_after_minutes, distance_as,
+                    tuning_capacitor, detector_afr_gain_indoor, detector_noise_floor, detector_min_strikes)
+
+# also report rings over these window lengths (in minutes, e.g. "2, 10, 60") each to its own topic
+default_extra_windows = ''
+extra_windows = config['Behavior'].get('extra_windows', default_extra_windows)
+
+# add median, P90 and max energy to each ring of our crings and prings
+default_energy_quantiles = False
+energy_quantiles = config['Behavior'].getboolean('energy_quantiles', default_energy_quantiles)
+
+# count detections by distance value x energy (window and storm), published on request and at storm end
+default_energy_histogram = False
+energy_histogram = config['Behavior'].getboolean('energy_histogram', default_energy_histogram)
+
+# split each storm into cells by distance (each cell's strikes, lifetime and trend published with each crings)
+default_storm_cells = False
+storm_cells = config['Behavior'].getboolean('storm_cells', default_storm_cells)
+default_cell_max = 4
+cell_max = config['Behavior'].getint('cell_max', default_cell_max)
+default_cell_gate_km = 7
+cell_gate_km = config['Behavior'].getint('cell_gate_km', default_cell_gate_km)
+default_cell_end_after_minutes = 10
+cell_end_after_minutes = config['Behavior'].getint('cell_end_after_minutes', default_cell_end_after_minutes)
+
+# publish strikes per minute (last 1, 5 and 15 minutes) and a lightning jump test this often (0 = never)
+default_rates_interval_in_seconds = 60
+rates_interval_in_seconds = config['Behavior'].getint('rates_interval_in_seconds', default_rates_interval_in_seconds)
+# ...a jump only counts while at least this many strikes a minute
+default_rates_jump_min_per_minute = 10
+rates_jump_min_per_minute = config['Behavior'].getint('rates_jump_min_per_minute', default_rates_jump_min_per_minute)
+
+# our rings hold the strikes of the last period ('window') or exponentially decaying sums ('decay')
+default_ring_mode = RING_MODE_WINDOW
+ring_mode = config['Behavior'].get('ring_mode', default_ring_mode).lower()
+default_decay_half_life_in_seconds = 150
+decay_half_life_in_seconds = config['Behavior'].getint('decay_half_life_in_seconds', default_decay_half_life_in_seconds)
+
+# read and accumulate every strike (instead of only counting those within 3 seconds of the last)
+default_full_rate_capture = False
+full_rate_capture = config['Behavior'].getboolean('full_rate_capture', default_full_rate_capture)
+
+# full rate: least seconds between 'detect' reports, and strikes held between them
+default_detect_interval = 3
+detect_interval = config['Behavior'].getfloat('detect_interval', default_detect_interval)
+default_capture_buffer_size = 1024
+capture_buffer_size = config['Behavior'].getint('capture_buffer_size', default_capture_buffer_size)
+
+# long-term minute/hour/day aggregates per ring (fixed size file, '' to disable)
+default_rollup_file = os.path.join(config_dir, 'lightning-rollup.rrd')
+rollup_file = config['Behavior'].get('rollup_file', default_rollup_file)
+
+# every strike, for history queries (two files of up to journal_max_records * 16 bytes, '' to disable)
+default_journal_file = os.path.join(config_dir, 'lightning-journal.bin')
+journal_file = config['Behavior'].get('journal_file', default_journal_file)
+default_journal_max_records = 500000
+journal_max_records = config['Behavior'].getint('journal_max_records', default_journal_max_records)
 
 
 # GPIO pin used for interrupts
@@ -241,50 +460,111 @@ if config_spi_device.startswith('0x'):
 else:
     spi_device = int(config_spi_device)
 
-min_tuning_capacitor = 0
-max_tuning_capacitor = 15
-default_tuning_capacitor = '1'
-config_tuning_capacitor = config['Sensor'].get('tuning_capacitor', default_tuning_capacitor)
-if config_tuning_capacitor.startswith('0x'):
-    tuning_capacitor = int(config_tuning_capacitor,16)
-else:
-    tuning_capacitor = int(config_tuning_capacitor)
-
-default_detector_afr_gain_indoor = True
-detector_afr_gain_indoor = config['Sensor'].get('detector_afr_gain_indoor', default_detector_afr_gain_indoor)
-
-# noise_floor (0-7)
-default_detector_noise_floor = 1
-detector_noise_floor = int(config['Sensor'].get('detector_noise_floor', default_detector_noise_floor))
-
-# number of strikes (def: 5, value 1,5,9,16), then are fired normally.
-default_detector_min_strikes = 5
-detector_min_strikes = int(config['Sensor'].get('detector_min_strikes', default_detector_min_strikes))
+# Step the noise floor up while noise interrupts keep coming, back down (to detector_noise_floor) once quiet
+default_noise_floor_adaptive = True
+noise_floor_adaptive = config['Sensor'].getboolean('noise_floor_adaptive', default_noise_floor_adaptive)
+default_noise_floor_max = 7
+noise_floor_max = config['Sensor'].getint('noise_floor_max', default_noise_floor_max)
+default_noise_window_in_seconds = 60
+noise_window_in_seconds = config['Sensor'].getint('noise_window_in_seconds', default_noise_window_in_seconds)
+default_noise_raise_at = 2
+noise_raise_at = config['Sensor'].getint('noise_raise_at', default_noise_raise_at)
+default_noise_lower_after_minutes = 15
+noise_lower_after_minutes = config['Sensor'].getint('noise_lower_after_minutes', default_noise_lower_after_minutes)
+
+# Mask disturbers while they flood in, un-mask them again after a while (0 = never)
+default_disturber_window_in_seconds = 60
+disturber_window_in_seconds = config['Sensor'].getint('disturber_window_in_seconds', default_disturber_window_in_seconds)
+default_disturber_mask_at = 5
+disturber_mask_at = config['Sensor'].getint('disturber_mask_at', default_disturber_mask_at)
+default_disturber_unmask_after_minutes = 10
+disturber_unmask_after_minutes = config['Sensor'].getint('disturber_unmask_after_minutes', default_disturber_unmask_after_minutes)
 
 # Check configuration
 #
-if (tuning_capacitor < min_tuning_capacitor) or (tuning_capacitor > max_tuning_capacitor):
-    print_line('ERROR: Invalid "tuning_capacitor" value found in configuration file: "config.ini"! Must be [{} - {}] Fix and try again... Aborting'.format(min_tuning_capacitor, max_tuning_capacitor), error=True, sd_notify=True)
+try:
+    settings = loadSettings(config)
+except ValueError as e:
+    print_line('ERROR: {} Fix and try again... Aborting'.format(e), error=True, sd_notify=True)
     sys.exit(1)
 
 if (interface_type != val_interface_type_i2c) and (interface_type != val_interface_type_spi):
     print_line('ERROR: Invalid "sensor_attached" value found in configuration file: "config.ini"! Must be [{} or {}] Fix and try again... Aborting'.format(val_interface_type_i2c, val_interface_type_spi), error=True, sd_notify=True)
     sys.exit(1)
 
-if (period_in_minutes < min_period_in_minutes) or (period_in_minutes > max_period_in_minutes):
-    print_line('ERROR: Invalid "period_in_minutes" found in configuration file: "config.ini"! Must be [{}-{}] Fix and try again... Aborting'.format(min_period_in_minutes, max_period_in_minutes), error=True, sd_notify=True)
+if (sleep_period < 1) or (sleep_period_in_storm < 1):
+    print_line('ERROR: Invalid "period" or "period_in_storm" found in configuration file: "config.ini"! Must be 1 or more seconds. Fix and try again... Aborting', error=True, sd_notify=True)
+    sys.exit(1)
+
+min_extra_window_minutes = 1
+max_extra_window_minutes = 1440
+try:
+    extra_windows_minutes = list(int(minutes) for minutes in extra_windows.replace(',', ' ').split())
+except ValueError:
+    extra_windows_minutes = [0]
+for minutes in extra_windows_minutes:
+    if (minutes < min_extra_window_minutes) or (minutes > max_extra_window_minutes):
+        print_line('ERROR: Invalid "extra_windows" found in configuration file: "config.ini"! Must be a list of minutes [{}-{}] Fix and try again... Aborting'.format(min_extra_window_minutes, max_extra_window_minutes), error=True, sd_notify=True)
+        sys.exit(1)
+
+min_decay_half_life_in_seconds = 10
+max_decay_half_life_in_seconds = 3600
+if (ring_mode != RING_MODE_WINDOW) and (ring_mode != RING_MODE_DECAY):
+    print_line('ERROR: Invalid "ring_mode" found in configuration file: "config.ini"! Must be ["{}" or "{}"] Fix and try again... Aborting'.format(RING_MODE_WINDOW, RING_MODE_DECAY), error=True, sd_notify=True)
+    sys.exit(1)
+
+if (decay_half_life_in_seconds < min_decay_half_life_in_seconds) or (decay_half_life_in_seconds > max_decay_half_life_in_seconds):
+    print_line('ERROR: Invalid "decay_half_life_in_seconds" found in configuration file: "config.ini"! Must be [{}-{}] Fix and try again... Aborting'.format(min_decay_half_life_in_seconds, max_decay_half_life_in_seconds), error=True, sd_notify=True)
+    sys.exit(1)
+
+if ring_mode == RING_MODE_DECAY and energy_quantiles:
+    print_line('ERROR: "energy_quantiles" needs "ring_mode = {}" in configuration file: "config.ini"! Fix and try again... Aborting'.format(RING_MODE_WINDOW), error=True, sd_notify=True)
+    sys.exit(1)
+
+min_cell_max = 1
+max_cell_max = 8
+if (cell_max < min_cell_max) or (cell_max > max_cell_max) or (cell_gate_km < 1) or (cell_end_after_minutes < 1):
+    print_line('ERROR: Invalid "cell_max" [{}-{}], "cell_gate_km" or "cell_end_after_minutes" (1 or more) found in configuration file: "config.ini"! Fix and try again... Aborting'.format(min_cell_max, max_cell_max), error=True, sd_notify=True)
+    sys.exit(1)
+
+if (rates_interval_in_seconds < 0) or (rates_jump_min_per_minute < 1):
+    print_line('ERROR: Invalid "rates_interval_in_seconds" or "rates_jump_min_per_minute" found in configuration file: "config.ini"! Must be 0 or more, 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
+    sys.exit(1)
+
+if journal_max_records < 1:
+    print_line('ERROR: Invalid "journal_max_records" found in configuration file: "config.ini"! Must be 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
+    sys.exit(1)
+
+if (detect_interval < 1) or (capture_buffer_size < 1):
+    print_line('ERROR: Invalid "detect_interval" or "capture_buffer_size" found in configuration file: "config.ini"! Must be 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
+    sys.exit(1)
+
+if (daemon_runtime != val_runtime_threads) and (daemon_runtime != val_runtime_asyncio):
+    print_line('ERROR: Invalid "runtime" found in configuration file: "config.ini"! Must be ["{}" or "{}"] Fix and try again... Aborting'.format(val_runtime_threads, val_runtime_asyncio), error=True, sd_notify=True)
+    sys.exit(1)
+
+if (noise_floor_max < min_detector_noise_floor) or (noise_floor_max > max_detector_noise_floor):
+    print_line('ERROR: Invalid "noise_floor_max" found in configuration file: "config.ini"! Must be [{} - {}] Fix and try again... Aborting'.format(min_detector_noise_floor, max_detector_noise_floor), error=True, sd_notify=True)
+    sys.exit(1)
+
+if (noise_window_in_seconds < 1) or (noise_raise_at < 1) or (noise_lower_after_minutes < 1):
+    print_line('ERROR: Invalid "noise_window_in_seconds", "noise_raise_at" or "noise_lower_after_minutes" found in configuration file: "config.ini"! Must be 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
+    sys.exit(1)
+
+if (disturber_window_in_seconds < 1) or (disturber_mask_at < 1) or (disturber_unmask_after_minutes < 0):
+    print_line('ERROR: Invalid "disturber_window_in_seconds", "disturber_mask_at" or "disturber_unmask_after_minutes" found in configuration file: "config.ini"! Must be 1 or more (0 or more for disturber_unmask_after_minutes). Fix and try again... Aborting', error=True, sd_notify=True)
     sys.exit(1)
 
-if (end_storm_after_minutes < min_end_storm_after_minutes) or (end_storm_after_minutes > max_end_storm_after_minutes):
-    print_line('ERROR: Invalid "end_storm_after_minutes" found in configuration file: "config.ini"! Must be [{}-{}] Fix and try again... Aborting'.format(min_end_storm_after_minutes, max_end_storm_after_minutes), error=True, sd_notify=True)
+if event_queue_size < 1:
+    print_line('ERROR: Invalid "event_queue_size" found in configuration file: "config.ini"! Must be 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
     sys.exit(1)
 
-if (number_of_rings < min_number_of_rings) or (number_of_rings > max_number_of_rings):
-    print_line('ERROR: Invalid "number_of_rings" found in configuration file: "config.ini"! Must be [{}-{}] Fix and try again... Aborting'.format(min_number_of_rings, max_number_of_rings), error=True, sd_notify=True)
+if (mqtt_client_retry_count < RETRY_FOREVER) or (mqtt_client_retry_initial_delay_in_seconds <= 0) or (mqtt_client_retry_delay_in_seconds < mqtt_client_retry_initial_delay_in_seconds):
+    print_line('ERROR: Invalid "retry_count", "retry_initial_wait_in_seconds" or "retry_wait_in_seconds" found in configuration file: "config.ini"! Must be -1 (never give up) or more, more than 0 and at least retry_initial_wait_in_seconds. Fix and try again... Aborting', error=True, sd_notify=True)
     sys.exit(1)
 
-if (distance_as != val_distance_as_km) and (distance_as != val_distance_as_mi):
-    print_line('ERROR: Invalid "distance_as" found in configuration file: "config.ini"! Must be ["{}" or "{}"] Fix and try again... Aborting'.format(val_distance_as_km, val_distance_as_mi), error=True, sd_notify=True)
+if (outbox_max_messages < 1) or (outbox_drain_per_second < 1):
+    print_line('ERROR: Invalid "outbox_max_messages" or "outbox_drain_per_second" found in configuration file: "config.ini"! Must be 1 or more. Fix and try again... Aborting', error=True, sd_notify=True)
     sys.exit(1)
 
 ### Ensure required values within sections of our config are present
@@ -300,6 +580,39 @@ sensor_using_spi = False
 if interface_type == 'SPI':
     sensor_using_spi = True
 
+# -----------------------------------------------------------------------------
+#  Our runtime: with runtime = asyncio everything below runs on one event loop
+#   (paho's socket, our timers, events and publishes) instead of on threads
+# -----------------------------------------------------------------------------
+
+eventLoop = None
+if daemon_runtime == val_runtime_asyncio:
+    eventLoop = asyncio.new_event_loop()
+    asyncio.set_event_loop(eventLoop)
+    print_line('* Running on an asyncio event loop', verbose=True)
+
+def startTimer(seconds, function):
+    # a one-shot timer, cancel() stops it (call from our loop when running on one)
+    if eventLoop is not None:
+        return eventLoop.call_later(seconds, function)
+    timer = threading.Timer(seconds, function)
+    timer.start()
+    return timer
+
+def runSoon(function, *args):
+    # get this off our caller's stack: on its own thread, or on our next loop pass
+    if eventLoop is not None:
+        eventLoop.call_soon_threadsafe(function, *args)
+    else:
+        _thread.start_new_thread(function, args)
+
+def runLoopFor(seconds):
+    # wait, letting our event loop (if any) run meanwhile
+    if eventLoop is not None:
+        eventLoop.run_until_complete(asyncio.sleep(seconds))
+    else:
+        sleep(seconds)
+
 # -----------------------------------------------------------------------------
 #  timer and timer funcs for ALIVE MQTT Notices handling
 # -----------------------------------------------------------------------------
@@ -308,19 +621,21 @@ ALIVE_TIMOUT_IN_SECONDS = 60
 
 def publishAliveStatus():
     print_line('- SEND: yes, still alive -', debug=True)
-    mqtt_client.publish(lwt_topic, payload=lwt_online_val, retain=False)
+    if mqtt_outbox is not None and mqtt_outbox.depth() > 0:
+        print_line('- outbox depth={}, oldest={:.0f} seconds, dropped={}'.format(mqtt_outbox.depth(), mqtt_outbox.oldest_age_seconds(), mqtt_outbox.dropped_count), debug=True)
+    if mqtt_client_connected:
+        mqtt_client.publish(lwt_topic, payload=lwt_online_val, retain=False)
 
 def aliveTimeoutHandler():
     print_line('- MQTT TIMER INTERRUPT -', debug=True)
-    _thread.start_new_thread(publishAliveStatus, ())
+    runSoon(publishAliveStatus)
     startAliveTimer()
 
 def startAliveTimer():
     global aliveTimer
     global aliveTimerRunningStatus
     stopAliveTimer()
-    aliveTimer = threading.Timer(ALIVE_TIMOUT_IN_SECONDS, aliveTimeoutHandler)
-    aliveTimer.start()
+    aliveTimer = startTimer(ALIVE_TIMOUT_IN_SECONDS, aliveTimeoutHandler)
     aliveTimerRunningStatus = True
     print_line('- started MQTT timer - every {} seconds'.format(ALIVE_TIMOUT_IN_SECONDS), debug=True)
 
@@ -341,6 +656,189 @@ aliveTimer = threading.Timer(ALIVE_TIMOUT_IN_SECONDS, aliveTimeoutHandler)
 aliveTimerRunningStatus = False
 
 
+# -----------------------------------------------------------------------------
+#  MQTT outbox (store-and-forward while broker is unreachable)
+# -----------------------------------------------------------------------------
+
+mqtt_outbox = None      # opened once our topics are known
+outboxDraining = False
+outboxLock = threading.Lock()
+
+def publishOrQueue(topic, payload, trace=None):
+    # publish now if we can, else hold it (in order) until the broker is back
+    global outboxDraining
+    with outboxLock:
+        if mqtt_outbox is not None and (not mqtt_client_connected or outboxDraining or mqtt_outbox.depth() > 0):
+            mqtt_outbox.put(topic, payload, 1, retain=False)
+            print_line('- queued for "{}" (outbox depth={})'.format(topic, mqtt_outbox.depth()), debug=True)
+            if trace is not None:
+                trace.mark(STAGE_ENQUEUE, perf_counter_ns())
+                tracer.release(trace)   # no ack is coming for this one
+            return
+    publishTracked(topic, payload, 1, retain=False, trace=trace)
+
+def drainOutboxMessage():
+    # send our oldest held message, returns False once there is nothing more we can send
+    if not mqtt_client_connected:
+        return False
+    with outboxLock:
+        pending = mqtt_outbox.peek(1)
+        if len(pending) == 0:
+            return False
+    (messageId, topic, payload, qos, retain) = pending[0]
+    publishInfo = publishTracked(topic, payload, qos, retain=retain)
+    if publishInfo.rc != mqtt.MQTT_ERR_SUCCESS:
+        return False   # lost the broker again, we'll resume on reconnect
+    mqtt_outbox.remove(messageId)
+    return True
+
+def drainStopped():
+    global outboxDraining
+    with outboxLock:
+        outboxDraining = False
+    print_line('- outbox drain stopped, depth={} dropped={}'.format(mqtt_outbox.depth(), mqtt_outbox.dropped_count), debug=True)
+
+def drainOutbox():
+    print_line('* Draining outbox: {} message(s), oldest {:.0f} seconds old'.format(mqtt_outbox.depth(), mqtt_outbox.oldest_age_seconds()), verbose=True)
+    drain_interval = 1.0 / outbox_drain_per_second
+    while drainOutboxMessage():
+        sleep(drain_interval)   # don't flood the broker after an outage
+    drainStopped()
+
+async def drainOutboxAsync():
+    print_line('* Draining outbox: {} message(s), oldest {:.0f} seconds old'.format(mqtt_outbox.depth(), mqtt_outbox.oldest_age_seconds()), verbose=True)
+    drain_interval = 1.0 / outbox_drain_per_second
+    while drainOutboxMessage():
+        await asyncio.sleep(drain_interval)
+    drainStopped()
+
+def startOutboxDrain():
+    global outboxDraining
+    if mqtt_outbox is None:
+        return
+    with outboxLock:
+        if outboxDraining or mqtt_outbox.depth() == 0:
+            return
+        outboxDraining = True
+    if eventLoop is not None:
+        eventLoop.create_task(drainOutboxAsync())
+        return
+    drainThread = threading.Thread(target=drainOutbox, name='outbox-drain', daemon=True)
+    drainThread.start()
+
+def openOutbox(filename, collapseTopics):
+    try:
+        outbox = MqttOutbox(filename, max_messages=outbox_max_messages, collapse_topics=collapseTopics)
+    except Exception as e:
+        print_line('WARNING: unable to open outbox "{}" ({}), queued detections will NOT survive a restart'.format(filename, e), warning=True)
+        outbox = MqttOutbox(':memory:', max_messages=outbox_max_messages, collapse_topics=collapseTopics)
+    print_line('* Outbox "{}" holds {} message(s)'.format(outbox.filename, outbox.depth()), verbose=True)
+    return outbox
+
+
+# -----------------------------------------------------------------------------
+#  Metrics: counters and latency histograms for our hot paths
+#   (only formatted when our endpoint is scraped)
+# -----------------------------------------------------------------------------
+
+metrics = MetricsRegistry('lightning_detector_')
+
+INTR_REASON_NAMES = { 0x00: 'none', 0x01: 'noise', 0x04: 'disturber', 0x08: 'lightning' }
+metricInterrupts = {}
+for reasonValue, reasonName in INTR_REASON_NAMES.items():
+    metricInterrupts[reasonValue] = metrics.counter('interrupts', 'Detector interrupts by reason', [('reason', reasonName)])
+metricInterruptsOther = metrics.counter('interrupts', 'Detector interrupts by reason', [('reason', 'other')])
+metricPeriodTimerInterrupts = metrics.counter('period_timer_interrupts', 'Period timer expirations')
+metricCoalescedStrikes = metrics.counter('coalesced_strikes', 'Strikes counted but not read as they followed another too closely')
+metricMissedEdges = metrics.counter('missed_edges', 'Pending interrupts found by the safety poll instead of by an edge callback')
+metricPolls = metrics.counter('safety_polls', 'Safety polls of the IRQ line')
+metricDisturberMaskChanges = {}
+metricDisturberMaskChanges[True] = metrics.counter('disturber_mask_changes', 'Disturber masking changes made by our disturber shedding', [('state', 'masked')])
+metricDisturberMaskChanges[False] = metrics.counter('disturber_mask_changes', 'Disturber masking changes made by our disturber shedding', [('state', 'unmasked')])
+metricNoiseFloorAdjustments = {}
+for noiseDirection in (DIRECTION_RAISE, DIRECTION_LOWER):
+    metricNoiseFloorAdjustments[noiseDirection] = metrics.counter('noise_floor_adjustments', 'Noise floor steps made by our noise floor controller', [('direction', noiseDirection)])
+
+metricEdgeToHandler = metrics.histogram('edge_to_handler_seconds', 'Latency from IRQ edge to start of interrupt handling')
+metricHandler = metrics.histogram('handler_seconds', 'Duration of interrupt handling')
+metricReasonRead = metrics.histogram('bus_read_seconds', 'Detector register read latency', [('registers', 'interrupt')])
+metricStrikeRead = metrics.histogram('bus_read_seconds', 'Detector register read latency', [('registers', 'distance_energy')])
+metricBinLoad = metrics.histogram('bin_load_seconds', 'Duration of loadDetectionsIntoBins()')
+metricSerialize = metrics.histogram('serialize_seconds', 'Duration of JSON serialization of a report')
+metricPublishAck = metrics.histogram('publish_ack_seconds', 'Latency from publish to broker acknowledgement')
+
+publishStartTimes = {}  # mid -> perf_counter_ns() at publish, removed on ack
+MAX_TRACKED_PUBLISHES = 1000
+
+metrics.gauge('publish_inflight', 'Publishes awaiting broker acknowledgement', function=lambda: len(publishStartTimes))
+metrics.gauge('outbox_depth', 'Messages held in the outbox', function=lambda: mqtt_outbox.depth() if mqtt_outbox is not None else 0)
+metrics.gauge('outbox_oldest_age_seconds', 'Age of the oldest message held in the outbox', function=lambda: mqtt_outbox.oldest_age_seconds() if mqtt_outbox is not None else 0)
+metrics.counter('outbox_dropped', 'Messages dropped as the outbox was full', function=lambda: mqtt_outbox.dropped_count if mqtt_outbox is not None else 0)
+STARTUP_ARMED = 'armed'           # our interrupt is armed: we are detecting
+STARTUP_CONNECTED = 'connected'   # first connection to our broker
+startupSeconds = OrderedDict()
+
+def noteStartupMilestone(milestone):
+    # record how long after startup we got here (first time only)
+    if milestone in startupSeconds:
+        return
+    startupSeconds[milestone] = (perf_counter_ns() - startup_ns) / NS_PER_SECOND
+    print_line('* Startup: {} after {:.2f} seconds'.format(milestone, startupSeconds[milestone]), verbose=True)
+
+for startupMilestone in (STARTUP_ARMED, STARTUP_CONNECTED):
+    metrics.gauge('startup_seconds', 'Seconds from startup to each milestone (0 = not yet reached)', [('milestone', startupMilestone)],
+                  function=lambda milestone=startupMilestone: startupSeconds.get(milestone, 0))
+
+metrics.gauge('noise_floor', 'Detector noise floor level [0-7]', function=lambda: noiseFloorControl.floor)
+metrics.gauge('noise_interrupts_in_window', 'Noise interrupts counted by our noise floor controller over its window', function=lambda: len(noiseFloorControl.noise_times))
+metrics.gauge('disturbers_masked', 'Whether disturbers are masked (1) or not (0)', function=lambda: 1 if disturberShedder.is_masked else 0)
+metrics.gauge('disturbers_in_window', 'Disturbers counted by our disturber shedding over its window', function=lambda: len(disturberShedder.disturber_times))
+metrics.gauge('threads', 'Number of active threads', function=threading.active_count)
+metrics.counter('context_switches', 'Context switches of this process', [('kind', 'voluntary')], function=lambda: resource.getrusage(resource.RUSAGE_SELF).ru_nvcsw)
+metrics.counter('context_switches', 'Context switches of this process', [('kind', 'involuntary')], function=lambda: resource.getrusage(resource.RUSAGE_SELF).ru_nivcsw)
+metrics.gauge('window_detections', 'Detections held in the sliding period window', function=lambda: len(accumulator.accumulatedDetections))
+metrics.gauge('event_queue_depth', 'Events waiting for our event worker', function=lambda: detectorEvents.depth())
+metrics.gauge('event_queue_high_water', 'Most events ever waiting for our event worker', function=lambda: detectorEvents.high_water)
+metrics.counter('events_processed', 'Events handled by our event worker', function=lambda: detectorEvents.processed_count)
+metrics.counter('events_dropped', 'Events dropped as our event queue was full', function=lambda: detectorEvents.dropped_count)
+
+def publishTracked(topic, payload, qos=1, retain=False, trace=None):
+    # publish, remembering when so on_publish() can measure the ack latency
+    if len(publishStartTimes) > MAX_TRACKED_PUBLISHES:
+        publishStartTimes.clear()   # acks that beat us to the table (or never came) would pile up
+    publishStartNs = perf_counter_ns()
+    publishInfo = mqtt_client.publish(topic, payload, qos, retain=retain)
+    if trace is not None:
+        trace.mark(STAGE_ENQUEUE, perf_counter_ns())
+    publishStartTimes[publishInfo.mid] = (publishStartNs, trace)
+    return publishInfo
+
+
+# -----------------------------------------------------------------------------
+#  Interrupt tracing: a perf_counter_ns() stamp for each stage of each interrupt
+#   (kill -USR1 {pid} dumps the buffered records as CSV to our trace_dump_file)
+# -----------------------------------------------------------------------------
+
+tracer = None
+if trace_enabled:
+    tracer = InterruptTracer(trace_buffer_size, trace_file)
+    print_line('* Tracing interrupts, {} records buffered{}'.format(trace_buffer_size, ', streaming to "{}"'.format(trace_file) if trace_file else ''), verbose=True)
+
+def dumpTraceHandler(signum, frame):
+    if tracer is None:
+        print_line('- trace dump requested but tracing is not enabled', warning=True)
+        return
+    # don't do file i/o from within the signal handler itself
+    _thread.start_new_thread(dumpTrace, ())
+
+def dumpTrace():
+    recordCount = tracer.dump_csv(trace_dump_file)
+    tracer.flush()
+    print_line('* Dumped {} trace records to "{}"'.format(recordCount, trace_dump_file))
+
+signal(SIGUSR1, dumpTraceHandler)
+
+
 # -----------------------------------------------------------------------------
 #  MQTT setup and startup
 # -----------------------------------------------------------------------------
@@ -354,9 +852,19 @@ if not disable_mqtt:
     print_line('* Connecting to MQTT broker ...', verbose=True)
 mqtt_client = mqtt.Client()
 mqtt_client.on_connect = on_connect
+mqtt_client.on_disconnect = on_disconnect
 mqtt_client.on_publish = on_publish
+mqtt_client.on_message = on_message
 mqtt_client.on_log = on_log
 
+# asyncio runtime: our loop watches paho's socket (instead of paho's network thread)
+mqttSocketAdapter = None
+if eventLoop is not None and not disable_mqtt:
+    if not supports_socket_callbacks(mqtt_client):
+        print_line('ERROR: "runtime = {}" needs paho-mqtt 1.5.1 or later. Upgrade (pip3 install -U paho-mqtt) or use "runtime = {}"... Aborting'.format(val_runtime_asyncio, val_runtime_threads), error=True, sd_notify=True)
+        sys.exit(1)
+    mqttSocketAdapter = MqttSocketAdapter(eventLoop, mqtt_client, print_line=print_line)
+
 mqtt_client.will_set(lwt_topic, payload=lwt_offline_val, retain=True)
 
 if config['MQTT'].getboolean('tls', False):
@@ -374,44 +882,39 @@ mqtt_username = os.environ.get("MQTT_USERNAME", config['MQTT'].get('username'))
 mqtt_password = os.environ.get("MQTT_PASSWORD", config['MQTT'].get('password', None))
 mqtt_hostname = os.environ.get('MQTT_HOSTNAME', config['MQTT'].get('hostname', 'localhost'))
 
-mqtt_starting_retry_count = mqtt_client_retry_count
+def mqttConnectFailed():
+    # (on our connector's thread)
+    print_line('MQTT failed connect after {} retries. Please check your settings in the configuration file "config.ini"'.format(mqtt_client_retry_count), error=True, sd_notify=True)
+    #kill main thread
+    os._exit(1)
+
+def mqttSocketOpened():
+    # (on our connector's thread) threads runtime: paho's own network thread takes it from here
+    if mqttSocketAdapter is None:
+        mqtt_client.loop_start()
+
+# connect in the background: our sensor is readied meanwhile and detections wait in our outbox
+mqttBackoff = Backoff(mqtt_client_retry_initial_delay_in_seconds, mqtt_client_retry_delay_in_seconds)
+#  (our first attempt and its retries, 0 attempts = never give up)
+mqttMaxAttempts = 0 if mqtt_client_retry_count == RETRY_FOREVER else mqtt_client_retry_count + 1
+mqttConnector = BrokerConnector(mqtt_client, mqttBackoff, mqttMaxAttempts, mqttSocketOpened, mqttConnectFailed, print_line)
+if mqttSocketAdapter is not None:
+    mqttSocketAdapter.connector = mqttConnector     # (also reconnects a lost connection)
+else:
+    # ...paho reconnects a lost connection itself (backing off, but without jitter)
+    mqtt_client.reconnect_delay_set(min_delay=max(1, int(mqtt_client_retry_initial_delay_in_seconds)), max_delay=mqtt_client_retry_delay_in_seconds)
 
 if not disable_mqtt:
     if mqtt_username:
         mqtt_client.username_pw_set(mqtt_username, mqtt_password)
 
-    while mqtt_client_retry_count >= 0:
-        try:
-            mqtt_client.connect(mqtt_hostname,
-                                port=int(os.environ.get('MQTT_PORT', config['MQTT'].get('port', '1883'))),
-                                keepalive=config['MQTT'].getint('keepalive', 60))
-        except:
-            if mqtt_client_should_attempt_reconnect:
-                if mqtt_client_retry_count > 0:
-                    print_line('MQTT connection error - broker @{} not responding. Retrying in {} seconds... (retry count = {})'.format(mqtt_hostname, mqtt_client_retry_delay_in_seconds, mqtt_client_retry_count), error=True, sd_notify=True)
-                    mqtt_client_retry_count -= 1
-                    sleep(mqtt_client_retry_delay_in_seconds) # some slack to establish the connection
-                else:
-                    print_line('MQTT failed connect after {} retries. Please check your settings in the configuration file "config.ini"'.format(mqtt_starting_retry_count), error=True, sd_notify=True)
-                    sys.exit(1)
-            else:
-                print_line('MQTT connection error, retries NOT enabled. Please check your settings in the configuration file "config.ini"', error=True, sd_notify=True)
-                sys.exit(1)
-
-        else:
-            break   # all good, now wait for connection to be established...
-
-    mqtt_client.publish(lwt_topic, payload=lwt_online_val, retain=False)
-    mqtt_client.loop_start()
-
-    while mqtt_client_connected == False: #wait in loop
-        print_line('* Wait on mqtt_client_connected=[{}]'.format(mqtt_client_connected), debug=True)
-        sleep(1.0) # some slack to establish the connection
+    mqtt_client.connect_async(mqtt_hostname,
+                              port=int(os.environ.get('MQTT_PORT', config['MQTT'].get('port', '1883'))),
+                              keepalive=config['MQTT'].getint('keepalive', 60))
+    mqttConnector.start()
 
     startAliveTimer()
 
-    sd_notifier.notify('READY=1')
-
 # -----------------------------------------------------------------------------
 #  Perform our MQTT Discovery Announcement...
 # -----------------------------------------------------------------------------
@@ -440,6 +943,8 @@ LD_COUNT = "count"   # 5b value: 1=overhead, 63(0x3f)=out-of-range, 2-62 dist in
 LD_CURRENT_RINGS = "crings"
 LD_PAST_RINGS = "prings"
 LD_SETTINGS = "settings"
+LD_RATES = "rates"
+LD_CELLS = "cells"
 
 # what device are we on?
 
@@ -451,12 +956,18 @@ print_line('- ip=[{}], mac[{}], interface=[{}], uniq-id=[{}]'.format(host_ipaddr
 detectorValues = OrderedDict([
     (LD_TIMESTAMP, dict(title="Last", device_class="timestamp", device_ident="Lightning Detector")),
     (LD_ENERGY, dict(title="Energy")),
-    (LD_DISTANCE, dict(title="Distance", unit=distance_as)),
+    (LD_DISTANCE, dict(title="Distance", unit=settings.distance_as)),
     (LD_COUNT, dict(title="Count")),
     (LD_SETTINGS, dict(title="Detector Settings", device_class="timestamp", no_title_prefix="yes", json_values="yes")),
     (LD_CURRENT_RINGS, dict(title="Current RingSet", device_class="timestamp", no_title_prefix="yes", json_values="yes")),
     (LD_PAST_RINGS, dict(title="Past RingSet", device_class="timestamp", no_title_prefix="yes", json_values="yes"))
 ])
+for minutes in extra_windows_minutes:
+    detectorValues[windowRingsKey(minutes)] = dict(title="{} Minute RingSet".format(minutes), device_class="timestamp", no_title_prefix="yes", json_values="yes")
+if storm_cells:
+    detectorValues[LD_CELLS] = dict(title="Storm Cells", state_class="measurement", no_title_prefix="yes", json_values="yes", value_key=CELL_COUNT_KEY)
+if rates_interval_in_seconds > 0:
+    detectorValues[LD_RATES] = dict(title="Strikes Per Minute", unit="strikes/min", state_class="measurement", no_title_prefix="yes", json_values="yes", value_key=rateKey(1))
 
 if not disable_mqtt:
     print_line('Announcing Lightning Detection device to MQTT broker for auto-discovery ...')
@@ -473,9 +984,21 @@ activity_topic_rel = '{}/status'.format('~')     # vs. LWT
 activity_topic = '{}/status'.format(base_topic)    # vs. LWT
 
 command_topic_rel = '~/set'
+command_topic = '{}/set'.format(base_topic)
+history_topic = '{}/history'.format(base_topic)    # answers to history requests
+histogram_topic = '{}/histogram'.format(base_topic)
+rates_topic = '{}/{}'.format(base_topic, LD_RATES)
+cells_topic = '{}/{}'.format(base_topic, LD_CELLS)
 
+# hold our detections on disk while the broker is away (a newer crings replaces any queued one)
+window_topics = dict((minutes, '{}/{}'.format(base_topic, windowRingsKey(minutes))) for minutes in extra_windows_minutes)
+mqtt_outbox = openOutbox(outbox_file, [crings_topic, settings_topic, rates_topic] + list(window_topics.values()))
+if not disable_mqtt and mqtt_client_connected:
+    startOutboxDrain()
 
-for [sensor, params] in detectorValues.items():
+
+# announce one of our values (again on reload if its settings changed)
+def publishDiscovery(sensor, params):
     discovery_topic = 'homeassistant/sensor/{}/{}/config'.format(sensor_name.lower(), sensor)
     payload = OrderedDict()
     if 'no_title_prefix' in params:
@@ -487,9 +1010,11 @@ for [sensor, params] in detectorValues.items():
         payload['dev_cla'] = params['device_class']
     if 'unit' in params:
         payload['unit_of_measurement'] = params['unit']
+    if 'state_class' in params:
+        payload['stat_cla'] = params['state_class']
     if 'json_values' in params:
         payload['stat_t'] = "~/{}".format(sensor)
-        payload['val_tpl'] = "{{{{ value_json.{}.timestamp }}}}".format(sensor)
+        payload['val_tpl'] = "{{{{ value_json.{}.{} }}}}".format(sensor, params.get('value_key', 'timestamp'))
     else:
         payload['stat_t'] = state_topic_rel
         payload['val_tpl'] = "{{{{ value_json.{} }}}}".format(sensor)
@@ -517,27 +1042,85 @@ for [sensor, params] in detectorValues.items():
     if not disable_mqtt:
         mqtt_client.publish(discovery_topic, json.dumps(payload), 1, retain=True)
 
+def publishAllDiscovery():
+    for [sensor, params] in detectorValues.items():
+        publishDiscovery(sensor, params)
+
+# we may have connected already (or will later, on_connect() then publishes them)
+discoveryReady = True
+if mqtt_client_connected:
+    runSoon(publishAllDiscovery)
+
 
 # -----------------------------------------------------------------------------
-#  timer and timer funcs for period handling
+#  Our event queue: every interrupt source (IRQ edge, poll, period timer, test
+#   replay) queues an event here and a single worker thread handles them in order
+#   (so only that worker ever touches our accumulator)
 # -----------------------------------------------------------------------------
 
 TIMER_INTERRUPT = (-1)
 TEST_INTERRUPT = (-2)
+POLL_INTERRUPT = (-3)   # safety poll found nothing pending (IRQ line low)
+RELOAD_COMMAND = (-4)   # re-read our configuration file
+REPLAY_INTERRUPT = (-5) # recorded interrupt, handled as a hardware one (by our replaying detector)
+HISTOGRAM_COMMAND = (-6)    # publish our distance x energy histograms
+SETTINGS_COMMAND = (-7)     # publish our settings (on each broker connect)
+
+# asyncio runtime: an interrupt's settle time and register reads block, so they are done on
+#  our bus thread while our loop carries on, and the event is then handled (in order) with them
+InterruptRead = namedtuple('InterruptRead', 'registers read_ns')   # registers 0x03-0x08, read time
+INTERRUPT_SETTLE_SECONDS = 0.003
+
+detectorEvents = EventQueue(event_queue_size)
+busExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='detector-bus') if eventLoop is not None else None
+drainTask = None
+
+def queueDetectorEvent(source, channel, edge_ns=0, data=None):
+    if not detectorEvents.put(DetectorEvent(source, channel, edge_ns, data)):
+        print_line('- event queue full, dropped {} event'.format(SOURCE_NAMES[source]), warning=True)
+    elif eventLoop is not None:
+        # asyncio runtime: our loop is our event worker (safe to call from any thread)
+        eventLoop.call_soon_threadsafe(drainDetectorEvents)
+
+def drainDetectorEvents():
+    # (on our loop) one drain at a time, so events stay in order while one waits for our bus thread
+    global drainTask
+    if drainTask is None or drainTask.done():
+        drainTask = eventLoop.create_task(detectorEvents.drain_async(handle_event, readInterruptOffLoop))
+
+def readInterruptOffLoop(event):
+    # (on our loop) hardware interrupts get read on our bus thread, everything else is handled as is
+    if event.source != SOURCE_EDGE or event.channel < 0:
+        return None
+    return eventLoop.run_in_executor(busExecutor, readInterrupt, event)
+
+def readInterrupt(event):
+    # (on our bus thread) let the detector settle then read its interrupt registers (the strike too)
+    #  (our wait covers the driver's 2 ms, so it does not wait again)
+    sleep(INTERRUPT_SETTLE_SECONDS)
+    readStartNs = perf_counter_ns()
+    try:
+        registers = detector.get_interrupt_registers(settle=False)
+    except Exception as e:
+        print_line('ERROR: failed reading interrupt registers on our bus thread: {}'.format(repr(e)), error=True)
+        return event    # handled as is: read again by our loop
+    return event._replace(data=InterruptRead(registers, perf_counter_ns() - readStartNs))
+
+# -----------------------------------------------------------------------------
+#  timer and timer funcs for period handling
+# -----------------------------------------------------------------------------
 
 def periodTimeoutHandler():
     print_line('- PERIOD TIMER INTERRUPT -', debug=True)
-    handle_interrupt(TIMER_INTERRUPT) # '0' means we have a timer interrupt!!!
-    startPeriodTimer()
+    queueDetectorEvent(SOURCE_TIMER, TIMER_INTERRUPT)
 
-def startPeriodTimer():
+def startPeriodTimer(seconds):
     global endPeriodTimer
     global periodTimeRunningStatus
     stopPeriodTimer()
-    endPeriodTimer = threading.Timer(period_in_minutes * 60.0, periodTimeoutHandler)
-    endPeriodTimer.start()
+    endPeriodTimer = startTimer(seconds, periodTimeoutHandler)
     periodTimeRunningStatus = True
-    print_line('- started PERIOD timer - every {} seconds'.format(period_in_minutes * 60.0), debug=True)
+    print_line('- started PERIOD timer - expires in {:.1f} seconds'.format(seconds), debug=True)
 
 def stopPeriodTimer():
     global endPeriodTimer
@@ -550,12 +1133,25 @@ def isPeriodTimerRunning():
     global periodTimeRunningStatus
     return periodTimeRunningStatus
 
+def syncPeriodTimer():
+    # (re)arm our timer to match the period (and extra windows) our accumulator is now tracking
+    global scheduledPeriodDeadline
+    periodDeadline = accumulator.timer_deadline()
+    if periodDeadline == scheduledPeriodDeadline:
+        return
+    scheduledPeriodDeadline = periodDeadline
+    if periodDeadline is None:
+        stopPeriodTimer()
+    else:
+        startPeriodTimer(max(0.0, (periodDeadline - perf_counter_ns()) / NS_PER_SECOND))
 
 
 # our TIMER
-endPeriodTimer = threading.Timer(period_in_minutes * 60.0, periodTimeoutHandler)
+endPeriodTimer = threading.Timer(settings.period_in_minutes * 60.0, periodTimeoutHandler)
 # our BOOL tracking state of TIMER
 periodTimeRunningStatus = False
+# the period end (or extra windows refresh) our TIMER is armed for
+scheduledPeriodDeadline = None
 
 # -----------------------------------------------------------------------------
 #  MQTT Transmit Helper Routines
@@ -566,44 +1162,66 @@ LDS_MIN_STRIKES = "min_strikes" # 1,5,9,16
 LDS_LOCATION = "afe_inside" # indoors, outdoors
 LDS_LCO_ON_INT = "disp_lco" # T/F where T means LCO is transmitting on Intr pin (can't detect when this is true)
 LDS_NOISE_FLOOR = "noise_floor" # [0-7]
+LDS_NOISE_CONTROL = "noise_floor_control"
+LDS_NOISE_ADAPTIVE = "adaptive" # T/F where F means we only ever raise it
+LDS_NOISE_MIN = "min_floor"
+LDS_NOISE_MAX = "max_floor"
+LDS_NOISE_RAISES = "raises"
+LDS_NOISE_LOWERS = "lowers"
+LDS_NOISE_ADJUSTMENTS = "adjustments" # most recent last
+LDS_ADJ_DIRECTION = "direction" # raise, lower
+LDS_ADJ_FROM = "from"
+LDS_ADJ_TO = "to"
+LDS_ADJ_NOISE_COUNT = "noise_interrupts" # in our window when we adjusted
+LDS_DIST_CONTROL = "disturber_control"
+LDS_DIST_MASKED = "masked" # T/F
+LDS_DIST_COUNT = "disturbers" # since startup
+LDS_DIST_MASKS = "masks"
+LDS_DIST_UNMASKS = "unmasks"
 
 LDS_CAT_SCRIPT = "script"
 LDS_PERIOD_IN_MINUTES = "period_minutes"
 LDS_END_STORM_IN_MINUTES = "end_minutes"
 LDS_NUMBER_RINGS = "number_rings"
 LDS_DISTANCE_UNITS = "distance_units"
+LDS_RING_MODE = "ring_mode" # window, decay
+LDS_HALF_LIFE = "half_life_seconds" # decay only
 
-def send_settings(minStrikes, isIndoors, isDispLco, noiseFloor):
+def send_settings(minStrikes, isIndoors, isDispLco, noiseFloor, noiseControl, disturberControl):
     topSettingsData = OrderedDict()
 
-    current_timestamp = datetime.now(local_tz)
-    settingsData[LDS_TIMESTAMP] = current_timestamp.astimezone().replace(microsecond=0).isoformat()
+    settingsData = OrderedDict()
+    settingsData[LDS_TIMESTAMP] = wallClock.isoformat(perf_counter_ns())
 
     hardwareData = OrderedDict()
     hardwareData[LDS_MIN_STRIKES] = minStrikes
     hardwareData[LDS_LOCATION] = isIndoors
     hardwareData[LDS_LCO_ON_INT] = isDispLco
     hardwareData[LDS_NOISE_FLOOR] = noiseFloor
+    hardwareData[LDS_NOISE_CONTROL] = noiseControl
+    hardwareData[LDS_DIST_CONTROL] = disturberControl
 
     settingsData[LDS_CAT_HARDWARE] = hardwareData
 
     scriptData = OrderedDict()
-    scriptData[LDS_PERIOD_IN_MINUTES] = period_in_minutes
-    scriptData[LDS_END_STORM_IN_MINUTES] = end_storm_after_minutes
-    scriptData[LDS_NUMBER_RINGS] = number_of_rings
-    scriptData[LDS_DISTANCE_UNITS] = distance_as
+    scriptData[LDS_PERIOD_IN_MINUTES] = settings.period_in_minutes
+    scriptData[LDS_END_STORM_IN_MINUTES] = settings.end_storm_after_minutes
+    scriptData[LDS_NUMBER_RINGS] = settings.number_of_rings
+    scriptData[LDS_DISTANCE_UNITS] = settings.distance_as
+    scriptData[LDS_RING_MODE] = ring_mode
+    if ring_mode == RING_MODE_DECAY:
+        scriptData[LDS_HALF_LIFE] = decay_half_life_in_seconds
 
     settingsData[LDS_CAT_SCRIPT] = scriptData
 
     topSettingsData['settings'] = settingsData
 
     print_line('Publishing to MQTT topic "{}, Data:{}"'.format(settings_topic, json.dumps(topSettingsData)))
-    mqtt_client.publish('{}'.format(settings_topic), json.dumps(topSettingsData), 1, retain=False)
-    sleep(0.5) # some slack for the publish roundtrip and callback function
+    publishOrQueue('{}'.format(settings_topic), json.dumps(topSettingsData))
 
-def send_status(timestamp, energy, distance, strikeCount):
+def send_status(timestamp, energy, distance, strikeCount, trace=None):
     statusData = OrderedDict()
-    statusData[LD_TIMESTAMP] = timestamp.astimezone().replace(microsecond=0).isoformat()
+    statusData[LD_TIMESTAMP] = wallClock.isoformat(timestamp)
     statusData[LD_ENERGY] = energy
     if distance == None:
         statusData[LD_DISTANCE] = 'out of range'
@@ -611,343 +1229,211 @@ def send_status(timestamp, energy, distance, strikeCount):
         statusData[LD_DISTANCE] = distance
     statusData[LD_COUNT] = strikeCount
 
-    print_line('Publishing to MQTT topic "{}, Data:{}"'.format(state_topic, json.dumps(statusData)))
-    mqtt_client.publish('{}'.format(state_topic), json.dumps(statusData), 1, retain=False)
-    sleep(0.5) # some slack for the publish roundtrip and callback function
+    serializeStartNs = perf_counter_ns()
+    payload = json.dumps(statusData)
+    serializeEndNs = perf_counter_ns()
+    metricSerialize.observe_ns(serializeEndNs - serializeStartNs)
+    if trace is not None:
+        trace.mark(STAGE_SERIALIZE, serializeEndNs)
+
+    print_line('Publishing to MQTT topic "{}, Data:{}"'.format(state_topic, payload))
+    publishOrQueue('{}'.format(state_topic), payload, trace)
 
 
 # -----------------------------------------------------------------------------
-#  Strike Accumulator Routines
+#  Strike Accumulator (owned by our event worker)
 # -----------------------------------------------------------------------------
 
+# our timestamps are monotonic (perf_counter_ns()), this shows them as local wall-clock time
+wallClock = WallClock(local_tz)
+
+accumulator = StormAccumulator(settings.period_in_minutes, settings.number_of_rings, settings.end_storm_after_minutes, settings.distance_as, print_line,
+                               full_rate_capture, detect_interval, capture_buffer_size, wallClock)
+accumulator.bin_load_histogram = metricBinLoad
+if len(extra_windows_minutes) > 0:
+    accumulator.add_windows(extra_windows_minutes)
+if energy_quantiles:
+    accumulator.enable_energy_quantiles()
+if ring_mode == RING_MODE_DECAY:
+    accumulator.enable_decay(decay_half_life_in_seconds)
+if energy_histogram:
+    accumulator.enable_histograms()
+if storm_cells:
+    accumulator.enable_cells(cell_max, cell_gate_km, cell_end_after_minutes * 60)
+
+# strikes per second over the last hour, for our strike rates (every strike, coalesced or not)
+strikeRates = None
+if rates_interval_in_seconds > 0:
+    strikeRates = StrikeRates(rates_jump_min_per_minute)
+ratesPublishedAt = None
+ratesWereZero = False
+
+# our long-term minute/hour/day aggregates
+rollupStore = None
+if len(rollup_file) > 0:
+    try:
+        rollupStore = RollupStore(rollup_file, settings.number_of_rings)
+        print_line('* Rolling up strikes into "{}"'.format(rollup_file), verbose=True)
+    except (OSError, ValueError) as e:
+        print_line('Failed to open rollup file "{}": {}, long-term aggregates disabled'.format(rollup_file, e), warning=True)
+
+# ...and our strike journal
+strikeJournal = None
+if len(journal_file) > 0:
+    try:
+        strikeJournal = StrikeJournal(journal_file, journal_max_records)
+        print_line('* Journaling strikes into "{}"'.format(journal_file), verbose=True)
+    except OSError as e:
+        print_line('Failed to open journal file "{}": {}, strike history disabled'.format(journal_file, e), warning=True)
+
+# ...and (on request) the raw registers of every interrupt, for replay with --replay_filename
+registerRecorder = None
+if len(record_filename) > 0:
+    try:
+        registerRecorder = RegisterRecorder(record_filename, perf_counter_ns())
+        print_line('* Recording interrupts into "{}"'.format(record_filename), verbose=True)
+    except OSError as e:
+        print_line('ERROR: unable to record into "{}": {} Fix and try again... Aborting'.format(record_filename, e), error=True, sd_notify=True)
+        sys.exit(1)
 
-# ring keys
-STRIKE_COUNT_KEY = 'count'
-DISTANCE_KEY = 'distance_km'
-FROM_SCALED_KEY = 'from_units'
-TO_SCALED_KEY = 'to_units'
-ENERGY_KEY = 'energy'
-TOTAL_ENERGY_KEY = 'total_energy'   #internal
-ACCUM_COUNT_KEY = 'accumulated_count'   #internal
-# top keys
-RING_PREFIX_KEY = 'ring'
-UNITS_KEY = 'units'
-PERIOD_IN_MINUTES_KEY = 'period_minutes'
-TIMESTAMP_KEY = 'timestamp'
-LAST_DETECT_KEY = 'last'
-FIRST_DETECT_KEY = 'first'
-STORM_LAST_DETECT_KEY = 'storm_last'
-STORM_FIRST_DETECT_KEY = 'storm_first'
-STORM_END_MINUTES_KEY = 'end_minutes'
-OUT_OF_RANGE_KEY = 'out_of_range'
-RING_COUNT_KEY = 'ring_count'
-RING_WIDTH_KEY = 'ring_width_km'
-
-
-# master list names
-CURR_RINGS_KEY = 'crings'
-PAST_RINGS_KEY = 'prings'
-
-# number of distance values
-MAX_DISTANCE_VALUES = 14
-
-distanceValueToIndexList = list(( 1, 5, 6, 8, 10, 12, 14, 17, 20, 24, 27, 31, 34, 37, 40, 63 ))
-if len(distanceValueToIndexList) != 1 + MAX_DISTANCE_VALUES + 1:
-      raise TypeError("[CODE] the distanceValueToIndexList must have 16 entries!!  Aborting!")
-
-# calculate the index to the indexSet we need based on current settings and get the list
-binIndexList = number_of_rings - min_number_of_rings
-binIndexesForThisRun = list(( 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14 ))
-# ensure the list is proper sized
-
-if len(binIndexesForThisRun) != MAX_DISTANCE_VALUES:
-      raise TypeError("a bin index-set must have 14 entries!!  Aborting!")
-
-#  0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, OOR (out of range)
-#
-#  1, 5, 6, 8, 10, 12, 14, 17, 20, 24, 27, 31, 34, 37, 40, 63   # value from sensor
-#  0, 1, 2, 3, 4,  5,  6,  7,  8,  9,  10, 11, 12, 13, 14, 15   # our internal value
-#
-#  3-7 bins + overhead + OOR
-
-accumulatedDetections = []  # sliding window of period strikes, new on front tail evaporates at end of period
-accumulatorBins = []        # our rings (bins)
-accumulatorLastStrike = ''  # earliest detection timestamp (this period)
-accumulatorFirstStrike = ''  # latest detection timestamp (this period)
-accumulatorStormLastStrike = ''  # earliest detection timestamp (whole storm)
-accumulatorStormFirstStrike = ''  # latest detection timestamp (whole storm)
-accumulatorOutOfRangeCount = 0
-accumulatorBinDistances = []
-
-
-def resetStormTracking():
-    global accumulatorStormLastStrike
-    global accumulatorStormFirstStrike
-    accumulatorStormLastStrike = ''
-    accumulatorStormFirstStrike = ''
-    print_line('Removing all storm knowledge (reset)', debug=True)
-
-def resetAccumulatorToEmpty():
-    global accumulatorBins
-    global accumulatorLastStrike
-    global accumulatorFirstStrike
-    global accumulatorOutOfRangeCount
-    # first empty our list if it wasn't
-    accumulatorBins.clear
-    # allocate an empty dictionary for each bin we need 0 + 1-[3-7] = [4-8 bins]
-    accumulatorBins = list( {} for i in list(range(number_of_rings + 1)) )  # n rings + 1 for "overhead" (out of range(63) is just counted)
-    # and reset these values
-    accumulatorOutOfRangeCount = 0
-    accumulatorLastStrike = ''
-    accumulatorFirstStrike = ''
-
-def calculate_ring_widths():
-    global accumulatorBinDistances
-    # first empty our list if it wasn't
-    accumulatorBinDistances.clear
-    # place a zero for each bin we need
-    accumulatorBinDistances = list( 0 for i in list(range(number_of_rings + 1)) )  # n rings + 1 for "overhead" (out of range(63) is just counted)
-    # FIXME: UNDONE now let's calculate the value for each bin
-    #  ring 1 starts at 5km so subtract that initially but add it back in for each except overhead
-    binWidth = (40 - 5) / number_of_rings
-    for ringIndex in range(number_of_rings + 1):
-        if ringIndex == 0:
-            accumulatorBinDistances[ringIndex] = 0
-        else:
-            accumulatorBinDistances[ringIndex] = (binWidth * (ringIndex - 1)) + 5
-    # now set up distance to bin index array lookup table
-    for distanceIndex in range(MAX_DISTANCE_VALUES):    # 0-13
-        reportedDistance = distanceValueToIndexList[distanceIndex + 1]    # [5-40]
-        binIndex = 0
-        for ringIndex in range(number_of_rings + 1):    # [0,1-7 for 7 rings]
-            accumulatorDistance = accumulatorBinDistances[ringIndex]
-            if accumulatorDistance <= reportedDistance:
-                binIndex = ringIndex
-            else:
-                break   # stop, we have our answer
-        binIndexesForThisRun[distanceIndex] = binIndex
-    #print('- distanceValueToIndexList "{}"'.format(distanceValueToIndexList))
-    #print('- accumulatorBinDistances "{}"'.format(accumulatorBinDistances))
-    #print('- binIndexesForThisRun "{}"'.format(binIndexesForThisRun))
+if rollupStore is not None:
+    accumulator.strike_sinks.append(rollupStore)
+if strikeJournal is not None:
+    accumulator.strike_sinks.append(strikeJournal)
 
-def binIndexFromDistance(distance):
+# -----------------------------------------------------------------------------
+#  History queries (MQTT {command_topic} and HTTP /history)
+#   request on MQTT: {"history": {"query": "rings", "start": "...", "end": "...", ...}}
+#   each page of the answer is published to {history_topic}
+# -----------------------------------------------------------------------------
+
+historyQuery = HistoryQuery(rollupStore, strikeJournal)
+HISTORY_PAGE_ACK_SECONDS = 30   # most we wait for the broker to take a history page
+
+def historyPages(request):
     try:
-        testDistance = distance
-        if distance == None:
-            testDistance = 63
-        # given distance determine index value for it... NOTE: 1=idx-0 and 63=idx-15
-        desiredBinIndex = distanceValueToIndexList.index(testDistance)
-        # if we have 1-14 let's translate it into a ring index value [1-[3-7]]
-        if desiredBinIndex > 0 and desiredBinIndex < 15:
-            desiredBinIndex = binIndexesForThisRun[desiredBinIndex - 1]
-    except ValueError:
-        raise TypeError("[CODE] WHAT?? Unexpected Value from detector[{}]!!  Aborting!".format(distance))
-    return desiredBinIndex
-
-    # =========================================================================
-    #  we are moving to a new accumulation strategy
-    #   instead of accumulating directly into the bins we are going to keep
-    #   a moving window of strikes and push this moving window into the bins
-    #   only when we need to report the bin-set
-    #
-    #
-    # -------------------------------------------------------------------------
-def ageDetections(accumulatedDetectionsList, period_in_minutes):
-    filteredList = accumulatedDetectionsList.copy()
-    timeNow = datetime.now(local_tz)
-    # our TUPLE is: (timestamp, energy, distance, strikeCount)
-    #   chase from oldest to youngest...
-    removed_count = 0
-    for currDetection in accumulatedDetectionsList:
-        detectionTimestamp = currDetection[0]
-        timeDifference = timeNow - detectionTimestamp
-        detectionAgeInMinutes = timeDifference.seconds / 60
-        # if too old remove it then look at next
-        if detectionAgeInMinutes > period_in_minutes:
-            filteredList.remove(currDetection)
-            removed_count += 1
+        return historyQuery.pages(request)
+    except (ValueError, KeyError) as e:
+        print_line('Bad history request {}: {}'.format(request, e), warning=True)
+        return [OrderedDict([('id', request.get('id')), ('error', str(e)), ('last', True)])]
+
+def publishHistoryPage(page):
+    # returns None if the broker is gone (we then abandon the answer)
+    publishInfo = mqtt_client.publish(history_topic, json.dumps(page), 1, retain=False)
+    if publishInfo.rc != mqtt.MQTT_ERR_SUCCESS:
+        print_line('History answer abandoned at page {}: {}'.format(page.get('page'), mqtt.error_string(publishInfo.rc)), warning=True)
+        return None
+    return publishInfo
+
+def historyPageTaken(publishInfo, waitedSeconds):
+    # False while we should wait on, raises TimeoutError once we have waited too long
+    if publishInfo.is_published():
+        return True
+    if waitedSeconds >= HISTORY_PAGE_ACK_SECONDS:
+        raise TimeoutError('page not acknowledged within {} seconds'.format(HISTORY_PAGE_ACK_SECONDS))
+    return False
+
+# a page at a time: the next page is only read (from our rollup store or journal) once the
+#  broker has acknowledged the last, and at most outbox_drain_per_second of them a second,
+#  so neither we nor paho ever hold more than a page of a large answer
+def answerHistoryRequest(request):
+    page_interval = 1.0 / outbox_drain_per_second
+    try:
+        for page in historyPages(request):
+            publishInfo = publishHistoryPage(page)
+            if publishInfo is None:
+                return
+            waitedSeconds = 0.0
+            while True:
+                sleep(page_interval)
+                waitedSeconds += page_interval
+                if historyPageTaken(publishInfo, waitedSeconds):
+                    break
+    except TimeoutError as e:
+        print_line('History answer abandoned: {}'.format(e), warning=True)
+
+async def answerHistoryRequestAsync(request):
+    page_interval = 1.0 / outbox_drain_per_second
+    try:
+        for page in historyPages(request):
+            publishInfo = publishHistoryPage(page)
+            if publishInfo is None:
+                return
+            waitedSeconds = 0.0
+            while True:
+                await asyncio.sleep(page_interval)
+                waitedSeconds += page_interval
+                if historyPageTaken(publishInfo, waitedSeconds):
+                    break
+    except TimeoutError as e:
+        print_line('History answer abandoned: {}'.format(e), warning=True)
+
+def handleMqttCommand(command):
+    # on our MQTT network thread (or loop): never block it, answer after it
+    if 'history' in command and isinstance(command['history'], dict):
+        print_line('History request: {}'.format(command['history']), debug=True)
+        if eventLoop is not None:
+            eventLoop.call_soon_threadsafe(eventLoop.create_task, answerHistoryRequestAsync(command['history']))
         else:
-            # this one is young enough so no point in checking any more...
-            break
-
-    orig_count = len(accumulatedDetectionsList)
-    new_count = len(filteredList)
-
-    print_line('adjusted detection set: enter with {} , leave with {}, removed {}'.format(orig_count, new_count, removed_count), debug=True)
-    return filteredList
-
-def accumulate(timestamp, energy, distance, strikeCount):
-    global accumulatedDetections
-    global accumulatorStormLastStrike
-    global accumulatorStormFirstStrike
-
-    # append this to our list then remove old (outside of period) detections from the list
-    accumulatedDetections.append( (timestamp, energy, distance, strikeCount) )
-
-    if(accumulatorStormFirstStrike == ''):
-        accumulatorStormFirstStrike = timestamp
-
-    accumulatorStormLastStrike = timestamp
-
-    accumulatedDetections = ageDetections(accumulatedDetections, period_in_minutes)
-
-def removeOldDetections():
-    global accumulatedDetections
-    accumulatedDetections = ageDetections(accumulatedDetections, period_in_minutes)
-    print_line('Removing old detections from set', debug=True)
-
-
-def getDictionaryForAccumulatorNamed(dictionaryName):
-    global accumulatorBins
-    global accumulatorLastStrike
-    global accumulatorFirstStrike
-    global accumulatorStormLastStrike
-    global accumulatorStormFirstStrike
-    global accumulatorOutOfRangeCount
-    # build a past dictionary and send it
-    tmpRingsDict = OrderedDict()
-
-    current_timestamp = datetime.now(local_tz)
-    tmpRingsDict[TIMESTAMP_KEY] = current_timestamp.astimezone().replace(microsecond=0).isoformat()
-    if accumulatorLastStrike != '':
-        tmpRingsDict[LAST_DETECT_KEY] = accumulatorLastStrike.astimezone().replace(microsecond=0).isoformat()
-    if accumulatorFirstStrike != '':
-        tmpRingsDict[FIRST_DETECT_KEY] = accumulatorFirstStrike.astimezone().replace(microsecond=0).isoformat()
-    if accumulatorStormLastStrike != '':
-        tmpRingsDict[STORM_LAST_DETECT_KEY] = accumulatorStormLastStrike.astimezone().replace(microsecond=0).isoformat()
-    if accumulatorStormFirstStrike != '':
-        tmpRingsDict[STORM_FIRST_DETECT_KEY] = accumulatorStormFirstStrike.astimezone().replace(microsecond=0).isoformat()
-    tmpRingsDict[STORM_END_MINUTES_KEY] = end_storm_after_minutes
-    tmpRingsDict[PERIOD_IN_MINUTES_KEY] = period_in_minutes
-    tmpRingsDict[UNITS_KEY] = distance_as
-    tmpRingsDict[OUT_OF_RANGE_KEY] = accumulatorOutOfRangeCount
-    tmpRingsDict[RING_COUNT_KEY] = number_of_rings
-    tmpRingsDict[RING_WIDTH_KEY] = round((40 - 5) / number_of_rings, 1)
-
-    if distance_as == val_distance_as_km:
-        distance_multiplier = 1.0
-        minus_one_value = 1.0 / 10.0
+            runSoon(answerHistoryRequest, command['history'])
+    elif command.get('reload') is True:
+        print_line('Configuration reload requested via MQTT', verbose=True)
+        queueDetectorEvent(SOURCE_COMMAND, RELOAD_COMMAND)
+    elif command.get('histogram') is True:
+        print_line('Histogram requested via MQTT', debug=True)
+        queueDetectorEvent(SOURCE_COMMAND, HISTOGRAM_COMMAND)
     else:
-        distance_multiplier = 0.621371
-        # miles are shown in tenths
-        minus_one_value = distance_multiplier / 10.0
-
-    for ringIndex in range(number_of_rings + 1):
-        binForThisRing = accumulatorBins[ringIndex]
-        singleRingData = OrderedDict()
-        if STRIKE_COUNT_KEY in binForThisRing:
-            singleRingData[STRIKE_COUNT_KEY] = binForThisRing[STRIKE_COUNT_KEY]
-        else:
-            singleRingData[STRIKE_COUNT_KEY] = 0
-        # dstance in km
-        singleRingData[DISTANCE_KEY] = round(accumulatorBinDistances[ringIndex], 1)
-        # distance in desired units
-        fromValue = accumulatorBinDistances[ringIndex] * distance_multiplier
-        if ringIndex < number_of_rings:
-            toValue = (accumulatorBinDistances[ringIndex + 1] * distance_multiplier) - minus_one_value
-        else:
-            toValue = 40 * distance_multiplier
-        # round the following to 1 decimal place...
-        singleRingData[FROM_SCALED_KEY] = round(fromValue, 1)
-        singleRingData[TO_SCALED_KEY] = round(toValue, 1)
-        if ENERGY_KEY in binForThisRing:
-            singleRingData[ENERGY_KEY] = binForThisRing[ENERGY_KEY]
-        else:
-            singleRingData[ENERGY_KEY] = 0
-        ringName = "ring{}".format(ringIndex)
-        tmpRingsDict[ringName] = singleRingData
-
-    topRingsData = OrderedDict()
-    topRingsData[dictionaryName] = tmpRingsDict
-    return topRingsData
-
-def loadDetectionsIntoBins():
-    global accumulatorBins
-    global accumulatorLastStrike
-    global accumulatorFirstStrike
-    global accumulatorOutOfRangeCount
-    global accumulatedDetections
-
-    # reset the current
-    resetAccumulatorToEmpty()
-
-    # our TUPLE is: (timestamp, energy, distance, strikeCount)
-    for currDetection in accumulatedDetections:
-        timestamp = currDetection[0]
-        energy = currDetection[1]
-        distance = currDetection[2]
-        strikeCount = currDetection[3]
-
-        # place earliest detection here
-        if accumulatorFirstStrike == '':
-            accumulatorFirstStrike = timestamp
-
-        # place latest detection here
-        accumulatorLastStrike = timestamp
-
-        # convert distance to bin index:
-        #   NOTE: 0 is overhead while 15 is 'out of range'
-        desiredBinIndex = binIndexFromDistance(distance)
-        if desiredBinIndex == 15:   # out-of-range
-            accumulatorOutOfRangeCount += 1
-        else:
-            desiredBin = accumulatorBins[desiredBinIndex]
-            if STRIKE_COUNT_KEY in desiredBin:
-                currCount = desiredBin[STRIKE_COUNT_KEY]
-            else:
-                currCount = 0
-            if TOTAL_ENERGY_KEY in desiredBin:
-                currTotalEnergy = desiredBin[TOTAL_ENERGY_KEY]
-            else:
-                currTotalEnergy = 0
-            if ACCUM_COUNT_KEY in desiredBin:
-                currAccumCount = desiredBin[ACCUM_COUNT_KEY]
-            else:
-                currAccumCount = 0
+        print_line('Ignoring unknown command {}'.format(command), warning=True)
+
+def historyRoute(query):
+    # HTTP GET /history?query=...: one JSON page per line, streamed
+    request = request_from_query_string(query)
+    try:
+        pages = historyQuery.pages(request)
+    except (ValueError, KeyError) as e:
+        return ('application/json', json.dumps(OrderedDict([('error', str(e))])), 400)
+    return ('application/x-ndjson', (json.dumps(page) + '\n' for page in pages))
 
-            currTotalEnergy += energy
-            currAccumCount += 1
-            currCount += strikeCount
+# we are ready for commands
+mqtt_command_topic = command_topic
+if not disable_mqtt and mqtt_client_connected:
+    mqtt_client.subscribe(mqtt_command_topic, 1)
+if full_rate_capture:
+    metrics.gauge('capture_pending', 'Strikes captured but not yet accumulated', function=lambda: len(accumulator.captured))
+    metrics.counter('capture_overruns', 'Strikes lost as our capture buffer was full', function=lambda: accumulator.captured.overrun_count)
 
-            # real values for consumer
-            desiredBin[STRIKE_COUNT_KEY] = currCount
-            desiredBin[ENERGY_KEY] = int(currTotalEnergy / currAccumCount)
-            # internal values so we can accumulate correctly
-            desiredBin[TOTAL_ENERGY_KEY] = currTotalEnergy
-            desiredBin[ACCUM_COUNT_KEY] = currAccumCount
+REPORT_TOPICS = { REPORT_CURRENT_RINGS: crings_topic, REPORT_PAST_RINGS: prings_topic, REPORT_HISTOGRAM: histogram_topic, REPORT_CELLS: cells_topic }
 
 def publishRingData(ringsData, topic):
-    print_line('Publishing to MQTT topic "{}, Data:{}"'.format(topic, json.dumps(ringsData)))
-    mqtt_client.publish('{}'.format(topic), json.dumps(ringsData), 1, retain=False)
-    sleep(0.5) # some slack for the publish roundtrip and callback function
-
-def report_past_accumulator(topic):
-    # build a past dictionary and send it
-    loadDetectionsIntoBins()
-    pastRingsData = getDictionaryForAccumulatorNamed(PAST_RINGS_KEY)
-    # send the data
-    _thread.start_new_thread(publishRingData, (pastRingsData, topic))
-
-def report_current_accumulator(topic):
-    # build a current dictionary and send it
-    loadDetectionsIntoBins()
-    currRingsData = getDictionaryForAccumulatorNamed(CURR_RINGS_KEY)
-    # send the data
-    _thread.start_new_thread(publishRingData, (currRingsData, topic))
+    serializeStartNs = perf_counter_ns()
+    payload = json.dumps(ringsData)
+    metricSerialize.observe_ns(perf_counter_ns() - serializeStartNs)
+
+    print_line('Publishing to MQTT topic "{}, Data:{}"'.format(topic, payload))
+    publishOrQueue('{}'.format(topic), payload)
+
+def publishReports(reports, trace=None):
+    # send what our accumulator asked for, in order
+    for report in reports:
+        if report.kind == REPORT_DETECT:
+            (timestamp, energy, distance, strikeCount) = report.data
+            if trace is not None:
+                tracer.hold(trace)  # until our detect message is acknowledged (or queued)
+            send_status(timestamp, energy, distance, strikeCount, trace)
+        elif report.kind == REPORT_WINDOW_RINGS:
+            (minutes, ringsData) = report.data
+            publishRingData(ringsData, window_topics[minutes])
+        else:
+            publishRingData(report.data, REPORT_TOPICS[report.kind])
 
 # -----------------------------------------------------------------------------
 
 
 # -----------------------------------------------------------------------------
-#  Setup our INT pin (GPIO)
+#  Our INT pin (GPIO) - configured via pigpio once our detector is ready
 # -----------------------------------------------------------------------------
 if opt_testing == False:
-    # Initialize GPIO
-    GPIO.setmode(GPIO.BCM)
-
-    # Use a software Pull-Down on interrupt pin
     interrupt_pin = int(intr_pin)
-    GPIO.setup(interrupt_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 
 # -----------------------------------------------------------------------------
 #  Ready our AS3935 connected via SPI for use...
@@ -972,11 +1458,22 @@ if opt_testing == False and sensor_using_spi == False:
 
     detector = AS3935_I2C(interrupt_pin, i2c_bus, i2c_address)
 
+# -----------------------------------------------------------------------------
+#  ...or, when testing, an AS3935 that only replays (its registers emulated)
+# -----------------------------------------------------------------------------
+if opt_testing:
+    from AS3935.AS3935_i2c_spi import AS3935_Replay
+    detector = AS3935_Replay()
+
 # -----------------------------------------------------------------------------
 #  Now just talk with our AS3935 connected via I2c or SPI
 # -----------------------------------------------------------------------------
 detector.setDebug(opt_debug)    # forward our debug flag to our underlying library
 
+if opt_testing == False:
+    # Use a software Pull-Down on interrupt pin
+    detector.configure_irq_pin()
+
 # but first, let's see if we have a communicating device!
 print_line('- Testing AS3935 Communications...', debug=True)
 testValue = 0x05
@@ -1005,69 +1502,195 @@ else:
 detector.set_default_values()
 # Indoors = more sensitive (can miss very strong lightnings)
 # Outdoors = less sensitive (can miss far away lightnings)
-detector.set_indoors(detector_afr_gain_indoor)
-detector.set_noise_floor(default_detector_noise_floor)
+detector.set_indoors(settings.detector_afr_gain_indoor)
+detector.set_noise_floor(settings.detector_noise_floor)
 # Tuning value for the detector
-#detector.set_tune_antenna(tuning_capacitor)
-print_line('* Calibrate with antenna cap. set to {}'.format(hex(tuning_capacitor)), verbose=True)
-detector.full_calibration(tuning_capacitor)
+#detector.set_tune_antenna(settings.tuning_capacitor)
+print_line('* Calibrate with antenna cap. set to {}'.format(hex(settings.tuning_capacitor)), verbose=True)
+detector.full_calibration(settings.tuning_capacitor)
 print_line('- Calibration Complete -', verbose=True)
 # Prevent single isolated strikes from being logged => interrupts begin after 5 strikes, then are fired normally
-detector.set_min_strikes(detector_min_strikes)
-
-first_alert = datetime.min
-last_alert = datetime.min
-strikes_since_last_alert = 0
+detector.set_min_strikes(settings.detector_min_strikes)
+
+# our noise floor follows the noise (run only by our event worker)
+noiseFloorControl = NoiseFloorController(settings.detector_noise_floor, max_floor=noise_floor_max,
+                                         window_seconds=noise_window_in_seconds, raise_at=noise_raise_at,
+                                         lower_after_seconds=noise_lower_after_minutes * 60)
+noiseFloorControl.reset(perf_counter_ns(), settings.detector_noise_floor)
+
+def adjustNoiseFloor(timestamp, direction):
+    # step the chip's floor one level and tell everyone
+    oldFloor = noiseFloorControl.floor
+    if direction == DIRECTION_RAISE:
+        newFloor = detector.raise_noise_floor(noiseFloorControl.max_floor)
+    else:
+        newFloor = detector.lower_noise_floor(noiseFloorControl.min_floor)
+    adjustment = noiseFloorControl.adjusted(timestamp, direction, newFloor)
+    metricNoiseFloorAdjustments[direction].inc()
+    print_line('* Noise floor {}: {} -> {} ({} noise interrupts in last {} seconds)'.format(direction, oldFloor, newFloor, adjustment.noise_count, noise_window_in_seconds), verbose=True)
+    publishSettings()
+
+# disturbers are masked while they flood in (run only by our event worker)
+disturberShedder = DisturberShedder(window_seconds=disturber_window_in_seconds, mask_at=disturber_mask_at,
+                                    unmask_after_seconds=disturber_unmask_after_minutes * 60)
+
+def maskDisturbers(timestamp, isMasked):
+    # (our driver keeps register 0x03 shadowed: this is a single write)
+    detector.set_mask_disturber(isMasked)
+    disturberShedder.masked(timestamp, isMasked)
+    metricDisturberMaskChanges[isMasked].inc()
+    if isMasked:
+        print_line('* Disturbers masked ({} in last {} seconds)'.format(disturberShedder.window_count(timestamp), disturber_window_in_seconds), verbose=True)
+    else:
+        print_line('* Disturbers un-masked after {} minutes'.format(disturber_unmask_after_minutes), verbose=True)
+    publishSettings()
 
-synth_energy = 0
-synth_distance = 63
+# Event handler (run only by our event worker)
+def handle_event(event):
+    try:
+        if event.source == SOURCE_COMMAND:
+            handle_command(event.channel)
+        else:
+            handle_interrupt(event.channel, event.edge_ns, event.data)
+    except Exception as e:
+        print_line('ERROR: failed handling {} event on channel {}: {}'.format(SOURCE_NAMES[event.source], event.channel, repr(e)), error=True)
+    syncPeriodTimer()
+    publishRatesIfDue()
+
+def publishRatesIfDue():
+    # (on our event worker, so at least every safety poll) once quiet, zero rates are sent only once
+    global ratesPublishedAt
+    global ratesWereZero
+    if strikeRates is None:
+        return
+    nowNs = perf_counter_ns()
+    if ratesPublishedAt is not None and nowNs - ratesPublishedAt < rates_interval_in_seconds * NS_PER_SECOND:
+        return
+    ratesPublishedAt = nowNs
+    ratesData = strikeRates.report(wallClock.wall_seconds(nowNs), wallClock.isoformat(nowNs))
+    ratesAreZero = ratesData[rateKey(15)] == 0
+    if ratesAreZero and ratesWereZero:
+        return
+    ratesWereZero = ratesAreZero
+    topRatesData = OrderedDict()
+    topRatesData[LD_RATES] = ratesData
+    publishRingData(topRatesData, rates_topic)
 
 # Interrupt handler
-def handle_interrupt(channel):
-    global first_alert
-    global last_alert
-    global strikes_since_last_alert
+def handle_interrupt(channel, edge_ns=0, data=None):
+    handlerStartNs = perf_counter_ns()
+    if edge_ns != 0:
+        metricEdgeToHandler.observe_ns(handlerStartNs - edge_ns)
+    trace = None
+    if tracer is not None:
+        trace = tracer.begin(channel, edge_ns if edge_ns != 0 else handlerStartNs)
+    try:
+        process_interrupt(channel, trace, edge_ns, data)
+    finally:
+        metricHandler.observe_ns(perf_counter_ns() - handlerStartNs)
+        if trace is not None:
+            tracer.release(trace)
+
+def irq_edge_callback(gpio, level, tick):
+    # pigpio callback: tick is the hardware time (us) of the edge
+    if level != 1:
+        return  # not a rising edge (2 = watchdog timeout)
+    edgeAgeInMicroseconds = detector.microseconds_since_tick(tick)
+    queueDetectorEvent(SOURCE_EDGE, gpio, perf_counter_ns() - (edgeAgeInMicroseconds * 1000))
+
+def process_interrupt(channel, trace=None, edge_ns=0, data=None):
     global detector
+    global scheduledPeriodDeadline
     sourceID = "<< INTR(" + str(channel) + ")"
-    current_timestamp = datetime.now(local_tz)
-    if channel != TIMER_INTERRUPT:
+    # date our strike by its IRQ edge (when known) not by when we got around to handling it
+    current_timestamp = edge_ns if edge_ns != 0 else perf_counter_ns()
+    if channel == POLL_INTERRUPT:
+        # ----------------------------------
+        # have safety poll with the IRQ line low, nothing is pending so leave the bus alone,
+        #  report any captured strikes now due and check for the end of the storm (below)
+        publishReports(accumulator.flush(current_timestamp))
+        if noise_floor_adaptive and noiseFloorControl.should_lower(current_timestamp):
+            adjustNoiseFloor(current_timestamp, DIRECTION_LOWER)
+        if disturberShedder.should_unmask(current_timestamp):
+            maskDisturbers(current_timestamp, False)
+        wallClockStep = wallClock.resync()
+        if wallClockStep != 0.0:
+            print_line('- wall clock stepped by {:.1f} seconds, re-anchored'.format(wallClockStep), debug=True)
+    elif channel != TIMER_INTERRUPT:
         # ----------------------------------
         # have HARDWARE interrupt!
-        sleep(0.003)
+        interruptRead = data if isinstance(data, InterruptRead) else None
+        if channel != REPLAY_INTERRUPT and interruptRead is None:
+            sleep(INTERRUPT_SETTLE_SECONDS)
+        if trace is not None:
+            trace.mark(STAGE_SETTLE, perf_counter_ns())
         # if we NOT testing use real hardware
         #  if we ARE testing then we just have detections!
-        if opt_testing == False:
-            reason = detector.get_interrupt()
+        interruptRegisters = None
+        if interruptRead is not None:
+            # asyncio runtime: already settled and read by our bus thread
+            interruptRegisters = interruptRead.registers
+            reason = interruptRegisters[0] & 0x0F
+            if registerRecorder is not None:
+                registerRecorder.add(current_timestamp, interruptRegisters, RECORD_SOURCE_POLL if edge_ns == 0 else RECORD_SOURCE_EDGE)
+            metricReasonRead.observe_ns(interruptRead.read_ns)
+        elif channel != TEST_INTERRUPT:
+            # (we settled above: time just the bus read)
+            readStartNs = perf_counter_ns()
+            if registerRecorder is not None:
+                # recording: read all our registers at once (0x03-0x08), the strike too
+                interruptRegisters = detector.get_interrupt_registers(settle=False)
+                metricReasonRead.observe_ns(perf_counter_ns() - readStartNs)
+                reason = interruptRegisters[0] & 0x0F
+                registerRecorder.add(current_timestamp, interruptRegisters, RECORD_SOURCE_POLL if edge_ns == 0 else RECORD_SOURCE_EDGE)
+            else:
+                reason = detector.get_interrupt(settle=False)
+                metricReasonRead.observe_ns(perf_counter_ns() - readStartNs)
         else:
             reason = 0x08
+        metricInterrupts.get(reason, metricInterruptsOther).inc()
+        if trace is not None:
+            trace.reason = reason
+            trace.mark(STAGE_REASON, perf_counter_ns())
 
         if reason == 0x01:
-            print_line(sourceID + " >> Noise level too high - adjusting")
-            detector.raise_noise_floor()
+            if not noise_floor_adaptive:
+                print_line(sourceID + " >> Noise level too high - adjusting")
+                detector.raise_noise_floor()
+            elif noiseFloorControl.note_noise(current_timestamp):
+                print_line(sourceID + " >> Noise level too high - adjusting")
+                adjustNoiseFloor(current_timestamp, DIRECTION_RAISE)
+            else:
+                print_line(sourceID + " >> Noise level too high ({} in last {} seconds)".format(noiseFloorControl.noise_count(current_timestamp), noise_window_in_seconds))
         elif reason == 0x04:
-            print_line(sourceID + " >> Disturber detected. Masking subsequent disturbers")
-            detector.set_mask_disturber(True)
+            if disturberShedder.note_disturber(current_timestamp):
+                print_line(sourceID + " >> Disturber detected. Masking subsequent disturbers")
+                maskDisturbers(current_timestamp, True)
+            else:
+                print_line(sourceID + " >> Disturber detected ({} in last {} seconds)".format(disturberShedder.window_count(current_timestamp), disturber_window_in_seconds))
         elif reason == 0x08:
-            #  we have a detection, let's start our period timer if it's not running already....
-            if isPeriodTimerRunning() == False:
-                startPeriodTimer()  # start our period
-                first_alert = current_timestamp # remember when storm first started
-            print_line(sourceID + " >> We sensed lightning! (%s)" % current_timestamp.strftime('%H:%M:%S - %Y/%m/%d'))
-            if last_alert != datetime.min and (current_timestamp - last_alert).seconds < 3:
+            if strikeRates is not None:
+                strikeRates.add(wallClock.wall_seconds(current_timestamp))
+            #  we have a detection, this starts our storm (and period) if not already started
+            if accumulator.strike_is_coalesced(current_timestamp):
+                print_line(sourceID + " >> We sensed lightning! (%s)" % wallClock.datetime(current_timestamp).strftime('%H:%M:%S - %Y/%m/%d'))
                 print_line(" -- Last strike is too recent, incrementing counter since last alert.")
-                strikes_since_last_alert += 1
+                metricCoalescedStrikes.inc()
                 return
-            if opt_testing == False:
-                distance = detector.get_distance()
-                energy = detector.get_energy()
+            print_line(sourceID + " >> We sensed lightning! (%s)" % wallClock.datetime(current_timestamp).strftime('%H:%M:%S - %Y/%m/%d'))
+            if interruptRegisters is not None:
+                (distance, energy) = detector.decode_strike(interruptRegisters[1:5])
+            elif channel != TEST_INTERRUPT:
+                readStartNs = perf_counter_ns()
+                (distance, energy) = detector.get_strike()
+                metricStrikeRead.observe_ns(perf_counter_ns() - readStartNs)
             else:
-                distance = synth_distance
-                energy = synth_energy
+                (distance, energy) = data
+            if trace is not None:
+                trace.mark(STAGE_READ, perf_counter_ns())
 
             print_line('- distance=[{}], energy=[{}]'.format(distance, energy), debug=True)
 
-            strikes_since_last_alert += 1
-
             distanceStr = str(distance) + "km"
             if distance == None:
                 distanceStr = 'out-of-range'
@@ -1075,60 +1698,146 @@ def handle_interrupt(channel):
                 distanceStr = 'overhead'
             print_line(" -- Energy: " + str(energy) + " - Distance: " + distanceStr)
 
-            # if we are past the end of this period then snap it and start accumulating all over
-            if last_alert != datetime.min and (current_timestamp - last_alert).seconds > period_in_minutes * 60:
-                print_line(sourceID + " >> Period ended, with detection in hand... reporting past first...")
-                report_past_accumulator(prings_topic)
-                strikes_since_last_alert = 1    # reset this since count just reported
-                startPeriodTimer()  # RESET timer so it doesn't expire for another 'period_in_minutes'
-
-            # ok, report our new detection to MQTT
-            _thread.start_new_thread(send_status, (current_timestamp, energy, distance, strikes_since_last_alert))
-            #  and let's accumulate this detection
-            accumulate(current_timestamp, energy, distance, strikes_since_last_alert)
-            report_current_accumulator(crings_topic)
-            # setup for next...
-            strikes_since_last_alert = 0
-            # remember when most recent strike from this storm happened
-            last_alert = current_timestamp
+            # accumulate, reporting our detection and our rings (and past rings if our period has ended)
+            publishReports(accumulator.add_strike(current_timestamp, energy, distance, trace), trace)
     else:
         # ----------------------------------
         # have period-end-timer interrupt!
-        #   assume we are at the end of this period, snap it and start accumulating all over
-        print_line(sourceID + " >> Period ended, waiting for next detection")
-        report_past_accumulator(prings_topic)
-        removeOldDetections()
-        report_current_accumulator(crings_topic)
-        # we snapped counters so reset count
-        strikes_since_last_alert = 0
-
-    # If no strike has been detected for the last hour, reset the strikes_since_last_alert (consider storm finished)
-    if last_alert != datetime.min and (current_timestamp - last_alert).seconds > end_storm_after_minutes * 60:
+        metricPeriodTimerInterrupts.inc()
+        scheduledPeriodDeadline = None  # (it fired: re-armed for whatever is next)
+        if accumulator.timer_is_for_windows():
+            #   strikes are ageing out of our extra windows, refresh them (as our period does our rings)
+            publishReports(accumulator.report_windows(current_timestamp))
+        else:
+            #   assume we are at the end of this period, snap it and start accumulating all over
+            print_line(sourceID + " >> Period ended, waiting for next detection")
+            publishReports(accumulator.period_ended(current_timestamp))
+            if rollupStore is not None:
+                rollupStore.flush()
+
+    # If no strike has been detected for a while consider storm finished
+    stormEndReports = accumulator.check_storm_end(current_timestamp)
+    if len(stormEndReports) > 0:
         #_thread.start_new_thread(send_tweet, (
         #        "\o/ Thunderstorm over. No new flash detected for last 1/2h.",))
         print_line(sourceID + " >> Storm ended, waiting for next detection")
-        report_past_accumulator(prings_topic)
-        removeOldDetections()
-        report_current_accumulator(crings_topic)
-        resetStormTracking()    # kill awareness of any storm
-        stopPeriodTimer()   #  kill our timer until our next detection
-        #  reset our indicators
-        strikes_since_last_alert = 0
-        last_alert = datetime.min
-        first_alert = datetime.min
-
-resetAccumulatorToEmpty()
-calculate_ring_widths()
-
-# post setup data, once per run
-settingsData = OrderedDict()
-min_strikes = detector.get_min_strikes()
-indoors = detector.get_indoors()
-disp_lco = detector.get_display_lco()
-noise_floor = detector.get_noise_floor()
+        publishReports(stormEndReports)
 
-if not disable_mqtt:
-    _thread.start_new_thread(send_settings, (min_strikes, indoors, disp_lco, noise_floor))
+
+# Command handler (run only by our event worker)
+def handle_command(channel):
+    if channel == RELOAD_COMMAND:
+        reloadSettings()
+    elif channel == HISTOGRAM_COMMAND:
+        if accumulator.stormHistogram is None:
+            print_line('- histogram requested but "energy_histogram" is not enabled', warning=True)
+        else:
+            publishReports([accumulator.report_histogram(perf_counter_ns())])
+    elif channel == SETTINGS_COMMAND:
+        publishSettings()
+    else:
+        print_line('- ignoring unknown command channel {}'.format(channel), warning=True)
+
+def reloadSettings():
+    # re-read config.ini and take on its reloadable settings, keeping our storm and detections
+    global settings
+    global rollupStore
+    try:
+        newSettings = loadSettings(readConfig())
+    except (IOError, ValueError, KeyError, ConfigParserError) as e:
+        print_line('Configuration reload failed, keeping current settings: {}'.format(e), warning=True, sd_notify=True)
+        return
+    oldSettings = settings
+    if newSettings == oldSettings:
+        print_line('* Configuration reloaded, no changes', verbose=True)
+        return
+    print_line('* Configuration reloaded: {}'.format(', '.join('{}={}'.format(name, value) for (name, value) in newSettings._asdict().items() if value != getattr(oldSettings, name))), sd_notify=True)
+    settings = newSettings  # (a single rebind: other threads see the old or the new settings, never a mix)
+
+    if newSettings.number_of_rings != oldSettings.number_of_rings and rollupStore is not None:
+        # our rollup file is laid out per ring, start a new one for the new ring count
+        accumulator.strike_sinks.remove(rollupStore)
+        rollupStore.close()
+        try:
+            rollupStore = RollupStore(rollup_file, newSettings.number_of_rings)
+            accumulator.strike_sinks.append(rollupStore)
+            print_line('- rollup file "{}" restarted for {} rings'.format(rollup_file, newSettings.number_of_rings), warning=True)
+        except (OSError, ValueError) as e:
+            rollupStore = None
+            print_line('Failed to reopen rollup file "{}": {}, long-term aggregates disabled'.format(rollup_file, e), warning=True)
+        historyQuery.rollup = rollupStore
+
+    publishReports(accumulator.reconfigure(perf_counter_ns(), newSettings.period_in_minutes, newSettings.number_of_rings,
+                                           newSettings.end_storm_after_minutes, newSettings.distance_as))
+
+    if newSettings.distance_as != oldSettings.distance_as:
+        detectorValues[LD_DISTANCE]['unit'] = newSettings.distance_as
+        publishDiscovery(LD_DISTANCE, detectorValues[LD_DISTANCE])
+
+    if opt_testing == False:
+        applyChipSettings(oldSettings, newSettings)
+    publishSettings()
+
+def applyChipSettings(oldSettings, newSettings):
+    # only touch the chip for what actually changed (recalibrating takes a while)
+    if newSettings.detector_afr_gain_indoor != oldSettings.detector_afr_gain_indoor:
+        detector.set_indoors(newSettings.detector_afr_gain_indoor)
+    if newSettings.detector_noise_floor != oldSettings.detector_noise_floor:
+        detector.set_noise_floor(newSettings.detector_noise_floor)
+        noiseFloorControl.reset(perf_counter_ns(), newSettings.detector_noise_floor)
+    if newSettings.tuning_capacitor != oldSettings.tuning_capacitor:
+        print_line('* Calibrate with antenna cap. set to {}'.format(hex(newSettings.tuning_capacitor)), verbose=True)
+        detector.full_calibration(newSettings.tuning_capacitor)
+        print_line('- Calibration Complete -', verbose=True)
+    if newSettings.detector_min_strikes != oldSettings.detector_min_strikes:
+        detector.set_min_strikes(newSettings.detector_min_strikes)
+
+def publishSettings():
+    # post setup data, once per run (and after each reload)
+    min_strikes = detector.get_min_strikes()
+    indoors = detector.get_indoors()
+    disp_lco = detector.get_display_lco()
+    noise_floor = detector.get_noise_floor()
+
+    # ...and how our noise floor has been following the noise
+    noiseControl = OrderedDict()
+    noiseControl[LDS_NOISE_ADAPTIVE] = noise_floor_adaptive
+    noiseControl[LDS_NOISE_MIN] = noiseFloorControl.min_floor
+    noiseControl[LDS_NOISE_MAX] = noiseFloorControl.max_floor
+    noiseControl[LDS_NOISE_RAISES] = noiseFloorControl.raise_count
+    noiseControl[LDS_NOISE_LOWERS] = noiseFloorControl.lower_count
+    adjustments = []
+    for adjustment in noiseFloorControl.history:
+        adjustmentData = OrderedDict()
+        adjustmentData[LDS_TIMESTAMP] = wallClock.isoformat(adjustment.timestamp)
+        adjustmentData[LDS_ADJ_DIRECTION] = adjustment.direction
+        adjustmentData[LDS_ADJ_FROM] = adjustment.old_floor
+        adjustmentData[LDS_ADJ_TO] = adjustment.new_floor
+        adjustmentData[LDS_ADJ_NOISE_COUNT] = adjustment.noise_count
+        adjustments.append(adjustmentData)
+    noiseControl[LDS_NOISE_ADJUSTMENTS] = adjustments
+
+    # ...and whether we are shedding disturbers
+    disturberControl = OrderedDict()
+    disturberControl[LDS_DIST_MASKED] = disturberShedder.is_masked
+    disturberControl[LDS_DIST_COUNT] = disturberShedder.disturber_count
+    disturberControl[LDS_DIST_MASKS] = disturberShedder.mask_count
+    disturberControl[LDS_DIST_UNMASKS] = disturberShedder.unmask_count
+
+    if not disable_mqtt:
+        runSoon(send_settings, min_strikes, indoors, disp_lco, noise_floor, noiseControl, disturberControl)
+
+publishSettings()
+settingsReady = True
+
+def reloadHandler(signum, frame):
+    # kill -HUP {pid}: our worker does the reload, don't even queue from within the signal handler itself
+    _thread.start_new_thread(queueDetectorEvent, (SOURCE_COMMAND, RELOAD_COMMAND))
+
+if eventLoop is not None:
+    eventLoop.add_signal_handler(SIGHUP, queueDetectorEvent, SOURCE_COMMAND, RELOAD_COMMAND)
+else:
+    signal(SIGHUP, reloadHandler)
 
 
 # -----------------------------------------------------------------------------
@@ -1143,7 +1852,28 @@ if opt_testing == False and opt_calc_tuning_cap == False:
     detector.set_mask_disturber(False)
 
     # now configure for run in main loop
-    GPIO.add_event_detect(interrupt_pin, GPIO.RISING, callback=handle_interrupt)
+    if eventLoop is None:
+        detectorEvents.start_worker(handle_event)
+    irqCallback = detector.add_irq_callback(irq_edge_callback)
+    noteStartupMilestone(STARTUP_ARMED)
+
+# tell systemd we are up: detecting (our broker connection may still be on its way)
+sd_notifier.notify('READY=1')
+
+
+# -----------------------------------------------------------------------------
+#  Start our (optional) metrics endpoint
+# -----------------------------------------------------------------------------
+metricsServer = None
+if metrics_port > 0 and opt_calc_tuning_cap == False:
+    try:
+        metricsServer = MetricsServer(metrics, metrics_address, metrics_port)
+        metricsServer.add_route('/history', historyRoute)
+        metricsServer.start()
+        print_line('* Metrics available at http://{}:{}/metrics'.format(metrics_address, metrics_port), verbose=True)
+        print_line('* History available at http://{}:{}/history'.format(metrics_address, metrics_port), verbose=True)
+    except OSError as e:
+        print_line('ERROR: unable to start metrics endpoint on {}:{} ({})'.format(metrics_address, metrics_port, e), error=True)
 
 
 # -----------------------------------------------------------------------------
@@ -1155,20 +1885,111 @@ if not disable_mqtt:
 if opt_testing == False and opt_calc_tuning_cap == False:
     # NOTE: we don't start our timer here... we wait until first detection!
 
+    def pollInterval():
+        # Check every 10s in case we missed an interrupt (interrupts happening too fast ?)
+        #  more often while a storm is active
+        if accumulator.storm_active():
+            return sleep_period_in_storm
+        return sleep_period
+
+    def pollDetector():
+        # ...but only touch the bus if IRQ is still raised
+        metricPolls.inc()
+        if detector.irq_pending():
+            metricMissedEdges.inc()
+            print_line('- IRQ found pending by poll (missed edge?)', debug=True)
+            queueDetectorEvent(SOURCE_EDGE, interrupt_pin)
+        else:
+            queueDetectorEvent(SOURCE_POLL, POLL_INTERRUPT)
+
+    def pollTimeoutHandler():
+        # asyncio runtime: our poll is a loop timer instead of a sleeping main thread
+        pollDetector()
+        startTimer(pollInterval(), pollTimeoutHandler)
+
     try:
-        while True:
-            # Read/clear the detector data every 10s in case we missed an interrupt (interrupts happening too fast ?)
-            sleep(sleep_period)
-            handle_interrupt(interrupt_pin)
+        if eventLoop is not None:
+            startTimer(pollInterval(), pollTimeoutHandler)
+            eventLoop.run_forever()
+        else:
+            while True:
+                sleep(pollInterval())
+                pollDetector()
     finally:
         # cleanup used pins... just because we like cleaning up after us
+        irqCallback.cancel()
+        detectorEvents.stop_worker(5.0)
+        if busExecutor is not None:
+            busExecutor.shutdown(wait=False)
         stopPeriodTimer()   # don't leave our timers running!
         stopAliveTimer()
-        GPIO.cleanup()
+        if mqttSocketAdapter is not None:
+            mqttSocketAdapter.stop()
+        mqtt_outbox.close()
+        if rollupStore is not None:
+            rollupStore.close()
+        if strikeJournal is not None:
+            strikeJournal.close()
+        if registerRecorder is not None:
+            registerRecorder.close()
+        if tracer is not None:
+            tracer.close()
 elif opt_calc_tuning_cap == True:
     # calculate our value and end the run
     print_line("* Calculating Tuning Capacitor Value", verbose=True)
     detector.calculate_tuning_cap()
+elif opt_replaying:
+
+    # we ARE replaying interrupts recorded from a real detector: through our detector's
+    #  decoding and our handler as fast as we can, each dated as recorded
+    try:
+        recordIndex = read_header(replay_filename)
+        records = list(read_records(replay_filename))
+    except (OSError, ValueError) as e:
+        print_line('ERROR: unable to replay "{}": {} Aborting'.format(replay_filename, e), error=True)
+        sys.exit(1)
+    print_line('* REPLAYing: {} interrupts ({} lightning, {} disturber, {} noise) from "{}"'.format(recordIndex['records'],
+                recordIndex['lightning'], recordIndex['disturber'], recordIndex['noise'], replay_filename), verbose=True)
+
+    if eventLoop is None:
+        detectorEvents.start_worker(handle_event)
+
+    replayQueued = detectorEvents.processed_count
+
+    def waitForEvents(maxWaiting):
+        # (let our worker catch up: a dropped event would leave its interrupt pending)
+        while replayQueued - detectorEvents.processed_count > maxWaiting:
+            runLoopFor(0.001)
+
+    replayStartNs = perf_counter_ns()
+    edge_ns = replayStartNs
+    for record in records:
+        waitForEvents(event_queue_size // 2)
+        edge_ns = replayStartNs + record.offset_us * 1000
+        detector.raise_interrupt(record.registers)
+        queueDetectorEvent(SOURCE_TEST, REPLAY_INTERRUPT, edge_ns)
+        replayQueued += 1
+    waitForEvents(0)
+    replayNs = perf_counter_ns() - replayStartNs
+    print_line('* REPLAYing: {} interrupts handled in {:.3f} seconds ({:.0f} per second)'.format(len(records), replayNs / NS_PER_SECOND,
+                len(records) * NS_PER_SECOND / max(1, replayNs)), verbose=True)
+
+    # ...then move on past the end of our storm
+    queueDetectorEvent(SOURCE_POLL, POLL_INTERRUPT, edge_ns + (settings.end_storm_after_minutes + 1) * 60 * NS_PER_SECOND)
+    replayQueued += 1
+    waitForEvents(0)
+    runLoopFor(1.0) # (our last publishes)
+
+    detectorEvents.stop_worker(5.0)
+    stopPeriodTimer()   # don't leave our timers running!
+    stopAliveTimer()
+    mqtt_outbox.close()
+    if rollupStore is not None:
+        rollupStore.close()
+    if strikeJournal is not None:
+        strikeJournal.close()
+    if registerRecorder is not None:
+        registerRecorder.close()
 else:
 
     # we ARE testing, meaning we are loading detection info from our test file!
@@ -1184,6 +2005,9 @@ else:
 
     print_line('* TESTing: - Running {} detections from "{}"'.format(detection_count, test_filename), verbose=True)
 
+    if eventLoop is None:
+        detectorEvents.start_worker(handle_event)
+
     curr_time_in_seconds = 0.0
     for currLine in lines:
         if currLine.startswith("#"):
@@ -1191,21 +2015,27 @@ else:
         line_parts = currLine.split(',')
         print_line('- line_parts: [{}]'.format(line_parts), debug=True)
         dispatch_time_seconds = float(line_parts[1])
-        synth_distance = float(line_parts[2])
-        synth_energy = int(line_parts[3])
+        test_distance = detector_distance(float(line_parts[2]))    # (63 = out of range)
+        test_energy = int(line_parts[3])
         wait_time = dispatch_time_seconds - curr_time_in_seconds
-        print_line('- test entry: {}, {}, {}'.format(dispatch_time_seconds, synth_distance, synth_energy), debug=True)
+        print_line('- test entry: {}, {}, {}'.format(dispatch_time_seconds, test_distance, test_energy), debug=True)
         if opt_scale != 1 and wait_time != 0:
             wait_time /= opt_scale
         print_line('- waiting for {} seconds'.format(wait_time), debug=True)
-        sleep(wait_time)
-        handle_interrupt(TEST_INTERRUPT)
+        runLoopFor(wait_time)
+        queueDetectorEvent(SOURCE_TEST, TEST_INTERRUPT, perf_counter_ns(), (test_distance, test_energy))
         curr_time_in_seconds = dispatch_time_seconds
 
     print_line("* TESTing: Detections ended...  waiting to detect storm end", verbose=True)
     wait_time = 35 * 60 # storm is 30 minutes, let's add extra 5 min... then convert to seconds
     print_line('- waiting for {} seconds'.format(wait_time), debug=True)
-    sleep(wait_time)
+    runLoopFor(wait_time)
 
+    detectorEvents.stop_worker(5.0)
     stopPeriodTimer()   # don't leave our timers running!
     stopAliveTimer()
+    mqtt_outbox.close()
+    if rollupStore is not None:
+        rollupStore.close()
+    if strikeJournal is not None:
+        strikeJournal.close()
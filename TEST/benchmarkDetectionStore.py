@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  compare the memory (and append/age cost) of a window of detections held as
+#   (datetime, energy, distance, strikeCount) tuples in a list (as we used to)
+#   vs. our struct-of-arrays DetectionStore
+#
+#  usage: benchmarkDetectionStore.py [-n detections]
+#
+import os
+import sys
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.detections import DetectionStore
+from lightning.distances import DISTANCE_VALUES, distance_from_value
+
+script_name = 'benchmarkDetectionStore.py'
+
+parser = argparse.ArgumentParser(description='Detection store memory benchmark')
+parser.add_argument("-n", "--detections", help="number of detections in the window", type=int, default=100000)
+parse_args = parser.parse_args()
+
+detectionCount = parse_args.detections
+local_tz = datetime.now().astimezone().tzinfo
+distances = [distance_from_value(value) for value in DISTANCE_VALUES]
+
+def measure(title, build):
+    tracemalloc.start()
+    startNs = perf_counter_ns()
+    window = build()
+    elapsedNs = perf_counter_ns() - startNs
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('- {:<24} {:7.1f} bytes/detection, {:6.2f} us/append'.format(title, current / detectionCount, elapsedNs / detectionCount / 1000.0))
+    return (window, current)
+
+def buildTupleList():
+    window = []
+    stormStart = datetime.now(local_tz)
+    for index in range(detectionCount):
+        window.append((stormStart + timedelta(seconds=index), 1000 + index, distances[index % len(distances)], 1))
+    return window
+
+def buildDetectionStore():
+    window = DetectionStore()
+    stormStartNs = perf_counter_ns()
+    for index in range(detectionCount):
+        window.append(stormStartNs + index * 1000000000, 1000 + index, distances[index % len(distances)], 1)
+    return window
+
+print('{}: {} detections'.format(script_name, detectionCount))
+(tupleList, tupleBytes) = measure('list of tuples', buildTupleList)
+del tupleList
+(store, storeBytes) = measure('DetectionStore', buildDetectionStore)
+print('- {:.1f}x smaller'.format(tupleBytes / storeBytes))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  check our offline (NumPy) ring recompute against the live path and time it:
+#   a random storm is fed through StormAccumulator, taking a ring snapshot
+#   (loadDetectionsIntoBins) every period, then recompute_rings() rebuilds the same
+#   snapshots in one go; every count, energy, out of range count and first/last
+#   strike must match exactly.  Then recompute_rings() is timed on a larger storm.
+#
+#  usage: benchmarkRingRecompute.py [-n detections] [-N detections] [-p period] [-r rings]
+#
+import os
+import sys
+import random
+import argparse
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.accumulator import StormAccumulator, STRIKE_COUNT_KEY, ENERGY_KEY
+from lightning.clock import NS_PER_SECOND, NS_PER_MINUTE
+from lightning.distances import DISTANCE_VALUES, DISTANCE_OUT_OF_RANGE_CODE
+from lightning.offline import recompute_rings
+import numpy
+
+script_name = 'benchmarkRingRecompute.py'
+
+parser = argparse.ArgumentParser(description='Offline ring recompute parity check and benchmark')
+parser.add_argument("-n", "--detections", help="detections in our parity check storm", type=int, default=20000)
+parser.add_argument("-N", "--timed", help="detections in our timed storm", type=int, default=5000000)
+parser.add_argument("-p", "--period", help="period_in_minutes [2-10]", type=int, default=5)
+parser.add_argument("-r", "--rings", help="number_of_rings [3-7]", type=int, default=5)
+parse_args = parser.parse_args()
+
+def randomStorm(detectionCount, seed):
+    # a storm ~1 detection every 2 seconds, some bunched on one timestamp
+    generator = random.Random(seed)
+    times = []
+    codes = []
+    energies = []
+    counts = []
+    timestamp = NS_PER_MINUTE
+    for index in range(detectionCount):
+        if generator.random() > 0.05:
+            timestamp += generator.randrange(1, 4 * NS_PER_SECOND)
+        times.append(timestamp)
+        codes.append(generator.randrange(len(DISTANCE_VALUES)))
+        energies.append(generator.randrange(1, 2000000))
+        counts.append(1 if generator.random() > 0.1 else generator.randrange(2, 6))
+    return (times, codes, energies, counts)
+
+def liveSnapshots(storm, snapshotTimes):
+    # what our daemon's accumulator holds at each snapshot
+    (times, codes, energies, counts) = storm
+    accumulator = StormAccumulator(parse_args.period, parse_args.rings, 60)
+    snapshots = []
+    index = 0
+    for snapshotTime in snapshotTimes:
+        while index < len(times) and times[index] <= snapshotTime:
+            code = codes[index]
+            distance = None if code == DISTANCE_OUT_OF_RANGE_CODE else DISTANCE_VALUES[code]
+            accumulator.accumulate(times[index], energies[index], distance, counts[index])
+            index += 1
+        accumulator.removeOldDetections(snapshotTime)
+        accumulator.loadDetectionsIntoBins()
+        rings = list((ring.get(STRIKE_COUNT_KEY, 0), ring.get(ENERGY_KEY, 0)) for ring in accumulator.accumulatorBins)
+        first = -1 if accumulator.accumulatorFirstStrike == '' else accumulator.accumulatorFirstStrike
+        last = -1 if accumulator.accumulatorLastStrike == '' else accumulator.accumulatorLastStrike
+        snapshots.append((rings, accumulator.accumulatorOutOfRangeCount, first, last))
+    return snapshots
+
+def checkParity():
+    storm = randomStorm(parse_args.detections, 1)
+    times = storm[0]
+    # a snapshot every period (as prings) plus every 7 seconds (overlapping windows, as crings)
+    snapshotTimes = sorted(set(range(0, times[-1] + NS_PER_MINUTE, parse_args.period * NS_PER_MINUTE)) | set(range(0, times[-1] + NS_PER_MINUTE, 7 * NS_PER_SECOND)))
+    live = liveSnapshots(storm, snapshotTimes)
+    offline = recompute_rings(storm[0], storm[1], storm[2], snapshotTimes, parse_args.period, parse_args.rings, counts=storm[3])
+    mismatches = 0
+    for (index, (rings, outOfRange, first, last)) in enumerate(live):
+        recomputed = (list((int(offline.counts[index, ring]), int(offline.energies[index, ring])) for ring in range(parse_args.rings + 1)),
+                      int(offline.out_of_range[index]), int(offline.first[index]), int(offline.last[index]))
+        if recomputed != (rings, outOfRange, first, last):
+            mismatches += 1
+            if mismatches <= 3:
+                print('- MISMATCH at snapshot {}: live {} offline {}'.format(index, (rings, outOfRange, first, last), recomputed))
+    print('- parity: {} detections, {} snapshots, {} mismatches'.format(len(times), len(snapshotTimes), mismatches))
+    return mismatches == 0
+
+def timeRecompute():
+    generator = numpy.random.default_rng(2)
+    detectionCount = parse_args.timed
+    times = numpy.cumsum(generator.integers(0, 4 * NS_PER_SECOND, detectionCount, dtype=numpy.int64))
+    codes = generator.integers(0, len(DISTANCE_VALUES), detectionCount)
+    energies = generator.integers(1, 2000000, detectionCount)
+    snapshotTimes = numpy.arange(0, times[-1] + NS_PER_MINUTE, parse_args.period * NS_PER_MINUTE)
+    startNs = perf_counter_ns()
+    recompute_rings(times, codes, energies, snapshotTimes, parse_args.period, parse_args.rings)
+    elapsedNs = perf_counter_ns() - startNs
+    print('- recompute: {} detections, {} snapshots in {:.3f} seconds ({:.1f} million detections/second)'.format(detectionCount, len(snapshotTimes),
+          elapsedNs / NS_PER_SECOND, detectionCount * 1000.0 / max(1, elapsedNs)))
+
+print('{}: period {} minutes, {} rings'.format(script_name, parse_args.period, parse_args.rings))
+parityOk = checkParity()
+timeRecompute()
+sys.exit(0 if parityOk else 1)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  compare our two runtimes (config.ini [Daemon] runtime = threads|asyncio) handling the
+#   same strikes: threads used and context switches per strike.
+#
+#  A "GPIO" thread (pigpio's callback thread in the daemon, present in both runtimes) fires
+#   an edge every --interval ms.  Each edge is accumulated and its detect and crings reports
+#   published on a socket to a fake broker (a child process acknowledging every message,
+#   so its own switches are not counted).  The threads runtime adds a network thread
+#   select()ing on that socket (paho's loop_start()), our event worker and the alive and
+#   period threading.Timers; the asyncio runtime does all of that on one event loop.
+#   Run it on the target (e.g. a Pi Zero) to see the difference there.
+#
+#  usage: benchmarkRuntime.py [-n strikes] [-i interval-ms]
+#
+import os
+import sys
+import json
+import select
+import socket
+import asyncio
+import argparse
+import resource
+import threading
+import multiprocessing
+from time import sleep, perf_counter_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.accumulator import StormAccumulator
+from lightning.clock import NS_PER_SECOND
+from lightning.events import EventQueue, DetectorEvent, SOURCE_EDGE
+
+script_name = 'benchmarkRuntime.py'
+
+parser = argparse.ArgumentParser(description='Threads vs. asyncio runtime benchmark')
+parser.add_argument("-n", "--strikes", help="number of strikes to handle", type=int, default=500)
+parser.add_argument("-i", "--interval", help="ms between strikes", type=float, default=10.0)
+parse_args = parser.parse_args()
+
+strikeCount = parse_args.strikes
+intervalSeconds = parse_args.interval / 1000.0
+DISTANCES = (1, 5, 8, 12, 17, 24, 31, 40, None)
+ACK = b'A'
+
+
+def fakeBroker(sock):
+    # acknowledge every message (one per line)
+    pending = b''
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        sock.sendall(ACK * len(lines))
+
+
+class Run:
+    # what both runtimes share: the accumulator, publishing and the counters
+    def __init__(self, sock):
+        self.sock = sock
+        self.accumulator = StormAccumulator(5, 5, 30)
+        self.handled = 0
+        self.acked = 0
+        self.expected = 0
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.on_done = None
+        self.peak_threads = 0
+
+    def handle(self, event):
+        # strikes are 4 (virtual) seconds apart so none are coalesced
+        timestamp = event.edge_ns
+        self.accumulator.strike_is_coalesced(timestamp)
+        for report in self.accumulator.add_strike(timestamp, 1000 + self.handled, DISTANCES[self.handled % len(DISTANCES)]):
+            self.sock.sendall(json.dumps(report.data).encode('utf-8') + b'\n')   # paho writes from the publishing thread
+            with self.lock:
+                self.expected += 1
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        with self.lock:
+            self.handled += 1
+            self.check_done()
+
+    def read_acks(self):
+        data = self.sock.recv(65536)
+        with self.lock:
+            self.acked += len(data)
+            self.check_done()
+
+    def check_done(self):
+        if self.handled == strikeCount and self.acked >= self.expected and not self.done.is_set():
+            self.done.set()
+            if self.on_done is not None:
+                self.on_done()
+
+    def gpio_thread(self, queue_edge):
+        for index in range(strikeCount):
+            sleep(intervalSeconds)
+            queue_edge(DetectorEvent(SOURCE_EDGE, 17, (index + 1) * 4 * NS_PER_SECOND, None))
+
+
+def runThreads(sock):
+    run = Run(sock)
+    events = EventQueue(1024)
+    events.start_worker(run.handle)
+
+    def network():
+        # paho's loop_forever(): select() with a timeout, read what arrives
+        while not run.done.is_set():
+            (readable, writable, failed) = select.select([sock], [], [], 1.0)
+            if readable:
+                run.read_acks()
+    networkThread = threading.Thread(target=network, daemon=True)
+    networkThread.start()
+    aliveTimer = threading.Timer(60, lambda: None)
+    aliveTimer.start()
+    periodTimer = threading.Timer(300, lambda: None)
+    periodTimer.start()
+    gpio = threading.Thread(target=run.gpio_thread, args=(events.put,), daemon=True)
+    gpio.start()
+    run.done.wait()
+    networkThread.join()
+    aliveTimer.cancel()
+    periodTimer.cancel()
+    events.stop_worker(5.0)
+    return run
+
+
+def runAsyncio(sock):
+    run = Run(sock)
+    loop = asyncio.new_event_loop()
+    events = EventQueue(1024)
+
+    def queueEdge(event):
+        if events.put(event):
+            loop.call_soon_threadsafe(events.drain, run.handle)
+    sock.setblocking(False)
+    loop.add_reader(sock, run.read_acks)
+    aliveTimer = loop.call_later(60, lambda: None)
+    periodTimer = loop.call_later(300, lambda: None)
+    gpio = threading.Thread(target=run.gpio_thread, args=(queueEdge,), daemon=True)
+    gpio.start()
+    run.on_done = loop.stop
+    loop.run_forever()
+    aliveTimer.cancel()
+    periodTimer.cancel()
+    loop.remove_reader(sock)
+    loop.close()
+    sock.setblocking(True)
+    return run
+
+
+def measure(title, runtime):
+    (ourSock, brokerSock) = socket.socketpair()
+    broker = multiprocessing.get_context('fork').Process(target=fakeBroker, args=(brokerSock,), daemon=True)
+    broker.start()
+    brokerSock.close()
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    startNs = perf_counter_ns()
+    run = runtime(ourSock)
+    elapsedNs = perf_counter_ns() - startNs
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    ourSock.close()
+    broker.join(5.0)
+    voluntary = after.ru_nvcsw - before.ru_nvcsw
+    involuntary = after.ru_nivcsw - before.ru_nivcsw
+    cpuSeconds = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    print('- {:<8} threads={:2d}  switches/strike={:6.2f} (voluntary {:6.2f}, involuntary {:5.2f})  cpu={:7.1f} us/strike  wall={:.1f}s'.format(
+        title, run.peak_threads, (voluntary + involuntary) / strikeCount, voluntary / strikeCount, involuntary / strikeCount,
+        cpuSeconds * 1000000.0 / strikeCount, elapsedNs / NS_PER_SECOND))
+
+
+print('{}: {} strikes, {:.1f} ms apart'.format(script_name, strikeCount, parse_args.interval))
+measure('threads', runThreads)
+measure('asyncio', runAsyncio)
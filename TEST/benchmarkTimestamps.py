@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  compare the cost of the timestamps in a rings report: formatting five timezone-aware
+#   datetimes (as we used to) vs. our monotonic timestamps formatted via WallClock's
+#   per-second ISO cache.  Run it on the target (e.g. a Pi Zero) to see the savings there.
+#
+#  usage: benchmarkTimestamps.py [-n reports]
+#
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter_ns
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.clock import WallClock, NS_PER_SECOND
+from lightning.accumulator import StormAccumulator
+
+script_name = 'benchmarkTimestamps.py'
+
+parser = argparse.ArgumentParser(description='Rings report timestamp benchmark')
+parser.add_argument("-n", "--reports", help="number of reports to time", type=int, default=20000)
+parse_args = parser.parse_args()
+
+local_tz = datetime.now().astimezone().tzinfo
+reportCount = parse_args.reports
+
+def timeIt(title, function):
+    startNs = perf_counter_ns()
+    for index in range(reportCount):
+        function(index)
+    elapsedNs = perf_counter_ns() - startNs
+    print('- {:<44} {:8.2f} us/report'.format(title, elapsedNs / reportCount / 1000.0))
+    return elapsedNs
+
+# the five timestamps of a report (timestamp, last, first, storm_last, storm_first)
+stormStart = datetime.now(local_tz)
+def datetimeReport(index):
+    now = stormStart + timedelta(seconds=index)
+    for moment in (now, now, stormStart + timedelta(seconds=index // 2), now, stormStart):
+        moment.astimezone().replace(microsecond=0).isoformat()
+
+clock = WallClock(local_tz)
+stormStartNs = perf_counter_ns()
+def monotonicReport(index):
+    now = stormStartNs + index * NS_PER_SECOND
+    for moment in (now, now, stormStartNs + (index // 2) * NS_PER_SECOND, now, stormStartNs):
+        clock.isoformat(moment)
+
+print('{}: {} reports'.format(script_name, reportCount))
+before = timeIt('datetime.astimezone().isoformat() x5', datetimeReport)
+after = timeIt('WallClock.isoformat() x5 (per-second cache)', monotonicReport)
+print('- saving {:.2f} us/report ({:.0f}%)'.format((before - after) / reportCount / 1000.0, 100.0 * (before - after) / before))
+
+# ...and a whole crings report (5 rings, 40 detections in the window)
+accumulator = StormAccumulator(5, 5, 30, clock=clock)
+for index in range(40):
+    accumulator.accumulate(stormStartNs + index * 7 * NS_PER_SECOND, 1000 + index, (1, 14, 20, 40)[index % 4], 1)
+lastNs = stormStartNs + 40 * 7 * NS_PER_SECOND
+timeIt('whole crings report (5 rings, 40 detections)', lambda index: accumulator.report_current_accumulator(lastNs + index * NS_PER_SECOND))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  choose period_in_minutes, number_of_rings and end_storm_after_minutes from data: replay
+#   every recorded storm in a directory under every combination of a grid of these settings
+#   and compare what each combination would have published.
+#
+#  Storms are our test files (*.csv: record-nbr, time-seconds, dist_km, energy) and interrupt
+#   recordings made with the daemon's --record_filename (*.as3r, their lightning interrupts
+#   decoded by our AS3935 driver, which then needs pigpio and spidev installed).
+#
+#  Each (storm, settings) pair is replayed through our StormAccumulator on a virtual clock,
+#   firing the period timer and the storm end check (our 1 second safety poll during a
+#   storm) when the daemon would, so hours of storm take milliseconds.  Pairs are spread
+#   over a process pool, one per core by default.
+#
+#  One CSV line per combination (totals over all storms) is written to stdout:
+#   reports published (detect, crings, prings), storms seen (more than recorded: a storm
+#   was ended early), storm end latency (from the last strike to the storm end report) and
+#   ring occupancy (the share of rings holding strikes, averaged over each crings).
+#
+#  usage: sweepSettings.py storm_dir [-p 2,5,10] [-r 3,5,7] [-e 10,30,60] [-j jobs] [--per_storm]
+#
+import os
+import sys
+import glob
+import argparse
+import itertools
+from time import perf_counter_ns
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.accumulator import StormAccumulator, REPORT_DETECT, REPORT_CURRENT_RINGS, REPORT_PAST_RINGS, CURR_RINGS_KEY, STRIKE_COUNT_KEY
+from lightning.clock import WallClock, NS_PER_SECOND, NS_PER_MINUTE
+from lightning.distances import distance_from_value
+
+script_name = 'sweepSettings.py'
+
+POLL_IN_STORM_NS = 1 * NS_PER_SECOND    # [Daemon] period_in_storm default
+
+def minutesList(text):
+    return list(int(value) for value in text.replace(',', ' ').split())
+
+parser = argparse.ArgumentParser(description='Replay recorded storms under a grid of settings')
+parser.add_argument("storm_dir", help="directory of recorded storms (*.csv, *.as3r)")
+parser.add_argument("-p", "--periods", help="period_in_minutes values [2-10]", type=minutesList, default=[2, 5, 10])
+parser.add_argument("-r", "--rings", help="number_of_rings values [3-7]", type=minutesList, default=[3, 5, 7])
+parser.add_argument("-e", "--end_minutes", help="end_storm_after_minutes values [10-60]", type=minutesList, default=[10, 30, 60])
+parser.add_argument("-j", "--jobs", help="worker processes [Default: one per core]", type=int, default=os.cpu_count())
+parser.add_argument("--per_storm", help="also write a line per (storm, settings) pair", action="store_true")
+
+
+class VirtualClock(WallClock):
+    # our virtual timestamps count from 0 = the epoch (UTC) so every run formats alike
+    def anchor(self):
+        self.anchor_ns = 0
+        self.anchor_wall_ns = 0
+        self.iso_cache.clear()
+
+
+def loadCsvStorm(filename):
+    # LINE IS: record-nbr, time-seconds, dist_km, energy
+    strikes = []
+    with open(filename, 'r') as stormFile:
+        for line in stormFile:
+            if line.startswith('#') or len(line.strip()) == 0:
+                continue
+            lineParts = line.split(',')
+            strikes.append((int(float(lineParts[1]) * NS_PER_SECOND), distance_from_value(int(float(lineParts[2]))), int(lineParts[3])))
+    return strikes
+
+def loadRecordedStorm(filename):
+    # only lightning interrupts, decoded as our daemon would
+    from AS3935.AS3935_i2c_spi import AS3935_Replay, INT_L
+    from lightning.registers import read_records
+    detector = AS3935_Replay()
+    strikes = []
+    for record in read_records(filename):
+        detector.raise_interrupt(record.registers)
+        if detector.get_interrupt() == INT_L:
+            (distance, energy) = detector.get_strike()
+            strikes.append((record.offset_us * 1000, distance, energy))
+    return strikes
+
+storms = {}     # filename -> strikes, loaded once per worker process
+
+def loadStorm(filename):
+    if filename not in storms:
+        if filename.endswith('.as3r'):
+            storms[filename] = loadRecordedStorm(filename)
+        else:
+            storms[filename] = loadCsvStorm(filename)
+    return storms[filename]
+
+
+class StormRun:
+    # one storm replayed under one combination of settings
+    def __init__(self, period_in_minutes, number_of_rings, end_storm_after_minutes):
+        self.accumulator = StormAccumulator(period_in_minutes, number_of_rings, end_storm_after_minutes, clock=VirtualClock())
+        self.end_storm_ns = end_storm_after_minutes * NS_PER_MINUTE
+        self.strikes = 0
+        self.reports = { REPORT_DETECT: 0, REPORT_CURRENT_RINGS: 0, REPORT_PAST_RINGS: 0 }
+        self.storms = 0
+        self.end_latency_ns = 0
+        self.occupancy_sum = 0.0
+
+    def count(self, reports):
+        for report in reports:
+            self.reports[report.kind] = self.reports.get(report.kind, 0) + 1
+            if report.kind == REPORT_CURRENT_RINGS:
+                ringsData = report.data[CURR_RINGS_KEY]
+                rings = list(ringsData['ring{}'.format(ringIndex)] for ringIndex in range(self.accumulator.number_of_rings + 1))
+                self.occupancy_sum += sum(1 for ring in rings if ring[STRIKE_COUNT_KEY] > 0) / len(rings)
+
+    def nextStormEndCheck(self):
+        # our first safety poll after the storm has been quiet long enough
+        lastAlert = self.accumulator.last_alert
+        if lastAlert is None:
+            return None
+        return ((lastAlert + self.end_storm_ns) // POLL_IN_STORM_NS + 1) * POLL_IN_STORM_NS
+
+    def advanceTo(self, limit_ns):
+        # fire our period timer and storm end check as the daemon would, until limit_ns (None = the storm's end)
+        while True:
+            periodDeadline = self.accumulator.period_deadline
+            stormEndCheck = self.nextStormEndCheck()
+            if periodDeadline is None and stormEndCheck is None:
+                return
+            timestamp = min(value for value in (periodDeadline, stormEndCheck) if value is not None)
+            if limit_ns is not None and timestamp >= limit_ns:
+                return
+            if timestamp == periodDeadline:
+                self.count(self.accumulator.period_ended(timestamp))
+            lastAlert = self.accumulator.last_alert
+            stormEndReports = self.accumulator.check_storm_end(timestamp)
+            if len(stormEndReports) > 0:
+                self.storms += 1
+                self.end_latency_ns += timestamp - lastAlert
+                self.count(stormEndReports)
+
+    def strike(self, timestamp, distance, energy):
+        self.advanceTo(timestamp)
+        self.strikes += 1
+        if not self.accumulator.strike_is_coalesced(timestamp):
+            self.count(self.accumulator.add_strike(timestamp, energy, distance))
+
+    def run(self, strikes):
+        for (timestamp, distance, energy) in strikes:
+            self.strike(timestamp, distance, energy)
+        self.advanceTo(None)
+        return self
+
+
+def replayPair(pair):
+    # (in a worker process)
+    (filename, settings) = pair
+    startNs = perf_counter_ns()
+    run = StormRun(*settings).run(loadStorm(filename))
+    return (filename, settings, run.strikes, dict(run.reports), run.storms, run.end_latency_ns, run.occupancy_sum, perf_counter_ns() - startNs)
+
+
+def main():
+    parse_args = parser.parse_args()
+    stormFiles = sorted(glob.glob(os.path.join(parse_args.storm_dir, '*.csv')) + glob.glob(os.path.join(parse_args.storm_dir, '*.as3r')))
+    if len(stormFiles) == 0:
+        print('{}: no storms (*.csv, *.as3r) found in "{}"'.format(script_name, parse_args.storm_dir), file=sys.stderr)
+        sys.exit(1)
+    grid = list(itertools.product(parse_args.periods, parse_args.rings, parse_args.end_minutes))
+    pairs = list(itertools.product(stormFiles, grid))
+    print('{}: {} storms x {} settings = {} replays on {} processes'.format(script_name, len(stormFiles), len(grid), len(pairs), parse_args.jobs), file=sys.stderr)
+
+    startNs = perf_counter_ns()
+    totals = {}
+    strikesReplayed = 0
+    if parse_args.per_storm:
+        print('storm,period_in_minutes,number_of_rings,end_storm_after_minutes,strikes,detect,crings,prings,storms,end_latency_minutes,ring_occupancy')
+    with ProcessPoolExecutor(max_workers=parse_args.jobs) as pool:
+        # (larger chunks: each replay is short, let a worker keep its storms loaded)
+        for (filename, settings, strikes, reports, stormCount, endLatencyNs, occupancySum, elapsedNs) in pool.map(replayPair, pairs, chunksize=max(1, len(pairs) // (parse_args.jobs * 4))):
+            strikesReplayed += strikes
+            if parse_args.per_storm:
+                print('{},{},{},{},{},{},{},{},{},{:.2f},{:.3f}'.format(os.path.basename(filename), *settings, strikes, reports[REPORT_DETECT], reports[REPORT_CURRENT_RINGS],
+                      reports[REPORT_PAST_RINGS], stormCount, endLatencyNs / max(1, stormCount) / NS_PER_MINUTE, occupancySum / max(1, reports[REPORT_CURRENT_RINGS])))
+            total = totals.setdefault(settings, { 'strikes': 0, 'detect': 0, 'crings': 0, 'prings': 0, 'storms': 0, 'latency': 0, 'occupancy': 0.0, 'cpu': 0 })
+            total['strikes'] += strikes
+            total['detect'] += reports[REPORT_DETECT]
+            total['crings'] += reports[REPORT_CURRENT_RINGS]
+            total['prings'] += reports[REPORT_PAST_RINGS]
+            total['storms'] += stormCount
+            total['latency'] += endLatencyNs
+            total['occupancy'] += occupancySum
+            total['cpu'] += elapsedNs
+    elapsedNs = perf_counter_ns() - startNs
+
+    print('period_in_minutes,number_of_rings,end_storm_after_minutes,strikes,reports,detect,crings,prings,storms,end_latency_minutes,ring_occupancy,replay_ms')
+    for settings in grid:
+        total = totals[settings]
+        print('{},{},{},{},{},{},{},{},{},{:.2f},{:.3f},{:.1f}'.format(*settings, total['strikes'], total['detect'] + total['crings'] + total['prings'],
+              total['detect'], total['crings'], total['prings'], total['storms'], total['latency'] / max(1, total['storms']) / NS_PER_MINUTE,
+              total['occupancy'] / max(1, total['crings']), total['cpu'] / 1000000.0))
+    print('{}: {} replays, {} strikes in {:.2f} seconds ({:.0f} strikes/second)'.format(script_name, len(pairs), strikesReplayed,
+          elapsedNs / NS_PER_SECOND, strikesReplayed * NS_PER_SECOND / max(1, elapsedNs)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
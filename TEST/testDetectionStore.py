@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  check our packed DetectionStore against a plain deque of tuples: random appends
+#   (some with 127+ strikes or energies beyond 21 bits, some after gaps of days so our
+#   base time has to move) and ageing, every detection must come back exactly.
+#
+#  usage: testDetectionStore.py [-o operations] [-s seed]
+#
+import os
+import sys
+import random
+import argparse
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.detections import DetectionStore, MAX_STRIKE_COUNT
+from lightning.distances import DISTANCE_VALUES, distance_from_value
+
+script_name = 'testDetectionStore.py'
+
+parser = argparse.ArgumentParser(description='DetectionStore packing test')
+parser.add_argument("-o", "--operations", help="appends and removals", type=int, default=200000)
+parser.add_argument("-s", "--seed", help="random seed", type=int, default=1)
+parse_args = parser.parse_args()
+
+NS_PER_HOUR = 3600 * 1000000000
+
+generator = random.Random(parse_args.seed)
+store = DetectionStore(4)
+model = deque()
+mismatches = 0
+timestamp = generator.randrange(1 << 40)
+
+def randomDetection():
+    global timestamp
+    roll = generator.random()
+    if roll < 0.0005:
+        timestamp += generator.randrange(1, 100 * NS_PER_HOUR)     # a gap: our base time must move
+    elif roll > 0.02:
+        timestamp += generator.randrange(1, 4000000000)
+    energy = generator.randrange(1 << 21) if generator.random() > 0.01 else generator.randrange(1 << 21, 1 << 32)
+    strikeCount = 1 if generator.random() > 0.1 else generator.randrange(2, 200000)
+    distance = distance_from_value(generator.choice(DISTANCE_VALUES))
+    return (timestamp, energy, distance, strikeCount)
+
+for operation in range(parse_args.operations):
+    if len(model) > 0 and generator.random() < 0.45:
+        if store.popleft() != model.popleft():
+            mismatches += 1
+        continue
+    (detectionTime, energy, distance, strikeCount) = randomDetection()
+    # (a window spans minutes: drop what a gap would have aged out)
+    while len(model) > 0 and detectionTime - model[0][0] >= 70 * NS_PER_HOUR:
+        model.popleft()
+        store.popleft()
+    store.append(detectionTime, energy, distance, strikeCount)
+    model.append((detectionTime, energy, distance, min(strikeCount, MAX_STRIKE_COUNT)))
+    if operation % 997 == 0:
+        if list(store) != list(model) or store.oldest_timestamp() != model[0][0]:
+            mismatches += 1
+        index = generator.randrange(len(model))
+        record = store.record(index)
+        if (record.timestamp, record.energy, record.distance, record.strikeCount) != model[index]:
+            mismatches += 1
+    if operation % 50021 == 0:
+        store.clear()
+        model.clear()
+
+if list(store) != list(model):
+    mismatches += 1
+print('{}: {} operations, {} held at the end (capacity {}), {} mismatches'.format(script_name, parse_args.operations, len(store), store.capacity, mismatches))
+sys.exit(0 if mismatches == 0 else 1)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  check that our storm trend weighs each detection by the strikes it stands for: a
+#   detection of many strikes must pull the fitted line as that many single strikes
+#   would (and must move it in decay mode too), and ageing it out of our window must
+#   take back all of its weight.
+#
+#  usage: testDistanceTrend.py [-c strike-count]
+#
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.accumulator import StormAccumulator
+from lightning.clock import NS_PER_SECOND
+from lightning.trend import DistanceTrend
+
+script_name = 'testDistanceTrend.py'
+
+parser = argparse.ArgumentParser(description='Storm trend weighting test')
+parser.add_argument("-c", "--strike-count", help="strikes our last detection stands for", type=int, default=5)
+parse_args = parser.parse_args()
+
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+
+# an approaching storm, a detection a minute: (minute, distance)
+DETECTIONS = ((1, 40), (2, 34), (3, 27), (4, 24), (5, 20))
+
+def approachSpeed(trend, minute):
+    return trend.estimate(minute * 60)[0]
+
+def accumulatorSpeed(lastStrikeCount, decay=False):
+    accumulator = StormAccumulator(10, 5, 30)
+    if decay:
+        accumulator.enable_decay(3600)
+    for (minute, distance) in DETECTIONS:
+        strikeCount = lastStrikeCount if minute == DETECTIONS[-1][0] else 1
+        accumulator.accumulate(minute * NS_PER_MINUTE, 1000, distance, strikeCount)
+    return approachSpeed(accumulator.distanceTrend, DETECTIONS[-1][0])
+
+def expandedSpeed(lastStrikeCount):
+    # as if each of our last detection's strikes had been a detection of its own
+    trend = DistanceTrend()
+    for (minute, distance) in DETECTIONS:
+        for strike in range(lastStrikeCount if minute == DETECTIONS[-1][0] else 1):
+            trend.add(minute * 60, distance)
+    return approachSpeed(trend, DETECTIONS[-1][0])
+
+def agedOutSpeeds():
+    # our multi-strike detection first, then ageing it out must leave the trend of the rest
+    accumulator = StormAccumulator(10, 5, 30)
+    accumulator.accumulate(0, 1000, 5, parse_args.strike_count)
+    for (minute, distance) in DETECTIONS:
+        accumulator.accumulate((minute + 9) * NS_PER_MINUTE, 1000, distance, 1)
+    accumulator.ageDetections((DETECTIONS[-1][0] + 9) * NS_PER_MINUTE + 1)
+    trend = DistanceTrend()
+    for (minute, distance) in DETECTIONS:
+        trend.add((minute + 9) * 60, distance)
+    return (approachSpeed(accumulator.distanceTrend, DETECTIONS[-1][0] + 9), approachSpeed(trend, DETECTIONS[-1][0] + 9))
+
+failures = 0
+def report(name, passed):
+    global failures
+    print('- {}: {}'.format(name, 'ok' if passed else 'FAILED'))
+    if not passed:
+        failures += 1
+
+print('{}: last detection of {} strikes'.format(script_name, parse_args.strike_count))
+(single, weighted) = (accumulatorSpeed(1), accumulatorSpeed(parse_args.strike_count))
+print('  approach {:.1f} km/h with 1 strike, {:.1f} km/h with {}'.format(single, weighted, parse_args.strike_count))
+report('a multi-strike detection changes the slope', abs(weighted - single) > 0.1)
+report('weighted as its strikes', abs(weighted - expandedSpeed(parse_args.strike_count)) < 1e-6)
+report('a multi-strike detection changes the slope, decay mode', abs(accumulatorSpeed(parse_args.strike_count, decay=True) - accumulatorSpeed(1, decay=True)) > 0.1)
+(aged, rest) = agedOutSpeeds()
+report('ageing out takes back all its weight', abs(aged - rest) < 1e-6)
+sys.exit(0 if failures == 0 else 1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  stress our EventQueue: several producer threads (like our IRQ edge callback,
+#   safety poll and period timer) push events at a fixed total rate plus a burst,
+#   a single worker consumes them.  Verifies that no event is lost or reordered.
+#
+#  usage: testEventQueue.py [-r events-per-second] [-s seconds] [-p producers] [-b burst]
+#
+import os
+import sys
+import argparse
+import threading
+from time import perf_counter, perf_counter_ns, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.events import EventQueue, DetectorEvent, SOURCE_EDGE, SOURCE_POLL, SOURCE_TIMER
+
+script_name = 'testEventQueue.py'
+
+parser = argparse.ArgumentParser(description='Event queue stress test')
+parser.add_argument("-r", "--rate", help="total events per second", type=int, default=1000)
+parser.add_argument("-s", "--seconds", help="seconds to run", type=int, default=10)
+parser.add_argument("-p", "--producers", help="number of producer threads", type=int, default=3)
+parser.add_argument("-b", "--burst", help="events pushed back-to-back at the end", type=int, default=500)
+parser.add_argument("-q", "--queue-size", help="event queue size", type=int, default=1024)
+parse_args = parser.parse_args()
+
+SOURCES = (SOURCE_EDGE, SOURCE_POLL, SOURCE_TIMER)
+
+events = EventQueue(parse_args.queue_size)
+lastSeen = {}           # producer -> last sequence seen by our worker
+outOfOrder = [0]
+latencyNs = [0, 0]      # sum, max
+
+def handler(event):
+    # simulate a little work (the real handler reads the detector and publishes)
+    (producer, sequence) = event.data
+    if sequence != lastSeen.get(producer, -1) + 1:
+        outOfOrder[0] += 1
+    lastSeen[producer] = sequence
+    elapsedNs = perf_counter_ns() - event.edge_ns
+    latencyNs[0] += elapsedNs
+    latencyNs[1] = max(latencyNs[1], elapsedNs)
+
+def producer(producerId, count, interval):
+    nextTime = perf_counter()
+    for sequence in range(count):
+        events.put(DetectorEvent(SOURCES[producerId % len(SOURCES)], producerId, perf_counter_ns(), (producerId, sequence)))
+        nextTime += interval
+        delay = nextTime - perf_counter()
+        if delay > 0:
+            sleep(delay)
+    return count
+
+perProducer = (parse_args.rate * parse_args.seconds) // parse_args.producers
+interval = parse_args.producers / parse_args.rate
+
+events.start_worker(handler)
+print('{}: {} producers, {} events/s for {} seconds, then a burst of {}'.format(script_name, parse_args.producers, parse_args.rate, parse_args.seconds, parse_args.burst))
+threads = [threading.Thread(target=producer, args=(index, perProducer, interval)) for index in range(parse_args.producers)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+burstId = parse_args.producers
+producer(burstId, parse_args.burst, 0)
+events.stop_worker(10.0)
+
+sent = perProducer * parse_args.producers + parse_args.burst
+print('- sent={} processed={} dropped={} out-of-order={} high-water={}'.format(sent, events.processed_count, events.dropped_count, outOfOrder[0], events.high_water))
+if events.processed_count > 0:
+    print('- queue latency: avg={:.1f}us max={:.1f}us'.format(latencyNs[0] / events.processed_count / 1000.0, latencyNs[1] / 1000.0))
+if events.processed_count != sent or events.dropped_count != 0 or outOfOrder[0] != 0:
+    print('FAILED')
+    sys.exit(1)
+print('PASSED')
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  our test files (-t) give distances as floats (e.g. 31.0, 63.0 = out of range):
+#   feed such strikes through StormAccumulator the ways our daemon does and check
+#   that each is held as the detector would report it (whole km, None if out of range)
+#   and reaches our rollup store and journal, even when another sink fails.
+#
+#  usage: testFloatDistances.py [-s strikes]
+#
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.accumulator import StormAccumulator
+from lightning.clock import NS_PER_SECOND
+from lightning.distances import DISTANCE_VALUES
+from lightning.rollup import RollupStore
+from lightning.journal import StrikeJournal
+
+script_name = 'testFloatDistances.py'
+
+parser = argparse.ArgumentParser(description='Float distance (test file) handling test')
+parser.add_argument("-s", "--strikes", help="strikes fed to each check", type=int, default=200)
+parse_args = parser.parse_args()
+
+def floatStrikes():
+    # a strike every 5 seconds cycling through every distance the detector reports, as floats
+    for index in range(parse_args.strikes):
+        yield ((index + 1) * 5 * NS_PER_SECOND, 1000 + index, float(DISTANCE_VALUES[index % len(DISTANCE_VALUES)]))
+
+def expectedDistances():
+    return list(None if distance == 63.0 else int(distance) for (timestamp, energy, distance) in floatStrikes())
+
+def heldDistances(accumulator):
+    return list(distance for (timestamp, energy, distance, count) in accumulator.accumulatedDetections)
+
+def checkFullRate():
+    # full-rate: every strike waits in our capture ring until a 'detect' is due
+    accumulator = StormAccumulator(60, 5, 60, full_rate=True)
+    for (timestamp, energy, distance) in floatStrikes():
+        accumulator.add_strike(timestamp, energy, distance)
+    accumulator.flush(timestamp, force=True)
+    return heldDistances(accumulator) == expectedDistances()
+
+def checkCoalesced():
+    accumulator = StormAccumulator(60, 5, 60)
+    for (timestamp, energy, distance) in floatStrikes():
+        accumulator.add_strike(timestamp, energy, distance)
+    return heldDistances(accumulator) == expectedDistances()
+
+def checkRollup(full_rate):
+    # our rollup store packs distances as bytes: every strike must reach it
+    with tempfile.TemporaryDirectory() as storeDir:
+        store = RollupStore(os.path.join(storeDir, 'rollup.dat'), 5)
+        accumulator = StormAccumulator(60, 5, 60, full_rate=full_rate)
+        accumulator.strike_sinks.append(store)
+        for (timestamp, energy, distance) in floatStrikes():
+            accumulator.add_strike(timestamp, energy, distance)
+        accumulator.flush(timestamp, force=True)
+        strikes = 0
+        distances = set()
+        for (slotStart, entries) in store.slots('minute'):
+            for (count, energySum, minDistance, maxDistance) in entries:
+                strikes += count
+                distances.update((minDistance, maxDistance))
+        store.close()
+    expected = expectedDistances()
+    return strikes == len(expected) and distances <= set(expected) | {None}
+
+class FailingSink:
+    def add_strike(self, seconds, ring_index, energy, distance, count=1):
+        raise OSError('No space left on device')
+
+def checkJournal(full_rate):
+    # ...as does our journal, and a sink failing ahead of it costs neither it nor our storm the strike
+    with tempfile.TemporaryDirectory() as journalDir:
+        journal = StrikeJournal(os.path.join(journalDir, 'strikes.dat'))
+        accumulator = StormAccumulator(60, 5, 60, full_rate=full_rate)
+        accumulator.strike_sinks.append(FailingSink())
+        accumulator.strike_sinks.append(journal)
+        for (timestamp, energy, distance) in floatStrikes():
+            accumulator.add_strike(timestamp, energy, distance)
+        accumulator.flush(timestamp, force=True)
+        journalled = list(distance for (seconds, energy, distance, count) in journal.strikes())
+        journal.close()
+    return journalled == expectedDistances() and heldDistances(accumulator) == journalled and accumulator.accumulatorStormLastStrike == timestamp
+
+CHECKS = (('full-rate capture', checkFullRate), ('coalesced', checkCoalesced),
+          ('rollup store, full-rate', lambda: checkRollup(True)), ('rollup store, coalesced', lambda: checkRollup(False)),
+          ('journal, full-rate', lambda: checkJournal(True)), ('journal, coalesced', lambda: checkJournal(False)))
+
+print('{}: {} strikes per check'.format(script_name, parse_args.strikes))
+failures = 0
+for (name, check) in CHECKS:
+    try:
+        passed = check()
+    except Exception as e:
+        print('- {}: FAILED ({}: {})'.format(name, type(e).__name__, e))
+        failures += 1
+        continue
+    print('- {}: {}'.format(name, 'ok' if passed else 'FAILED'))
+    if not passed:
+        failures += 1
+sys.exit(0 if failures == 0 else 1)
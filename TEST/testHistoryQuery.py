@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  check our HistoryQuery: a bad request must be refused (ValueError) when it is made,
+#   before any page is produced (our MQTT and HTTP handlers only catch it there), and a
+#   good one must page through every row of a rollup store and journal filled with strikes.
+#   Over HTTP (our MetricsServer) a bad request must get a 400.
+#
+#  usage: testHistoryQuery.py [-s strikes] [-p page-size]
+#
+import os
+import sys
+import argparse
+import tempfile
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lightning.history import HistoryQuery, request_from_query_string
+from lightning.journal import StrikeJournal
+from lightning.rollup import RollupStore
+from lightning.metrics import MetricsRegistry, MetricsServer
+
+script_name = 'testHistoryQuery.py'
+
+parser = argparse.ArgumentParser(description='History query test')
+parser.add_argument("-s", "--strikes", help="strikes in our store and journal", type=int, default=500)
+parser.add_argument("-p", "--page-size", help="rows per page", type=int, default=7)
+parse_args = parser.parse_args()
+
+START_SECONDS = 1700000000.0    # 2023-11-14 22:13:20 UTC
+
+BAD_REQUESTS = (
+    {'query': 'rings', 'resolution': 'week'},
+    {'query': 'rings', 'start': 'yesterday'},
+    {'query': 'rings', 'start': START_SECONDS + 60, 'end': START_SECONDS},
+    {'query': 'strikes', 'min_km': 'near'},
+    {'query': 'storms'},
+    {'query': 'rings', 'start': None},
+    {'query': 'rings', 'end': [START_SECONDS]},
+    {'query': 'rings', 'resolution': 60},
+    {'query': 'rings', 'page_size': {}},
+    {'query': 'rings', 'page_size': 'inf'},
+    {'query': 'strikes', 'max_km': True},
+    {'query': ['rings']},
+)
+
+def refusedWhenMade(history, request):
+    try:
+        history.pages(request)
+    except ValueError:
+        return True
+    return False
+
+def httpStatus(history, query):
+    # as our daemon's historyRoute()
+    def historyRoute(queryString):
+        try:
+            pages = history.pages(request_from_query_string(queryString))
+        except ValueError as e:
+            return ('application/json', '{{"error": "{}"}}'.format(e), 400)
+        return ('application/x-ndjson', ('{}\n'.format(page['page']) for page in pages))
+    server = MetricsServer(MetricsRegistry(), '127.0.0.1', 0)
+    server.add_route('/history', historyRoute)
+    server.start()
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:{}/history?{}'.format(server.httpd.server_address[1], query)) as reply:
+            reply.read()
+            return reply.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    finally:
+        server.stop()
+
+def pagedRows(history, request):
+    rows = 0
+    pages = list(history.pages(request))
+    for (pageNumber, page) in enumerate(pages):
+        if page['page'] != pageNumber or page['last'] != (pageNumber == len(pages) - 1) or len(page['rows']) > parse_args.page_size:
+            return -1
+        rows += len(page['rows'])
+    return rows
+
+failures = 0
+def report(name, passed):
+    global failures
+    print('- {}: {}'.format(name, 'ok' if passed else 'FAILED'))
+    if not passed:
+        failures += 1
+
+print('{}: {} strikes, {} rows per page'.format(script_name, parse_args.strikes, parse_args.page_size))
+with tempfile.TemporaryDirectory() as storeDir:
+    rollup = RollupStore(os.path.join(storeDir, 'rollup.dat'), 5)
+    journal = StrikeJournal(os.path.join(storeDir, 'strikes.dat'))
+    for index in range(parse_args.strikes):
+        # a strike every 10 seconds, one minute slot per 6 strikes
+        (seconds, distance) = (START_SECONDS + index * 10, (5, 14, 27, None)[index % 4])
+        rollup.add_strike(seconds, 1 if distance is not None else rollup.out_of_range_index(), 1000, distance)
+        journal.add_strike(seconds, 1, 1000, distance)
+    history = HistoryQuery(rollup, journal)
+
+    for request in BAD_REQUESTS:
+        report('refused {}'.format(request), refusedWhenMade(history, request))
+    report('refused rings without a rollup store', refusedWhenMade(HistoryQuery(None, journal), {'query': 'rings'}))
+    report('HTTP 400 for a bad resolution', httpStatus(history, 'query=rings&resolution=week') == 400)
+    report('HTTP 200 for a good query', httpStatus(history, 'query=strikes&page_size=50') == 200)
+
+    minutes = (parse_args.strikes * 10 + 59) // 60
+    for resolution in ('minute', 'hour', 'day'):
+        rows = pagedRows(history, {'query': 'rings', 'resolution': resolution, 'page_size': parse_args.page_size})
+        report('rings by {} ({} rows)'.format(resolution, rows), rows > 0 and (resolution != 'minute' or rows == minutes))
+    rows = pagedRows(history, {'query': 'strikes', 'page_size': parse_args.page_size})
+    report('strikes ({} rows)'.format(rows), rows == parse_args.strikes)
+    rows = pagedRows(history, {'query': 'strikes', 'min_km': 10, 'max_km': 20, 'page_size': parse_args.page_size})
+    report('strikes 10-20 km ({} rows)'.format(rows), rows == (parse_args.strikes + 2) // 4)
+    rollup.close()
+    journal.close()
+sys.exit(0 if failures == 0 else 1)
@@ -0,0 +1,921 @@
+"""
+    StormAccumulator - our strike accumulator (the "rings"), period and storm tracking
+
+    Fed lightning detections and period-timer expirations it decides what needs to be
+    reported and builds the 'crings' and 'prings' payloads.  It owns no threads or timers
+    and takes every timestamp from its caller so the daemon can drive it from its single
+    event worker (which then owns all of this state) and tools can drive it from a
+    virtual clock.  Timestamps are monotonic perf_counter_ns() integers, our WallClock
+    turns them into wall-clock time only for reporting.
+"""
+from collections import OrderedDict, namedtuple
+from time import perf_counter_ns
+
+from .capture import StrikeRing
+from .cells import CellTracker
+from .clock import WallClock, NS_PER_SECOND, NS_PER_MINUTE
+from .decay import DecayingSums
+from .detections import DetectionStore
+from .distances import DISTANCE_VALUES, DISTANCE_OUT_OF_RANGE, detector_distance
+from .histogram import StrikeHistogram, ENERGY_BIN_FLOORS
+from .quantiles import EnergySketch
+from .trend import DistanceTrend
+from .windows import WindowSums
+from .trace import STAGE_ACCUMULATE, STAGE_REBUILD
+
+# report kinds (the MQTT topic each goes to)
+REPORT_DETECT = 'detect'
+REPORT_CURRENT_RINGS = 'crings'
+REPORT_PAST_RINGS = 'prings'
+REPORT_WINDOW_RINGS = 'crings_window'   # data is (window_minutes, payload)
+REPORT_HISTOGRAM = 'histogram'
+REPORT_CELLS = 'cells'
+
+# kind: one of REPORT_*
+# data: for REPORT_DETECT a (timestamp_ns, energy, distance, strikeCount) tuple, for REPORT_WINDOW_RINGS
+#   a (window_minutes, payload) tuple, else the rings payload
+Report = namedtuple('Report', 'kind data')
+
+DISTANCE_AS_KM = 'km'
+DISTANCE_AS_MI = 'mi'
+
+# ring keys
+STRIKE_COUNT_KEY = 'count'
+DISTANCE_KEY = 'distance_km'
+FROM_SCALED_KEY = 'from_units'
+TO_SCALED_KEY = 'to_units'
+ENERGY_KEY = 'energy'
+TOTAL_ENERGY_KEY = 'total_energy'   #internal
+ACCUM_COUNT_KEY = 'accumulated_count'   #internal
+# top keys
+RING_PREFIX_KEY = 'ring'
+UNITS_KEY = 'units'
+PERIOD_IN_MINUTES_KEY = 'period_minutes'
+TIMESTAMP_KEY = 'timestamp'
+LAST_DETECT_KEY = 'last'
+FIRST_DETECT_KEY = 'first'
+STORM_LAST_DETECT_KEY = 'storm_last'
+STORM_FIRST_DETECT_KEY = 'storm_first'
+STORM_END_MINUTES_KEY = 'end_minutes'
+OUT_OF_RANGE_KEY = 'out_of_range'
+RING_COUNT_KEY = 'ring_count'
+RING_WIDTH_KEY = 'ring_width_km'
+APPROACH_SPEED_KEY = 'approach_speed'   # units per hour, negative when receding
+ETA_OVERHEAD_KEY = 'eta_overhead_minutes'
+TREND_CONFIDENCE_KEY = 'trend_confidence'
+ENERGY_MEDIAN_KEY = 'energy_median'     # optional, per ring
+ENERGY_P90_KEY = 'energy_p90'
+ENERGY_MAX_KEY = 'energy_max'
+RING_MODE_KEY = 'mode'
+HALF_LIFE_KEY = 'half_life_seconds'     # decay mode only
+
+# decay mode: a distance value whose detections have decayed below this is shown empty
+DECAYED_AWAY = 0.05
+
+# ring modes: our rings hold the detections of the last period, or exponentially decaying sums
+RING_MODE_WINDOW = 'window'
+RING_MODE_DECAY = 'decay'
+
+
+# histogram keys
+HISTOGRAM_TRIGGER_KEY = 'trigger'   # one of HISTOGRAM_ON_*
+HISTOGRAM_DISTANCES_KEY = 'distance_km'     # row labels (63 = out of range)
+HISTOGRAM_ENERGIES_KEY = 'energy_from'      # column labels (lowest energy of each)
+HISTOGRAM_WINDOW_KEY = 'window'     # window mode only
+HISTOGRAM_STORM_KEY = 'storm'
+HISTOGRAM_DETECTIONS_KEY = 'detections'
+HISTOGRAM_COUNTS_KEY = 'counts'     # [distance][energy]
+HISTOGRAM_ON_REQUEST = 'request'
+HISTOGRAM_ON_STORM_END = 'storm_end'
+
+# cell keys
+CELL_COUNT_KEY = 'cell_count'   # live cells
+CELLS_STARTED_KEY = 'cells_started'     # since we started
+CELL_LIST_KEY = 'cells'
+CELL_ID_KEY = 'id'      # (numbered afresh each storm)
+CELL_ACTIVE_KEY = 'active'  # False: ended since the last report (reported this once)
+CELL_DISTANCE_KEY = 'distance'  # in our units
+CELL_LIFETIME_KEY = 'lifetime_minutes'
+CELL_DETECTIONS_KEY = 'detections'
+
+# master list names
+CURR_RINGS_KEY = 'crings'
+PAST_RINGS_KEY = 'prings'
+HISTOGRAM_NAME_KEY = 'histogram'
+CELLS_NAME_KEY = 'cells'
+
+
+def windowRingsKey(window_minutes):
+    # e.g. 'crings_10m' (also the name of the window's topic)
+    return '{}_{}m'.format(CURR_RINGS_KEY, window_minutes)
+
+
+# strikes closer together than this are counted but not read
+COALESCE_SECONDS = 3
+
+# number of distance values
+MAX_DISTANCE_VALUES = 14
+
+distanceValueToIndexList = list(DISTANCE_VALUES)
+if len(distanceValueToIndexList) != 1 + MAX_DISTANCE_VALUES + 1:
+      raise TypeError("[CODE] the distanceValueToIndexList must have 16 entries!!  Aborting!")
+
+#  0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, OOR (out of range)
+#
+#  1, 5, 6, 8, 10, 12, 14, 17, 20, 24, 27, 31, 34, 37, 40, 63   # value from sensor
+#  0, 1, 2, 3, 4,  5,  6,  7,  8,  9,  10, 11, 12, 13, 14, 15   # our internal value
+#
+#  3-7 bins + overhead + OOR
+
+
+def _no_print_line(text, **kwargs):
+    pass
+
+
+class StormAccumulator:
+    def __init__(self, period_in_minutes, number_of_rings, end_storm_after_minutes, distance_as=DISTANCE_AS_KM, print_line=None,
+                 full_rate=False, detect_interval_seconds=COALESCE_SECONDS, capture_size=1024, clock=None):
+        """
+        :param period_in_minutes: (int) length of our sliding window of detections [2-10]
+        :param number_of_rings: (int) number of equal-width rings between 5 and 40 km [3-7]
+        :param end_storm_after_minutes: (int) quiet time after which the storm is considered over [10-60]
+        :param distance_as: (str, optional) units for our ring edges 'km' or 'mi'. Default = 'km'
+        :param print_line: (function, optional) our logging function (print_line(text, debug=True))
+        :param full_rate: (bool, optional) read and accumulate every strike instead of only counting
+                          those within COALESCE_SECONDS of the last. Default = False
+        :param detect_interval_seconds: (float, optional) full-rate: least time between 'detect' reports. Default = 3
+        :param capture_size: (int, optional) full-rate: strikes held between 'detect' reports. Default = 1024
+        :param clock: (WallClock, optional) turns our timestamps into wall-clock time. Default = local time
+        """
+        self.period_in_minutes = period_in_minutes
+        self.number_of_rings = number_of_rings
+        self.end_storm_after_minutes = end_storm_after_minutes
+        self.distance_as = distance_as
+        self.print_line = print_line if print_line is not None else _no_print_line
+        self.clock = clock if clock is not None else WallClock()
+        self.period_ns = period_in_minutes * NS_PER_MINUTE
+        # optional instrumentation (anything with an observe_ns() method)
+        self.bin_load_histogram = None
+        # optional long-term storage, each fed every accumulated strike
+        #  (anything with an add_strike(seconds, ring_index, energy, distance, count) method)
+        self.strike_sinks = []
+        # optional extra windows reported alongside our crings (a WindowSums)
+        self.windows = None
+        self.windows_minutes = []
+
+        self.accumulatedDetections = DetectionStore()  # sliding window of period strikes, new on tail, oldest evaporate from head at end of period
+        self.distanceTrend = DistanceTrend()  # regression of distance vs. time over our window
+        self.energySketches = None  # optional per ring energy quantiles over our window
+        self.decayingSums = None    # decay mode: our rings' decaying sums (and no window of detections)
+        self.trendUpdated = None    # decay mode: when our trend was last decayed
+        self.windowHistogram = None # optional distance x energy histograms of our window...
+        self.stormHistogram = None  #  ...and of the whole storm
+        self.cellTracker = None     # optional storm cells
+        self.accumulatorBins = []        # our rings (bins)
+        self.accumulatorLastStrike = ''  # earliest detection timestamp (this period)
+        self.accumulatorFirstStrike = ''  # latest detection timestamp (this period)
+        self.accumulatorStormLastStrike = ''  # earliest detection timestamp (whole storm)
+        self.accumulatorStormFirstStrike = ''  # latest detection timestamp (whole storm)
+        self.accumulatorOutOfRangeCount = 0
+        self.accumulatorBinDistances = []
+        self.binIndexesForThisRun = list(( 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14 ))
+
+        self.first_alert = None
+        self.last_alert = None
+        self.strikes_since_last_alert = 0
+
+        # full-rate capture: strikes wait in our ring until the next 'detect' report is due
+        self.full_rate = full_rate
+        self.detect_interval_ns = int(detect_interval_seconds * NS_PER_SECOND)
+        self.captured = StrikeRing(capture_size) if full_rate else None
+        self.pending_detect = None  # (timestamp, energy, distance) of the newest captured strike
+        self.last_detect = None     # when our last 'detect' was reported
+        # when the current period ends (None while no storm is active)
+        self.period_deadline = None
+        # when our extra windows next need refreshing (None while they hold no strikes)
+        self.windows_deadline = None
+
+        self.resetAccumulatorToEmpty()
+        self.calculate_ring_widths()
+
+    def add_windows(self, windows_minutes):
+        """
+        Also report rings over these window lengths (e.g. [2, 10, 60]) with each crings
+
+        :param windows_minutes: (list) the window lengths in minutes
+        """
+        self.windows = WindowSums(windows_minutes)
+        self.windows_minutes = list(windows_minutes)
+        self.strike_sinks.append(self.windows)
+
+    def enable_energy_quantiles(self):
+        """
+        Also report the median, P90 and max energy of each ring in our crings and prings
+        """
+        self.energySketches = list( EnergySketch() for i in list(range(self.number_of_rings + 1)) )
+        for (timestamp, energy, distance, strikeCount) in self.accumulatedDetections:
+            self.sketchAdd(energy, distance)
+
+    def enable_decay(self, half_life_seconds):
+        """
+        Report exponentially decaying rings instead of those of our period window: each
+        strike's weight halves every half_life_seconds and no detections are held.  Periods
+        still snap (prings) and storms still end as before.
+
+        :param half_life_seconds: (float) time for a strike's weight to halve
+        """
+        self.decayingSums = DecayingSums(half_life_seconds)
+        self.windowHistogram = None     # (we have no window)
+        for (timestamp, energy, distance, strikeCount) in self.accumulatedDetections:
+            self.decayingSums.add(timestamp, energy, distance, strikeCount)
+        self.accumulatedDetections.clear()
+        self.trendUpdated = self.decayingSums.last_strike
+
+    def enable_histograms(self):
+        """
+        Also count detections by distance value and energy, over our window and the whole
+        storm (see report_histogram(), the storm's is also reported when it ends)
+        """
+        self.stormHistogram = StrikeHistogram()
+        if self.decayingSums is None:
+            self.windowHistogram = StrikeHistogram()
+            for (timestamp, energy, distance, strikeCount) in self.accumulatedDetections:
+                self.windowHistogram.add(energy, distance)
+                self.stormHistogram.add(energy, distance)
+
+    def enable_cells(self, max_cells, gate_km, end_after_seconds):
+        """
+        Also split our storm into cells by distance, reported (REPORT_CELLS) with each crings
+
+        :param max_cells: (int) most cells tracked at once
+        :param gate_km: (float) a strike joins a cell at most this far from it
+        :param end_after_seconds: (int) a cell ends after this long without strikes
+        """
+        self.cellTracker = CellTracker(max_cells, gate_km, end_after_seconds)
+
+    def ring_mode(self):
+        """
+        :return: (str) RING_MODE_WINDOW or RING_MODE_DECAY
+        """
+        return RING_MODE_WINDOW if self.decayingSums is None else RING_MODE_DECAY
+
+    def reconfigure(self, timestamp, period_in_minutes, number_of_rings, end_storm_after_minutes, distance_as):
+        """
+        Take on new settings without losing our window: the rings are rebuilt for the new
+        geometry and the detections we hold re-binned into them.  A running period keeps its
+        start (so a shorter period may already be over, our caller's timer will tell us).
+
+        :param timestamp: (int) now (perf_counter_ns())
+        :return: (list) of Report to be published, in order (our crings in the new geometry if a storm is active)
+        """
+        self.period_in_minutes = period_in_minutes
+        self.end_storm_after_minutes = end_storm_after_minutes
+        self.distance_as = distance_as
+        newPeriodNs = period_in_minutes * NS_PER_MINUTE
+        if self.period_deadline is not None:
+            self.period_deadline += newPeriodNs - self.period_ns
+        self.period_ns = newPeriodNs
+
+        if number_of_rings != self.number_of_rings:
+            self.number_of_rings = number_of_rings
+            self.calculate_ring_widths()
+            self.resetAccumulatorToEmpty()
+            if self.energySketches is not None:
+                self.enable_energy_quantiles()  # re-sorts our window's energies into the new rings
+
+        if not self.storm_active():
+            return []
+        self.removeOldDetections(timestamp)    # the period may now be shorter
+        return self.report_current_rings(timestamp)
+
+    # ------ STORM / PERIOD TRACKING ------ #
+
+    def storm_active(self):
+        """
+        :return: (bool) whether we are inside a storm (and so our period timer should be running)
+        """
+        return self.period_deadline is not None
+
+    def timer_deadline(self):
+        """
+        :return: (int/None) when our period timer should next expire (perf_counter_ns()): the end of
+                 our period or, if sooner, the next refresh of our extra windows (None if neither)
+        """
+        deadlines = list(deadline for deadline in (self.period_deadline, self.windows_deadline) if deadline is not None)
+        return min(deadlines) if len(deadlines) > 0 else None
+
+    def timer_is_for_windows(self):
+        """
+        :return: (bool) whether our period timer next expires to refresh our extra windows, not to end our period
+        """
+        return self.windows_deadline is not None and (self.period_deadline is None or self.windows_deadline < self.period_deadline)
+
+    def strike_is_coalesced(self, timestamp):
+        """
+        Called for each lightning interrupt before its distance and energy are read. Starts our
+        storm (and period) if this is the first strike. Strikes following the last alert too
+        closely are only counted.
+
+        :param timestamp: (int) when the strike happened (perf_counter_ns())
+        :return: (bool) True if the strike was counted and should not be read
+        """
+        if self.period_deadline is None:
+            self.period_deadline = timestamp + self.period_ns  # start our period
+            self.first_alert = timestamp # remember when storm first started
+        if self.full_rate:
+            return False    # every strike gets read
+        if self.last_alert is not None and timestamp - self.last_alert < COALESCE_SECONDS * NS_PER_SECOND:
+            self.strikes_since_last_alert += 1
+            return True
+        return False
+
+    def add_strike(self, timestamp, energy, distance, trace=None):
+        """
+        Accumulate a detection whose distance and energy have been read
+
+        :param timestamp: (int) when the strike happened (perf_counter_ns())
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range),
+                         a float (as read from a test file) is taken as its whole km
+        :param trace: (InterruptTrace, optional) stamped as we accumulate and rebuild our rings
+        :return: (list) of Report to be published, in order
+        """
+        distance = detector_distance(distance)
+        if self.full_rate:
+            return self.capture_strike(timestamp, energy, distance, trace)
+        reports = []
+        self.strikes_since_last_alert += 1
+
+        # if we are past the end of this period then snap it and start accumulating all over
+        if self.last_alert is not None and timestamp - self.last_alert > self.period_ns:
+            self.print_line('Period ended, with detection in hand... reporting past first...')
+            reports.append(self.report_past_accumulator(timestamp))
+            self.strikes_since_last_alert = 1    # reset this since count just reported
+            self.period_deadline = timestamp + self.period_ns  # RESET so it doesn't expire for another 'period_in_minutes'
+
+        # ok, report our new detection
+        reports.append(Report(REPORT_DETECT, (timestamp, energy, distance, self.strikes_since_last_alert)))
+        #  and let's accumulate this detection
+        self.accumulate(timestamp, energy, distance, self.strikes_since_last_alert)
+        if trace is not None:
+            trace.mark(STAGE_ACCUMULATE, perf_counter_ns())
+        reports.extend(self.report_current_rings(timestamp))
+        if trace is not None:
+            trace.mark(STAGE_REBUILD, perf_counter_ns())
+        # setup for next...
+        self.strikes_since_last_alert = 0
+        # remember when most recent strike from this storm happened
+        self.last_alert = timestamp
+        return reports
+
+    def capture_strike(self, timestamp, energy, distance, trace=None):
+        """
+        Full-rate: hold this strike in our capture ring, accumulating and reporting
+        (at most once per detect interval) the strikes held so far
+
+        :return: (list) of Report to be published, in order (empty until a 'detect' is due)
+        """
+        self.captured.append(timestamp, energy, distance)
+        self.strikes_since_last_alert += 1
+        self.pending_detect = (timestamp, energy, distance)
+        return self.flush(timestamp, trace)
+
+    def flush(self, timestamp, trace=None, force=False):
+        """
+        Full-rate: once the detect interval has passed, accumulate the captured strikes and
+        report the newest (with the count of strikes since the last 'detect') and our rings
+
+        :param timestamp: (int) now (perf_counter_ns())
+        :param force: (bool, optional) don't wait for the detect interval. Default = False
+        :return: (list) of Report to be published, in order (empty if nothing is due)
+        """
+        if self.pending_detect is None:
+            return []
+        if not force and self.last_detect is not None and timestamp - self.last_detect < self.detect_interval_ns:
+            return []
+        reports = []
+        for (strikeTime, energy, distance) in self.captured.drain():
+            # if we are past the end of this period then snap it and start accumulating all over
+            if self.last_alert is not None and strikeTime - self.last_alert > self.period_ns:
+                self.print_line('Period ended, with detection in hand... reporting past first...')
+                reports.append(self.report_past_accumulator(strikeTime))
+                self.period_deadline = strikeTime + self.period_ns
+            self.admitDetection(strikeTime, energy, distance, 1)
+            if(self.accumulatorStormFirstStrike == ''):
+                self.accumulatorStormFirstStrike = strikeTime
+            self.accumulatorStormLastStrike = strikeTime
+            self.last_alert = strikeTime
+            self.record_strike(strikeTime, energy, distance, 1)
+        (detectTime, energy, distance) = self.pending_detect
+        self.removeOldDetections(detectTime)
+        if trace is not None:
+            trace.mark(STAGE_ACCUMULATE, perf_counter_ns())
+        reports.append(Report(REPORT_DETECT, (detectTime, energy, distance, self.strikes_since_last_alert)))
+        reports.extend(self.report_current_rings(detectTime))
+        if trace is not None:
+            trace.mark(STAGE_REBUILD, perf_counter_ns())
+        self.strikes_since_last_alert = 0
+        self.pending_detect = None
+        self.last_detect = detectTime
+        return reports
+
+    def period_ended(self, timestamp):
+        """
+        Our period timer expired: snap the period and start accumulating all over
+
+        :param timestamp: (int) now (perf_counter_ns())
+        :return: (list) of Report to be published, in order
+        """
+        reports = []
+        if self.full_rate:
+            reports.extend(self.flush(timestamp, force=True))
+        reports.append(self.report_past_accumulator(timestamp))
+        self.removeOldDetections(timestamp)
+        reports.extend(self.report_current_rings(timestamp))
+        # we snapped counters so reset count
+        self.strikes_since_last_alert = 0
+        if self.period_deadline is not None:
+            self.period_deadline = timestamp + self.period_ns
+        return reports
+
+    def check_storm_end(self, timestamp):
+        """
+        If no strike has been detected for end_storm_after_minutes, consider the storm finished
+
+        :param timestamp: (int) now (perf_counter_ns())
+        :return: (list) of Report to be published, in order (empty if the storm continues)
+        """
+        if self.last_alert is None or self.pending_detect is not None or timestamp - self.last_alert <= self.end_storm_after_minutes * NS_PER_MINUTE:
+            return []
+        reports = [self.report_past_accumulator(timestamp)]
+        self.removeOldDetections(timestamp)
+        if self.cellTracker is not None:
+            self.cellTracker.reset()     # (our crings now reports every cell ended)
+        reports.extend(self.report_current_rings(timestamp))
+        if self.stormHistogram is not None:
+            reports.append(self.report_histogram(timestamp, HISTOGRAM_ON_STORM_END))
+            self.stormHistogram.reset()
+        self.resetStormTracking()    # kill awareness of any storm
+        if self.decayingSums is not None:
+            # what remains of this storm's strikes would otherwise linger into the next
+            self.decayingSums.reset()
+            self.distanceTrend.reset()
+            self.trendUpdated = None
+        self.period_deadline = None   #  kill our period until our next detection
+        #  reset our indicators
+        self.strikes_since_last_alert = 0
+        self.last_alert = None
+        self.first_alert = None
+        self.last_detect = None
+        return reports
+
+    # ------ RING GEOMETRY ------ #
+
+    def calculate_ring_widths(self):
+        # place a zero for each bin we need
+        self.accumulatorBinDistances = list( 0 for i in list(range(self.number_of_rings + 1)) )  # n rings + 1 for "overhead" (out of range(63) is just counted)
+        #  ring 1 starts at 5km so subtract that initially but add it back in for each except overhead
+        binWidth = (40 - 5) / self.number_of_rings
+        for ringIndex in range(self.number_of_rings + 1):
+            if ringIndex == 0:
+                self.accumulatorBinDistances[ringIndex] = 0
+            else:
+                self.accumulatorBinDistances[ringIndex] = (binWidth * (ringIndex - 1)) + 5
+        # now set up distance to bin index array lookup table
+        for distanceIndex in range(MAX_DISTANCE_VALUES):    # 0-13
+            reportedDistance = distanceValueToIndexList[distanceIndex + 1]    # [5-40]
+            binIndex = 0
+            for ringIndex in range(self.number_of_rings + 1):    # [0,1-7 for 7 rings]
+                accumulatorDistance = self.accumulatorBinDistances[ringIndex]
+                if accumulatorDistance <= reportedDistance:
+                    binIndex = ringIndex
+                else:
+                    break   # stop, we have our answer
+            self.binIndexesForThisRun[distanceIndex] = binIndex
+
+    def binIndexFromDistance(self, distance):
+        try:
+            testDistance = distance
+            if distance == None:
+                testDistance = DISTANCE_OUT_OF_RANGE
+            # given distance determine index value for it... NOTE: 1=idx-0 and 63=idx-15
+            desiredBinIndex = distanceValueToIndexList.index(testDistance)
+            # if we have 1-14 let's translate it into a ring index value [1-[3-7]]
+            if desiredBinIndex > 0 and desiredBinIndex < 15:
+                desiredBinIndex = self.binIndexesForThisRun[desiredBinIndex - 1]
+        except ValueError:
+            raise TypeError("[CODE] WHAT?? Unexpected Value from detector[{}]!!  Aborting!".format(distance))
+        return desiredBinIndex
+
+    # ------ ACCUMULATION ------ #
+
+    def resetStormTracking(self):
+        self.accumulatorStormLastStrike = ''
+        self.accumulatorStormFirstStrike = ''
+        self.print_line('Removing all storm knowledge (reset)', debug=True)
+
+    def resetAccumulatorToEmpty(self):
+        # allocate an empty dictionary for each bin we need 0 + 1-[3-7] = [4-8 bins]
+        self.accumulatorBins = list( {} for i in list(range(self.number_of_rings + 1)) )  # n rings + 1 for "overhead" (out of range(63) is just counted)
+        # and reset these values
+        self.accumulatorOutOfRangeCount = 0
+        self.accumulatorLastStrike = ''
+        self.accumulatorFirstStrike = ''
+
+        # =========================================================================
+        #  we are moving to a new accumulation strategy
+        #   instead of accumulating directly into the bins we are going to keep
+        #   a moving window of strikes and push this moving window into the bins
+        #   only when we need to report the bin-set
+        #
+        #
+        # -------------------------------------------------------------------------
+    def ageDetections(self, timeNow):
+        # chase from oldest to youngest removing those too old, stop at the first young enough
+        orig_count = len(self.accumulatedDetections)
+        removed_count = 0
+        while len(self.accumulatedDetections) > 0 and timeNow - self.accumulatedDetections.oldest_timestamp() > self.period_ns:
+            (detectionTimestamp, energy, distance, strikeCount) = self.accumulatedDetections.popleft()
+            self.windowLeave(detectionTimestamp, energy, distance, strikeCount)
+            removed_count += 1
+
+        self.print_line('adjusted detection set: enter with {} , leave with {}, removed {}'.format(orig_count, len(self.accumulatedDetections), removed_count), debug=True)
+
+    def accumulate(self, timestamp, energy, distance, strikeCount):
+        # append this to our list then remove old (outside of period) detections from the list
+        self.admitDetection(timestamp, energy, distance, strikeCount)
+
+        if(self.accumulatorStormFirstStrike == ''):
+            self.accumulatorStormFirstStrike = timestamp
+
+        self.accumulatorStormLastStrike = timestamp
+
+        self.ageDetections(timestamp)
+        # our storm is up to date, now hand the strike to our sinks
+        self.record_strike(timestamp, energy, distance, strikeCount)
+
+    def record_strike(self, timestamp, energy, distance, strikeCount):
+        if len(self.strike_sinks) == 0:
+            return
+        ringIndex = self.binIndexFromDistance(distance)
+        if ringIndex == 15:   # out-of-range
+            ringIndex = self.number_of_rings + 1
+        seconds = self.clock.wall_seconds(timestamp)
+        for sink in self.strike_sinks:
+            # one failing sink (a full disk, a bad value) must not cost the others this strike
+            try:
+                sink.add_strike(seconds, ringIndex, energy, distance, strikeCount)
+            except Exception as e:
+                self.print_line('{} failed to record a strike: {}'.format(type(sink).__name__, e), warning=True)
+
+    def admitDetection(self, timestamp, energy, distance, strikeCount):
+        if self.cellTracker is not None:
+            self.cellTracker.add(timestamp, distance, strikeCount)
+        if self.stormHistogram is not None:
+            self.stormHistogram.add(energy, distance)
+        if self.decayingSums is None:
+            self.accumulatedDetections.append(timestamp, energy, distance, strikeCount)
+            self.windowEnter(timestamp, energy, distance, strikeCount)
+            return
+        # decay mode: nothing is held, our trend decays along with our rings
+        self.decayingSums.add(timestamp, energy, distance, strikeCount)
+        if distance is not None:
+            self.decayTrend(timestamp)
+            self.distanceTrend.add(timestamp / NS_PER_SECOND, distance, strikeCount)
+
+    def decayTrend(self, timestamp):
+        if self.trendUpdated is not None and timestamp > self.trendUpdated:
+            self.distanceTrend.decay(self.decayingSums.weight(timestamp - self.trendUpdated))
+        if self.trendUpdated is None or timestamp > self.trendUpdated:
+            self.trendUpdated = timestamp
+
+    def windowEnter(self, timestamp, energy, distance, strikeCount):
+        # a detection joined our sliding window (weighing in our trend as the strikes it stands for)
+        if distance is not None:    # out-of-range strikes tell us nothing about distance
+            self.distanceTrend.add(timestamp / NS_PER_SECOND, distance, strikeCount)
+        if self.energySketches is not None:
+            self.sketchAdd(energy, distance)
+        if self.windowHistogram is not None:
+            self.windowHistogram.add(energy, distance)
+
+    def windowLeave(self, timestamp, energy, distance, strikeCount):
+        # ...and aged out of it (always oldest first)
+        if distance is not None:
+            self.distanceTrend.remove(timestamp / NS_PER_SECOND, distance, strikeCount)
+        if self.energySketches is not None:
+            ringIndex = self.binIndexFromDistance(distance)
+            if ringIndex != 15:
+                self.energySketches[ringIndex].remove(energy)
+        if self.windowHistogram is not None:
+            self.windowHistogram.remove(energy, distance)
+
+    def sketchAdd(self, energy, distance):
+        ringIndex = self.binIndexFromDistance(distance)
+        if ringIndex != 15:   # not out-of-range
+            self.energySketches[ringIndex].add(energy)
+
+    def removeOldDetections(self, timeNow):
+        self.ageDetections(timeNow)
+        self.print_line('Removing old detections from set', debug=True)
+
+    def loadDetectionsIntoBins(self):
+        binLoadStartNs = perf_counter_ns()
+        # reset the current
+        self.resetAccumulatorToEmpty()
+
+        # our TUPLE is: (timestamp, energy, distance, strikeCount)
+        for currDetection in self.accumulatedDetections:
+            timestamp = currDetection[0]
+            energy = currDetection[1]
+            distance = currDetection[2]
+            strikeCount = currDetection[3]
+
+            # place earliest detection here
+            if self.accumulatorFirstStrike == '':
+                self.accumulatorFirstStrike = timestamp
+
+            # place latest detection here
+            self.accumulatorLastStrike = timestamp
+
+            # convert distance to bin index:
+            #   NOTE: 0 is overhead while 15 is 'out of range'
+            desiredBinIndex = self.binIndexFromDistance(distance)
+            if desiredBinIndex == 15:   # out-of-range
+                self.accumulatorOutOfRangeCount += 1
+            else:
+                desiredBin = self.accumulatorBins[desiredBinIndex]
+                if STRIKE_COUNT_KEY in desiredBin:
+                    currCount = desiredBin[STRIKE_COUNT_KEY]
+                else:
+                    currCount = 0
+                if TOTAL_ENERGY_KEY in desiredBin:
+                    currTotalEnergy = desiredBin[TOTAL_ENERGY_KEY]
+                else:
+                    currTotalEnergy = 0
+                if ACCUM_COUNT_KEY in desiredBin:
+                    currAccumCount = desiredBin[ACCUM_COUNT_KEY]
+                else:
+                    currAccumCount = 0
+
+                currTotalEnergy += energy
+                currAccumCount += 1
+                currCount += strikeCount
+
+                # real values for consumer
+                desiredBin[STRIKE_COUNT_KEY] = currCount
+                desiredBin[ENERGY_KEY] = int(currTotalEnergy / currAccumCount)
+                # internal values so we can accumulate correctly
+                desiredBin[TOTAL_ENERGY_KEY] = currTotalEnergy
+                desiredBin[ACCUM_COUNT_KEY] = currAccumCount
+
+        if self.bin_load_histogram is not None:
+            self.bin_load_histogram.observe_ns(perf_counter_ns() - binLoadStartNs)
+
+    def loadDecayedIntoBins(self, timestamp):
+        # decay mode: our rings from the decaying sums (counts to a tenth of a strike)
+        self.resetAccumulatorToEmpty()
+        (counts, detections, energies) = self.decayingSums.sums(timestamp)
+        for distanceIndex in range(len(distanceValueToIndexList)):
+            if detections[distanceIndex] < DECAYED_AWAY:
+                continue
+            binIndex = self.binIndexFromDistance(distanceValueToIndexList[distanceIndex])
+            if binIndex == 15:   # out-of-range
+                self.accumulatorOutOfRangeCount += detections[distanceIndex]
+                continue
+            desiredBin = self.accumulatorBins[binIndex]
+            desiredBin[STRIKE_COUNT_KEY] = desiredBin.get(STRIKE_COUNT_KEY, 0) + counts[distanceIndex]
+            desiredBin[TOTAL_ENERGY_KEY] = desiredBin.get(TOTAL_ENERGY_KEY, 0) + energies[distanceIndex]
+            desiredBin[ACCUM_COUNT_KEY] = desiredBin.get(ACCUM_COUNT_KEY, 0) + detections[distanceIndex]
+        for desiredBin in self.accumulatorBins:
+            if STRIKE_COUNT_KEY in desiredBin:
+                desiredBin[ENERGY_KEY] = int(desiredBin[TOTAL_ENERGY_KEY] / desiredBin[ACCUM_COUNT_KEY])
+                desiredBin[STRIKE_COUNT_KEY] = round(desiredBin[STRIKE_COUNT_KEY], 1)
+        self.accumulatorOutOfRangeCount = round(self.accumulatorOutOfRangeCount, 1)
+        if self.decayingSums.last_strike is not None:
+            self.accumulatorLastStrike = self.decayingSums.last_strike
+        self.decayTrend(timestamp)
+
+    def loadBins(self, timestamp):
+        if self.decayingSums is None:
+            self.loadDetectionsIntoBins()
+        else:
+            self.loadDecayedIntoBins(timestamp)
+
+    # ------ REPORTING ------ #
+
+    def getDictionaryForAccumulatorNamed(self, dictionaryName, current_timestamp):
+        # build a past dictionary and send it
+        tmpRingsDict = OrderedDict()
+
+        tmpRingsDict[TIMESTAMP_KEY] = self.clock.isoformat(current_timestamp)
+        if self.accumulatorLastStrike != '':
+            tmpRingsDict[LAST_DETECT_KEY] = self.clock.isoformat(self.accumulatorLastStrike)
+        if self.accumulatorFirstStrike != '':
+            tmpRingsDict[FIRST_DETECT_KEY] = self.clock.isoformat(self.accumulatorFirstStrike)
+        if self.accumulatorStormLastStrike != '':
+            tmpRingsDict[STORM_LAST_DETECT_KEY] = self.clock.isoformat(self.accumulatorStormLastStrike)
+        if self.accumulatorStormFirstStrike != '':
+            tmpRingsDict[STORM_FIRST_DETECT_KEY] = self.clock.isoformat(self.accumulatorStormFirstStrike)
+        tmpRingsDict[STORM_END_MINUTES_KEY] = self.end_storm_after_minutes
+        tmpRingsDict[PERIOD_IN_MINUTES_KEY] = self.period_in_minutes
+        tmpRingsDict[RING_MODE_KEY] = self.ring_mode()
+        if self.decayingSums is not None:
+            tmpRingsDict[HALF_LIFE_KEY] = self.decayingSums.half_life_seconds
+        tmpRingsDict[UNITS_KEY] = self.distance_as
+        tmpRingsDict[OUT_OF_RANGE_KEY] = self.accumulatorOutOfRangeCount
+        tmpRingsDict[RING_COUNT_KEY] = self.number_of_rings
+        tmpRingsDict[RING_WIDTH_KEY] = round((40 - 5) / self.number_of_rings, 1)
+
+        (distance_multiplier, minus_one_value) = self.distanceMultipliers()
+
+        # is the storm approaching? (None when we can't tell)
+        trend = self.distanceTrend.estimate(current_timestamp / NS_PER_SECOND)
+        if trend is None:
+            tmpRingsDict[APPROACH_SPEED_KEY] = None
+            tmpRingsDict[ETA_OVERHEAD_KEY] = None
+            tmpRingsDict[TREND_CONFIDENCE_KEY] = 0.0
+        else:
+            (approachSpeed, etaMinutes, confidence) = trend
+            tmpRingsDict[APPROACH_SPEED_KEY] = round(approachSpeed * distance_multiplier, 1)
+            tmpRingsDict[ETA_OVERHEAD_KEY] = None if etaMinutes is None else round(etaMinutes, 1)
+            tmpRingsDict[TREND_CONFIDENCE_KEY] = round(confidence, 2)
+
+        self.addRingsToDictionary(tmpRingsDict, self.accumulatorBins, distance_multiplier, minus_one_value, self.energySketches)
+
+        topRingsData = OrderedDict()
+        topRingsData[dictionaryName] = tmpRingsDict
+        return topRingsData
+
+    def distanceMultipliers(self):
+        if self.distance_as == DISTANCE_AS_KM:
+            return (1.0, 1.0 / 10.0)
+        # miles are shown in tenths
+        return (0.621371, 0.621371 / 10.0)
+
+    def addRingsToDictionary(self, tmpRingsDict, bins, distance_multiplier, minus_one_value, energySketches=None):
+        for ringIndex in range(self.number_of_rings + 1):
+            binForThisRing = bins[ringIndex]
+            singleRingData = OrderedDict()
+            if STRIKE_COUNT_KEY in binForThisRing:
+                singleRingData[STRIKE_COUNT_KEY] = binForThisRing[STRIKE_COUNT_KEY]
+            else:
+                singleRingData[STRIKE_COUNT_KEY] = 0
+            # dstance in km
+            singleRingData[DISTANCE_KEY] = round(self.accumulatorBinDistances[ringIndex], 1)
+            # distance in desired units
+            fromValue = self.accumulatorBinDistances[ringIndex] * distance_multiplier
+            if ringIndex < self.number_of_rings:
+                toValue = (self.accumulatorBinDistances[ringIndex + 1] * distance_multiplier) - minus_one_value
+            else:
+                toValue = 40 * distance_multiplier
+            # round the following to 1 decimal place...
+            singleRingData[FROM_SCALED_KEY] = round(fromValue, 1)
+            singleRingData[TO_SCALED_KEY] = round(toValue, 1)
+            if ENERGY_KEY in binForThisRing:
+                singleRingData[ENERGY_KEY] = binForThisRing[ENERGY_KEY]
+            else:
+                singleRingData[ENERGY_KEY] = 0
+            if energySketches is not None:
+                sketch = energySketches[ringIndex]
+                singleRingData[ENERGY_MEDIAN_KEY] = sketch.quantile(0.5)
+                singleRingData[ENERGY_P90_KEY] = sketch.quantile(0.9)
+                singleRingData[ENERGY_MAX_KEY] = sketch.maximum()
+            ringName = "ring{}".format(ringIndex)
+            tmpRingsDict[ringName] = singleRingData
+
+    def getDictionaryForWindow(self, window_minutes, current_timestamp):
+        # build the rings of one of our extra windows from its per distance value sums
+        #  (as our main rings: strikes counted, out of range detections counted, energy a mean per detection)
+        (counts, detections, energies) = self.windows.window_sums(window_minutes)
+        bins = list( {} for i in list(range(self.number_of_rings + 1)) )
+        outOfRangeCount = 0
+        for distanceIndex in range(len(distanceValueToIndexList)):
+            if detections[distanceIndex] == 0:
+                continue
+            binIndex = self.binIndexFromDistance(distanceValueToIndexList[distanceIndex])
+            if binIndex == 15:   # out-of-range
+                outOfRangeCount += detections[distanceIndex]
+                continue
+            desiredBin = bins[binIndex]
+            desiredBin[STRIKE_COUNT_KEY] = desiredBin.get(STRIKE_COUNT_KEY, 0) + counts[distanceIndex]
+            desiredBin[TOTAL_ENERGY_KEY] = desiredBin.get(TOTAL_ENERGY_KEY, 0) + energies[distanceIndex]
+            desiredBin[ACCUM_COUNT_KEY] = desiredBin.get(ACCUM_COUNT_KEY, 0) + detections[distanceIndex]
+        for desiredBin in bins:
+            if ACCUM_COUNT_KEY in desiredBin:
+                desiredBin[ENERGY_KEY] = int(desiredBin[TOTAL_ENERGY_KEY] / desiredBin[ACCUM_COUNT_KEY])
+
+        tmpRingsDict = OrderedDict()
+        tmpRingsDict[TIMESTAMP_KEY] = self.clock.isoformat(current_timestamp)
+        tmpRingsDict[PERIOD_IN_MINUTES_KEY] = window_minutes
+        tmpRingsDict[RING_MODE_KEY] = RING_MODE_WINDOW
+        tmpRingsDict[UNITS_KEY] = self.distance_as
+        tmpRingsDict[OUT_OF_RANGE_KEY] = outOfRangeCount
+        tmpRingsDict[RING_COUNT_KEY] = self.number_of_rings
+        tmpRingsDict[RING_WIDTH_KEY] = round((40 - 5) / self.number_of_rings, 1)
+        (distance_multiplier, minus_one_value) = self.distanceMultipliers()
+        self.addRingsToDictionary(tmpRingsDict, bins, distance_multiplier, minus_one_value)
+
+        topRingsData = OrderedDict()
+        topRingsData[windowRingsKey(window_minutes)] = tmpRingsDict
+        return topRingsData
+
+    def report_past_accumulator(self, current_timestamp):
+        # build a past dictionary
+        self.loadBins(current_timestamp)
+        return Report(REPORT_PAST_RINGS, self.getDictionaryForAccumulatorNamed(PAST_RINGS_KEY, current_timestamp))
+
+    def report_current_accumulator(self, current_timestamp):
+        # build a current dictionary
+        self.loadBins(current_timestamp)
+        return Report(REPORT_CURRENT_RINGS, self.getDictionaryForAccumulatorNamed(CURR_RINGS_KEY, current_timestamp))
+
+    def report_current_rings(self, current_timestamp):
+        # our crings followed by those of each extra window
+        reports = [self.report_current_accumulator(current_timestamp)]
+        reports.extend(self.report_windows(current_timestamp))
+        if self.cellTracker is not None:
+            reports.append(Report(REPORT_CELLS, self.getDictionaryForCells(current_timestamp)))
+        return reports
+
+    def report_windows(self, current_timestamp):
+        # the rings of each extra window, then when they next change (as their oldest strikes age out)
+        if self.windows is None:
+            return []
+        nowSeconds = self.clock.wall_seconds(current_timestamp)
+        self.windows.advance(nowSeconds)
+        reports = list(Report(REPORT_WINDOW_RINGS, (window_minutes, self.getDictionaryForWindow(window_minutes, current_timestamp))) for window_minutes in self.windows_minutes)
+        nextChange = self.windows.next_change()
+        if nextChange is None:
+            self.windows_deadline = None
+        else:
+            #  (a millisecond late so the wall clock is surely past the bucket edge)
+            self.windows_deadline = current_timestamp + int((nextChange - nowSeconds) * NS_PER_SECOND) + NS_PER_SECOND // 1000
+        return reports
+
+    def getDictionaryForCells(self, current_timestamp):
+        # each of our storm's cells, those just ended first
+        (distance_multiplier, minus_one_value) = self.distanceMultipliers()
+        cellList = []
+        for cell in self.cellTracker.take_cells(current_timestamp):
+            cellData = OrderedDict()
+            cellData[CELL_ID_KEY] = cell.cell_id
+            cellData[CELL_ACTIVE_KEY] = not cell.ended
+            cellData[FIRST_DETECT_KEY] = self.clock.isoformat(cell.first)
+            cellData[LAST_DETECT_KEY] = self.clock.isoformat(cell.last)
+            cellData[CELL_LIFETIME_KEY] = round((cell.last - cell.first) / NS_PER_MINUTE, 1)
+            cellData[STRIKE_COUNT_KEY] = cell.strike_count
+            cellData[CELL_DETECTIONS_KEY] = cell.detection_count
+            cellData[CELL_DISTANCE_KEY] = round(cell.distance * distance_multiplier, 1)
+            trend = cell.estimate(current_timestamp)
+            if trend is None:
+                cellData[APPROACH_SPEED_KEY] = None
+                cellData[ETA_OVERHEAD_KEY] = None
+                cellData[TREND_CONFIDENCE_KEY] = 0.0
+            else:
+                (approachSpeed, etaMinutes, confidence) = trend
+                cellData[APPROACH_SPEED_KEY] = round(approachSpeed * distance_multiplier, 1)
+                cellData[ETA_OVERHEAD_KEY] = None if etaMinutes is None else round(etaMinutes, 1)
+                cellData[TREND_CONFIDENCE_KEY] = round(confidence, 2)
+            cellList.append(cellData)
+
+        tmpCellsDict = OrderedDict()
+        tmpCellsDict[TIMESTAMP_KEY] = self.clock.isoformat(current_timestamp)
+        tmpCellsDict[UNITS_KEY] = self.distance_as
+        tmpCellsDict[CELL_COUNT_KEY] = len(self.cellTracker.cells)
+        tmpCellsDict[CELLS_STARTED_KEY] = self.cellTracker.cell_count
+        tmpCellsDict[CELL_LIST_KEY] = cellList
+
+        topCellsData = OrderedDict()
+        topCellsData[CELLS_NAME_KEY] = tmpCellsDict
+        return topCellsData
+
+    def report_histogram(self, current_timestamp, trigger=HISTOGRAM_ON_REQUEST):
+        """
+        :param current_timestamp: (int) now (perf_counter_ns())
+        :param trigger: (str, optional) why it is reported, HISTOGRAM_ON_*. Default = HISTOGRAM_ON_REQUEST
+        :return: (Report) our distance x energy histograms (see enable_histograms())
+        """
+        tmpHistogramDict = OrderedDict()
+        tmpHistogramDict[TIMESTAMP_KEY] = self.clock.isoformat(current_timestamp)
+        tmpHistogramDict[HISTOGRAM_TRIGGER_KEY] = trigger
+        if self.accumulatorStormLastStrike != '':
+            tmpHistogramDict[STORM_LAST_DETECT_KEY] = self.clock.isoformat(self.accumulatorStormLastStrike)
+        if self.accumulatorStormFirstStrike != '':
+            tmpHistogramDict[STORM_FIRST_DETECT_KEY] = self.clock.isoformat(self.accumulatorStormFirstStrike)
+        tmpHistogramDict[HISTOGRAM_DISTANCES_KEY] = list(DISTANCE_VALUES)
+        tmpHistogramDict[HISTOGRAM_ENERGIES_KEY] = list(ENERGY_BIN_FLOORS)
+        if self.windowHistogram is not None:
+            self.removeOldDetections(current_timestamp)
+            windowData = OrderedDict()
+            windowData[PERIOD_IN_MINUTES_KEY] = self.period_in_minutes
+            windowData[HISTOGRAM_DETECTIONS_KEY] = self.windowHistogram.detections
+            windowData[HISTOGRAM_COUNTS_KEY] = self.windowHistogram.rows()
+            tmpHistogramDict[HISTOGRAM_WINDOW_KEY] = windowData
+        stormData = OrderedDict()
+        stormData[HISTOGRAM_DETECTIONS_KEY] = self.stormHistogram.detections
+        stormData[HISTOGRAM_COUNTS_KEY] = self.stormHistogram.rows()
+        tmpHistogramDict[HISTOGRAM_STORM_KEY] = stormData
+
+        topHistogramData = OrderedDict()
+        topHistogramData[HISTOGRAM_NAME_KEY] = tmpHistogramDict
+        return Report(REPORT_HISTOGRAM, topHistogramData)
@@ -0,0 +1,99 @@
+"""
+    MqttSocketAdapter - run a paho MQTT client from an asyncio event loop
+
+    Instead of paho's own network thread (loop_start()) the client's socket is watched
+    by the loop: add_reader() calls loop_read() when data arrives, add_writer() calls
+    loop_write() only while paho has something queued to send, and a once-a-second
+    task calls loop_misc() for keepalive pings and retries.  Every paho callback then
+    runs on the loop thread.  Connecting (which blocks) is left to a BrokerConnector
+    thread, the socket is handed to the loop once open.
+
+    Needs paho-mqtt 1.5.1 or later (the on_socket_* callbacks).
+"""
+import asyncio
+import socket
+
+import paho.mqtt.client as mqtt
+
+MISC_INTERVAL_SECONDS = 1.0
+
+
+def _no_print_line(text, **kwargs):
+    pass
+
+
+def supports_socket_callbacks(client):
+    """
+    :param client: (paho.mqtt.client.Client) the client to check
+    :return: (bool) True if this paho can tell us about its socket (1.5.1 and later)
+    """
+    return hasattr(client, 'on_socket_register_write')
+
+
+class MqttSocketAdapter:
+    def __init__(self, loop, client, connector=None, print_line=None):
+        """
+        Hook this client up to the loop, before it connects
+
+        :param loop: (asyncio.AbstractEventLoop) the loop to run the client from
+        :param client: (paho.mqtt.client.Client) our client
+        :param connector: (BrokerConnector, optional) started again to reconnect a lost connection
+        :param print_line: (function, optional) our logging function (print_line(text, debug=True))
+        """
+        self.loop = loop
+        self.client = client
+        self.connector = connector
+        self.print_line = print_line if print_line is not None else _no_print_line
+        self.misc_task = None
+        self.stopping = False
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    # paho calls these on whichever thread opened or used the socket (our connector's while
+    #  connecting) so each hands its work to the loop, which keeps them in order.  They pass
+    #  the file descriptor on as paho closes the socket right after on_socket_close()
+
+    def on_socket_open(self, client, userdata, sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+        self.loop.call_soon_threadsafe(self._watch, sock.fileno())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self._unwatch, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock.fileno())
+
+    def _watch(self, fd):
+        self.print_line('- MQTT socket opened, watched by our event loop', debug=True)
+        self.loop.add_reader(fd, self.client.loop_read)
+        if self.misc_task is None:
+            self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def _unwatch(self, fd):
+        self.print_line('- MQTT socket closed', debug=True)
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+            self.misc_task = None
+        if not self.stopping and self.connector is not None:
+            self.connector.start()
+
+    async def misc_loop(self):
+        # keepalive pings and retries of unacknowledged messages
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(MISC_INTERVAL_SECONDS)
+
+    def stop(self):
+        """
+        Disconnect from the broker for good (no reconnect)
+        """
+        self.stopping = True
+        if self.connector is not None:
+            self.connector.stop()
+        self.client.disconnect()
@@ -0,0 +1,55 @@
+"""
+    StrikeRing - preallocated, array-backed ring buffer of raw strikes
+
+    Used by our full-rate capture mode: every lightning interrupt's (time, energy, distance)
+    is stored here with three array writes (no per-strike allocation) and the whole batch
+    is later drained into our accumulator when a 'detect' report is due.  When more
+    strikes arrive between drains than the ring holds the oldest are overwritten (and
+    counted).
+"""
+from array import array
+
+from .distances import distance_value, distance_from_value
+
+
+class StrikeRing:
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: (int, optional) number of undrained strikes held. Default = 1024
+        """
+        self.capacity = capacity
+        self.times = array('q', bytes(8 * capacity))     # perf_counter_ns()
+        self.energies = array('L', [0]) * capacity
+        self.distances = array('B', bytes(capacity))      # as reported by the detector (63 = out of range)
+        self.head = 0   # strikes ever appended
+        self.tail = 0   # strikes ever drained (or overwritten)
+        self.overrun_count = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def append(self, timestamp, energy, distance):
+        """
+        :param timestamp: (int) when the strike happened (perf_counter_ns())
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        """
+        slot = self.head % self.capacity
+        self.times[slot] = timestamp
+        self.energies[slot] = energy
+        self.distances[slot] = distance_value(distance)
+        self.head += 1
+        if self.head - self.tail > self.capacity:
+            self.tail += 1
+            self.overrun_count += 1
+
+    def drain(self):
+        """
+        Remove every held strike, oldest first
+
+        :return: (generator) of (timestamp, energy, distance) tuples, distance None if out of range
+        """
+        while self.tail < self.head:
+            slot = self.tail % self.capacity
+            self.tail += 1
+            yield (self.times[slot], self.energies[slot], distance_from_value(self.distances[slot]))
@@ -0,0 +1,130 @@
+"""
+    CellTracker - split a storm into its cells as strikes come in
+
+    One storm (first strike until end_storm_after_minutes of quiet) can be several cells:
+    one at 8 km and one at 35 km are not one storm front.  We track at most max_cells
+    cells, each with its own strike count, lifetime and distance trend.  A strike joins
+    the live cell nearest its distance if that cell is within gate_km, otherwise it
+    starts a new cell (retiring the longest quiet one when all are in use).  A cell
+    ends once quiet for end_after_seconds.  Each cell's distance follows its strikes
+    (exponentially smoothed) and its trend decays with a half-life, so every cell is
+    O(1) state and a strike costs O(max_cells) however long the storm runs.
+
+    Out of range strikes tell us no distance and join no cell.
+"""
+from .clock import NS_PER_SECOND
+from .trend import DistanceTrend
+
+DISTANCE_SMOOTHING = 0.3    # weight of a new strike's distance in its cell's distance
+TREND_HALF_LIFE_SECONDS = 300
+
+
+class Cell:
+    def __init__(self, cell_id, timestamp, distance):
+        self.cell_id = cell_id
+        self.first = timestamp
+        self.last = timestamp
+        self.distance = float(distance)
+        self.strike_count = 0
+        self.detection_count = 0
+        self.trend = DistanceTrend()
+        self.trend_updated = timestamp
+        self.ended = False
+
+    def add(self, timestamp, distance, count):
+        if timestamp > self.trend_updated:
+            self.trend.decay(0.5 ** ((timestamp - self.trend_updated) / (TREND_HALF_LIFE_SECONDS * NS_PER_SECOND)))
+            self.trend_updated = timestamp
+        self.trend.add(timestamp / NS_PER_SECOND, distance)
+        if self.detection_count > 0:
+            self.distance += DISTANCE_SMOOTHING * (distance - self.distance)
+        self.detection_count += 1
+        self.strike_count += count
+        if timestamp > self.last:
+            self.last = timestamp
+
+    def estimate(self, timestamp):
+        """
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (tuple) this cell's trend, as DistanceTrend.estimate() (or None if unknown)
+        """
+        return self.trend.estimate(timestamp / NS_PER_SECOND)
+
+
+class CellTracker:
+    def __init__(self, max_cells=4, gate_km=7, end_after_seconds=600):
+        """
+        :param max_cells: (int, optional) most cells tracked at once. Default = 4
+        :param gate_km: (float, optional) a strike joins a cell at most this far from it. Default = 7
+        :param end_after_seconds: (int, optional) a cell ends after this long without strikes. Default = 600
+        """
+        self.max_cells = max_cells
+        self.gate_km = gate_km
+        self.end_after_ns = end_after_seconds * NS_PER_SECOND
+        self.cells = []     # live cells, oldest first
+        self.ended = []     # cells ended since our last report
+        self.next_id = 1
+        self.cell_count = 0     # all cells we have started
+
+    def reset(self):
+        """
+        The storm is over: end all our cells (they are reported once more) and start counting afresh
+        """
+        for cell in self.cells:
+            self._end(cell)
+        self.cells = []
+        self.next_id = 1
+
+    def _end(self, cell):
+        cell.ended = True
+        self.ended.append(cell)
+
+    def expire(self, timestamp):
+        """
+        End the cells quiet for too long
+
+        :param timestamp: (int) now, perf_counter_ns()
+        """
+        stillLive = []
+        for cell in self.cells:
+            if timestamp - cell.last > self.end_after_ns:
+                self._end(cell)
+            else:
+                stillLive.append(cell)
+        self.cells = stillLive
+
+    def add(self, timestamp, distance, count=1):
+        """
+        :param timestamp: (int) when the strike happened, perf_counter_ns()
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        :param count: (int, optional) strikes this detection stands for. Default = 1
+        :return: (Cell) the cell it joined (None if out of range)
+        """
+        if distance is None:
+            return None
+        self.expire(timestamp)
+        nearest = None
+        for cell in self.cells:
+            if abs(cell.distance - distance) <= self.gate_km and (nearest is None or abs(cell.distance - distance) < abs(nearest.distance - distance)):
+                nearest = cell
+        if nearest is None:
+            if len(self.cells) >= self.max_cells:
+                quietest = min(self.cells, key=lambda cell: cell.last)
+                self.cells.remove(quietest)
+                self._end(quietest)
+            nearest = Cell(self.next_id, timestamp, distance)
+            self.next_id += 1
+            self.cell_count += 1
+            self.cells.append(nearest)
+        nearest.add(timestamp, distance, count)
+        return nearest
+
+    def take_cells(self, timestamp):
+        """
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (list) of Cell to report: those ended since our last report then the live ones
+        """
+        self.expire(timestamp)
+        cells = self.ended + self.cells
+        self.ended = []
+        return cells
@@ -0,0 +1,78 @@
+"""
+    WallClock - present our monotonic nanosecond timestamps as wall-clock time
+
+    Internally every timestamp is a perf_counter_ns() integer (monotonic, so NTP steps
+    can't end a storm early or stretch a period).  A single anchor pairs one monotonic
+    reading with the wall clock; ISO strings are built from it and cached per second,
+    as many reports share the same few seconds.
+"""
+from datetime import datetime
+from time import perf_counter_ns, time
+
+NS_PER_SECOND = 1000000000
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+
+ISO_CACHE_SIZE = 64     # distinct seconds we remember ISO strings for
+
+
+class WallClock:
+    def __init__(self, tz=None):
+        """
+        :param tz: (tzinfo, optional) zone our ISO strings are shown in. Default = local time
+        """
+        self.tz = tz
+        self.iso_cache = {}
+        self.anchor()
+
+    def anchor(self):
+        # pair now on our monotonic clock with now on the wall clock
+        self.anchor_ns = perf_counter_ns()
+        self.anchor_wall_ns = int(time() * NS_PER_SECOND)
+        self.iso_cache.clear()
+
+    def resync(self, tolerance_seconds=1.0):
+        """
+        Re-anchor if the wall clock has been stepped (e.g. by NTP after boot) by more than tolerance
+
+        :return: (float) the seconds the wall clock had moved (0.0 if we kept our anchor)
+        """
+        drift_ns = int(time() * NS_PER_SECOND) - self.wall_ns(perf_counter_ns())
+        if abs(drift_ns) <= tolerance_seconds * NS_PER_SECOND:
+            return 0.0
+        self.anchor()
+        return drift_ns / NS_PER_SECOND
+
+    def wall_ns(self, mono_ns):
+        """
+        :param mono_ns: (int) a perf_counter_ns() timestamp
+        :return: (int) nanoseconds since the epoch
+        """
+        return self.anchor_wall_ns + (mono_ns - self.anchor_ns)
+
+    def wall_seconds(self, mono_ns):
+        """
+        :param mono_ns: (int) a perf_counter_ns() timestamp
+        :return: (float) seconds since the epoch
+        """
+        return self.wall_ns(mono_ns) / NS_PER_SECOND
+
+    def datetime(self, mono_ns):
+        """
+        :param mono_ns: (int) a perf_counter_ns() timestamp
+        :return: (datetime) the timezone-aware wall time
+        """
+        return datetime.fromtimestamp(self.wall_seconds(mono_ns), self.tz).astimezone(self.tz)
+
+    def isoformat(self, mono_ns):
+        """
+        :param mono_ns: (int) a perf_counter_ns() timestamp
+        :return: (str) the wall time as ISO 8601 with seconds resolution
+        """
+        second = self.wall_ns(mono_ns) // NS_PER_SECOND
+        isoString = self.iso_cache.get(second)
+        if isoString is None:
+            if len(self.iso_cache) >= ISO_CACHE_SIZE:
+                self.iso_cache.clear()
+            isoString = datetime.fromtimestamp(second, self.tz).astimezone(self.tz).isoformat()
+            self.iso_cache[second] = isoString
+        return isoString
@@ -0,0 +1,95 @@
+"""
+    BrokerConnector - connect our MQTT client in the background, retrying with backoff
+
+    Connection attempts run on their own short-lived thread so a broker that is slow to
+    come up (e.g. after a power cut) never holds up the detector: the daemon arms its
+    interrupt straight away and holds its detections in the outbox meanwhile.  Failed
+    attempts are retried after exponentially growing delays with jitter (so a houseful of
+    devices rebooting together don't all retry in step).
+"""
+import random
+import threading
+
+
+class Backoff:
+    def __init__(self, initial_seconds=1.0, max_seconds=60.0, rng=random.random):
+        """
+        :param initial_seconds: (float, optional) the delay after our first failure. Default = 1.0
+        :param max_seconds: (float, optional) delays never grow beyond this. Default = 60.0
+        :param rng: (function, optional) returns a float in [0, 1). Default = random.random
+        """
+        self.initial_seconds = initial_seconds
+        self.max_seconds = max_seconds
+        self.rng = rng
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        :return: (float) seconds to wait before our next attempt: somewhere between half
+                 and all of initial * 2^failures (capped at max_seconds)
+        """
+        ceiling = min(self.max_seconds, self.initial_seconds * (2 ** min(self.attempts, 32)))
+        self.attempts += 1
+        return ceiling / 2 + self.rng() * ceiling / 2
+
+    def reset(self):
+        # we got through, start small again next time
+        self.attempts = 0
+
+
+def _no_print_line(text, **kwargs):
+    pass
+
+
+class BrokerConnector:
+    def __init__(self, client, backoff, max_attempts=0, on_connected=None, on_give_up=None, print_line=None):
+        """
+        :param client: (paho.mqtt.client.Client) our client, its connect_async() already called
+        :param backoff: (Backoff) our delays between attempts
+        :param max_attempts: (int, optional) give up after this many failed attempts, 0 = never. Default = 0
+        :param on_connected: (function, optional) called (on our thread) once the client's socket is open
+        :param on_give_up: (function, optional) called (on our thread) when max_attempts have failed
+        :param print_line: (function, optional) our logging function (print_line(text, warning=True))
+        """
+        self.client = client
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self.on_connected = on_connected
+        self.on_give_up = on_give_up
+        self.print_line = print_line if print_line is not None else _no_print_line
+        self.failed_attempts = 0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start connecting (unless we already are)
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name='mqtt-connect', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                self.client.reconnect()     # (to the host, port and keepalive given to connect_async())
+            except (OSError, ValueError) as e:
+                self.failed_attempts += 1
+                if self.max_attempts > 0 and self.failed_attempts >= self.max_attempts:
+                    if self.on_give_up is not None:
+                        self.on_give_up()
+                    return
+                delay = self.backoff.next_delay()
+                self.print_line('MQTT connection error - broker not responding ({}). Retrying in {:.1f} seconds... (attempt {})'.format(e, delay, self.failed_attempts), warning=True, sd_notify=True)
+                self.stopping.wait(delay)
+            else:
+                self.failed_attempts = 0
+                if self.on_connected is not None:
+                    self.on_connected()
+                return
@@ -0,0 +1,73 @@
+"""
+    DecayingSums - exponentially decaying strike counts and energies per distance value
+
+    An alternative to our hard period window: instead of holding every detection until
+    it ages out, each distance value the detector reports (16 of them, so independent of
+    our ring geometry) keeps a strike count, a detection count and an energy sum that
+    halve every half_life_seconds.  Decay is lazy: a slot is brought up to date only when
+    a strike lands in it or it is read, so a strike costs O(1) and memory stays the same
+    however fast strikes come in.  Nothing drops out abruptly when a period snaps.
+"""
+from .clock import NS_PER_SECOND
+from .distances import DISTANCE_SLOTS, distance_code
+
+
+class DecayingSums:
+    def __init__(self, half_life_seconds):
+        """
+        :param half_life_seconds: (float) time for a strike's weight to halve
+        """
+        self.half_life_seconds = half_life_seconds
+        self.half_life_ns = half_life_seconds * NS_PER_SECOND
+        self.reset()
+
+    def reset(self):
+        self.counts = [0.0] * DISTANCE_SLOTS
+        self.detections = [0.0] * DISTANCE_SLOTS
+        self.energies = [0.0] * DISTANCE_SLOTS
+        self.updated = [None] * DISTANCE_SLOTS  # when each slot was last decayed
+        self.last_strike = None
+
+    def weight(self, elapsed_ns):
+        """
+        :param elapsed_ns: (int) time since a strike
+        :return: (float) what its weight has decayed to (1.0 when new)
+        """
+        return 0.5 ** (elapsed_ns / self.half_life_ns)
+
+    def _decay(self, slot, timestamp):
+        updated = self.updated[slot]
+        if updated is None:
+            self.updated[slot] = timestamp
+        elif timestamp > updated:
+            weight = self.weight(timestamp - updated)
+            self.counts[slot] *= weight
+            self.detections[slot] *= weight
+            self.energies[slot] *= weight
+            self.updated[slot] = timestamp
+
+    def add(self, timestamp, energy, distance, count=1):
+        """
+        :param timestamp: (int) when the strike happened, perf_counter_ns()
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        :param count: (int, optional) strikes this detection stands for. Default = 1
+        """
+        slot = distance_code(distance)
+        self._decay(slot, timestamp)
+        # a strike older than the slot (e.g. flushed late) joins already decayed to the slot's time
+        weight = self.weight(self.updated[slot] - timestamp) if timestamp < self.updated[slot] else 1.0
+        self.counts[slot] += count * weight
+        self.detections[slot] += weight
+        self.energies[slot] += energy * weight
+        if self.last_strike is None or timestamp > self.last_strike:
+            self.last_strike = timestamp
+
+    def sums(self, timestamp):
+        """
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (tuple) (counts, detections, energies) lists, one entry per distance value, decayed to now
+        """
+        for slot in range(DISTANCE_SLOTS):
+            self._decay(slot, timestamp)
+        return (self.counts, self.detections, self.energies)
@@ -0,0 +1,195 @@
+"""
+    DetectionStore - compact, struct-of-arrays store of the detections in our window
+
+    Each detection takes 10 bytes across three array.array columns instead of a tuple
+    of Python objects:
+
+        time    48 bit nanoseconds since our base time (the low 32 and high 16 bits in
+                two columns), so still exact; ~78 hours fit, and our base moves up to our
+                oldest detection when they no longer would
+        word    32 bits: energy (21 bits, all the detector reports), distance code (4 bits)
+                and strike count (7 bits).  A detection outside that (127+ strikes or a
+                larger energy, both rare) keeps its energy and count in a small dict.
+
+    The columns form a circular buffer: new detections are appended at the tail, aged
+    ones removed from the head, and the buffer grows by half when full.
+
+    Iterating yields plain (timestamp, energy, distance, strikeCount) tuples;
+    record(index) returns a DetectionRecord view for callers wanting named fields.
+"""
+from array import array
+
+from .distances import DISTANCE_VALUES, distance_code
+
+# distances are stored as their distance code
+_distanceForCode = tuple(DISTANCE_VALUES[:-1]) + (None,)
+
+INITIAL_CAPACITY = 64
+MAX_STRIKE_COUNT = 0xFFFF
+
+TIME_SPAN = 1 << 48             # time offsets we can hold (ns, ~78 hours)
+ENERGY_MASK = (1 << 21) - 1
+CODE_SHIFT = 21
+CODE_MASK = 0x0F
+COUNT_SHIFT = 25
+COUNT_ESCAPE = 0x7F             # count field of a detection whose energy and count are in our dict
+
+
+class DetectionRecord:
+    __slots__ = ('store', 'position')
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position    # slot in the store's columns
+
+    @property
+    def timestamp(self):
+        return self.store._timestamp(self.position)
+
+    @property
+    def energy(self):
+        return self.store._energy_and_count(self.position)[0]
+
+    @property
+    def distance(self):
+        return _distanceForCode[(self.store.words[self.position] >> CODE_SHIFT) & CODE_MASK]
+
+    @property
+    def strikeCount(self):
+        return self.store._energy_and_count(self.position)[1]
+
+
+class DetectionStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.capacity = capacity
+        self.times_low = array('I', bytes(4 * capacity))    # perf_counter_ns() - base_time
+        self.times_high = array('H', bytes(2 * capacity))
+        self.words = array('I', bytes(4 * capacity))        # energy | code << 21 | count << 25
+        self.escaped = {}       # slot -> (energy, strikeCount) of detections not fitting their word
+        self.base_time = 0
+        self.head = 0   # slot of our oldest detection
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, timestamp, energy, distance, strikeCount=1):
+        """
+        :param timestamp: (int) when the strike happened (perf_counter_ns())
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        :param strikeCount: (int, optional) strikes this detection stands for. Default = 1
+        """
+        if self.length == self.capacity:
+            self._grow()
+        if self.length == 0:
+            self.base_time = timestamp
+        offset = timestamp - self.base_time
+        if not 0 <= offset < TIME_SPAN:
+            offset = self._rebase(timestamp)
+        slot = (self.head + self.length) % self.capacity
+        self.times_low[slot] = offset & 0xFFFFFFFF
+        self.times_high[slot] = offset >> 32
+        strikeCount = min(strikeCount, MAX_STRIKE_COUNT)
+        code = distance_code(distance) << CODE_SHIFT
+        if strikeCount < COUNT_ESCAPE and 0 <= energy <= ENERGY_MASK:
+            self.words[slot] = energy | code | (strikeCount << COUNT_SHIFT)
+        else:
+            self.words[slot] = code | (COUNT_ESCAPE << COUNT_SHIFT)
+            self.escaped[slot] = (energy, strikeCount)
+        self.length += 1
+
+    def _rebase(self, timestamp):
+        # move our base time (to our oldest detection, or this one if older), shifting our offsets
+        newBase = min(timestamp, self._timestamp(self.head))
+        shift = self.base_time - newBase
+        if timestamp - newBase >= TIME_SPAN or self._timestamp((self.head + self.length - 1) % self.capacity) - newBase >= TIME_SPAN:
+            raise OverflowError('DetectionStore detections span more than {} hours'.format(TIME_SPAN // 3600000000000))
+        for index in range(self.length):
+            slot = (self.head + index) % self.capacity
+            offset = ((self.times_high[slot] << 32) | self.times_low[slot]) + shift
+            self.times_low[slot] = offset & 0xFFFFFFFF
+            self.times_high[slot] = offset >> 32
+        self.base_time = newBase
+        return timestamp - newBase
+
+    def _grow(self):
+        # grow our columns by half, laying our detections out oldest first again
+        newCapacity = self.capacity + max(1, self.capacity // 2)
+        for name in ('times_low', 'times_high', 'words'):
+            column = getattr(self, name)
+            grown = array(column.typecode, bytes(column.itemsize * newCapacity))    # (exactly sized)
+            grown[:self.capacity - self.head] = column[self.head:]
+            grown[self.capacity - self.head:self.capacity] = column[:self.head]
+            setattr(self, name, grown)
+        self.escaped = dict(((slot - self.head) % self.capacity, values) for (slot, values) in self.escaped.items())
+        self.head = 0
+        self.capacity = newCapacity
+
+    def _timestamp(self, slot):
+        return self.base_time + ((self.times_high[slot] << 32) | self.times_low[slot])
+
+    def _energy_and_count(self, slot):
+        word = self.words[slot]
+        strikeCount = word >> COUNT_SHIFT
+        if strikeCount == COUNT_ESCAPE:
+            return self.escaped[slot]
+        return (word & ENERGY_MASK, strikeCount)
+
+    def oldest_timestamp(self):
+        """
+        :return: (int/None) the time of our oldest detection (None if empty)
+        """
+        return self._timestamp(self.head) if self.length > 0 else None
+
+    def popleft(self):
+        """
+        Remove our oldest detection
+
+        :return: (tuple) its (timestamp, energy, distance, strikeCount)
+        """
+        if self.length == 0:
+            raise IndexError('pop from an empty DetectionStore')
+        slot = self.head
+        word = self.words[slot]
+        strikeCount = word >> COUNT_SHIFT
+        if strikeCount == COUNT_ESCAPE:
+            (energy, strikeCount) = self.escaped.pop(slot)
+        else:
+            energy = word & ENERGY_MASK
+        self.head = slot + 1 if slot + 1 < self.capacity else 0
+        self.length -= 1
+        return (self.base_time + ((self.times_high[slot] << 32) | self.times_low[slot]), energy, _distanceForCode[(word >> CODE_SHIFT) & CODE_MASK], strikeCount)
+
+    def clear(self):
+        self.head = 0
+        self.length = 0
+        self.escaped.clear()
+
+    def record(self, index):
+        """
+        :param index: (int) 0 = oldest detection
+        :return: (DetectionRecord) a view of that detection
+        """
+        if not 0 <= index < self.length:
+            raise IndexError('DetectionStore index out of range')
+        return DetectionRecord(self, (self.head + index) % self.capacity)
+
+    def __iter__(self):
+        baseTime = self.base_time
+        timesLow = self.times_low
+        timesHigh = self.times_high
+        words = self.words
+        escaped = self.escaped
+        distanceForCode = _distanceForCode
+        # our detections run from head to the end of our columns, then on from their start
+        tail = self.head + self.length
+        for slots in (range(self.head, min(tail, self.capacity)), range(0, max(0, tail - self.capacity))):
+            for slot in slots:
+                word = words[slot]
+                strikeCount = word >> COUNT_SHIFT
+                if strikeCount == COUNT_ESCAPE:
+                    (energy, strikeCount) = escaped[slot]
+                else:
+                    energy = word & ENERGY_MASK
+                yield (baseTime + ((timesHigh[slot] << 32) | timesLow[slot]), energy, distanceForCode[(word >> CODE_SHIFT) & CODE_MASK], strikeCount)
@@ -0,0 +1,46 @@
+"""
+    The distances our detector reports, in one place
+
+    The AS3935 reports one of 15 distances (km, 1 = overhead) or 63 when the storm is
+    out of range, which we carry as None.  What stores or bins distances keeps them as
+    their index in DISTANCE_VALUES (their distance code) or, in files, as the value
+    itself (63 for out of range).
+"""
+
+DISTANCE_VALUES = ( 1, 5, 6, 8, 10, 12, 14, 17, 20, 24, 27, 31, 34, 37, 40, 63 )
+DISTANCE_OUT_OF_RANGE = 63  # the detector's 'out of range' distance value
+DISTANCE_OUT_OF_RANGE_CODE = len(DISTANCE_VALUES) - 1
+DISTANCE_SLOTS = len(DISTANCE_VALUES)
+_distanceCodeForValue = dict((value, code) for code, value in enumerate(DISTANCE_VALUES))
+
+
+def distance_code(distance):
+    """
+    :param distance: (int/None) distance as reported by the detector (None if out of range)
+    :return: (int) its index in DISTANCE_VALUES
+    """
+    return DISTANCE_OUT_OF_RANGE_CODE if distance is None else _distanceCodeForValue[distance]
+
+
+def detector_distance(distance):
+    """
+    :param distance: (int/float/None) a distance as read (test files give e.g. 31.0, 63 = out of range)
+    :return: (int/None) the distance as the detector reports it (None if out of range)
+    """
+    return None if distance is None else distance_from_value(int(distance))
+
+
+def distance_value(distance):
+    """
+    :param distance: (int/None) distance as reported by the detector (None if out of range)
+    :return: (int) the value to store for it (DISTANCE_OUT_OF_RANGE if out of range)
+    """
+    return DISTANCE_OUT_OF_RANGE if distance is None else distance
+
+
+def distance_from_value(value):
+    """
+    :param value: (int) a stored distance value
+    :return: (int/None) the distance (None if out of range)
+    """
+    return None if value == DISTANCE_OUT_OF_RANGE else value
@@ -0,0 +1,86 @@
+"""
+    DisturberShedder - mask disturber interrupts while they flood in, re-arm them later
+
+    Near motors and switching supplies the detector can raise a disturber interrupt (0x04)
+    many times a minute, each one costing us a wake-up and a bus read.  Masking them for
+    good on the first one (as we used to) hides disturbers for the rest of our uptime.
+    Instead we count disturbers over a sliding window and mask them once mask_at fall in
+    it, then un-mask them after unmask_after_seconds (masked, the chip tells us nothing
+    more, so this is a timed re-arm).  If the flood is still on we mask again soon enough.
+
+    The shedder only decides, our caller changes the chip and tells us the result.
+"""
+from collections import deque
+
+from .clock import NS_PER_SECOND
+
+
+class DisturberShedder:
+    def __init__(self, window_seconds=60, mask_at=5, unmask_after_seconds=600):
+        """
+        :param window_seconds: (int, optional) disturbers are counted over this long. Default = 60
+        :param mask_at: (int, optional) mask once this many are in our window. Default = 5
+        :param unmask_after_seconds: (int, optional) un-mask after this long masked, 0 = never. Default = 600
+        """
+        self.window_ns = window_seconds * NS_PER_SECOND
+        self.mask_at = mask_at
+        self.unmask_after_ns = unmask_after_seconds * NS_PER_SECOND
+        self.disturber_times = deque()
+        self.is_masked = False
+        self.masked_at = None
+        self.disturber_count = 0    # all disturbers we were told of
+        self.mask_count = 0
+        self.unmask_count = 0
+
+    def _expire(self, timestamp):
+        windowStart = timestamp - self.window_ns
+        while self.disturber_times and self.disturber_times[0] <= windowStart:
+            self.disturber_times.popleft()
+
+    def window_count(self, timestamp):
+        """
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (int) disturbers in our window
+        """
+        self._expire(timestamp)
+        return len(self.disturber_times)
+
+    def note_disturber(self, timestamp):
+        """
+        Count a disturber interrupt
+
+        :param timestamp: (int) when it happened, perf_counter_ns()
+        :return: (bool) True if disturbers should now be masked (call masked() once done)
+        """
+        self.disturber_count += 1
+        self.disturber_times.append(timestamp)
+        self._expire(timestamp)
+        return not self.is_masked and len(self.disturber_times) >= self.mask_at
+
+    def should_unmask(self, timestamp):
+        """
+        Check (e.g. on each safety poll) whether we have been masked long enough
+
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (bool) True if disturbers should now be un-masked (call masked() once done)
+        """
+        if not self.is_masked or self.unmask_after_ns == 0:
+            return False
+        return timestamp - self.masked_at >= self.unmask_after_ns
+
+    def masked(self, timestamp, is_masked):
+        """
+        Record the mask our caller set on the chip
+
+        :param timestamp: (int) now, perf_counter_ns()
+        :param is_masked: (bool) whether disturbers are now masked
+        """
+        self.is_masked = is_masked
+        if is_masked:
+            self.masked_at = timestamp
+            self.mask_count += 1
+        else:
+            self.masked_at = None
+            self.unmask_count += 1
+            # start counting afresh: what made us mask is old news
+            self.disturber_times.clear()
@@ -0,0 +1,129 @@
+"""
+    EventQueue - every interrupt source (IRQ edge, safety poll, period timer, test replay)
+    pushes a typed event here and a single worker thread consumes them in order, so all
+    of our accumulator state is only ever touched by that one thread.
+
+    put() is cheap enough for a GPIO callback thread: a bounded deque append (atomic under
+    the GIL) plus an Event.set() to wake the worker.
+"""
+from collections import deque, namedtuple
+import threading
+
+# event sources
+SOURCE_EDGE = 1     # IRQ edge callback (or poll that found IRQ still raised)
+SOURCE_POLL = 2     # safety poll, IRQ line low
+SOURCE_TIMER = 3    # our period timer expired
+SOURCE_TEST = 4     # detection replayed from a test file
+SOURCE_COMMAND = 5  # a request for the worker (e.g. from MQTT)
+
+SOURCE_NAMES = { SOURCE_EDGE: 'edge', SOURCE_POLL: 'poll', SOURCE_TIMER: 'timer', SOURCE_TEST: 'test', SOURCE_COMMAND: 'command' }
+
+# source: one of SOURCE_*
+# channel: the interrupt channel (GPIO pin or one of the daemon's synthetic channels)
+# edge_ns: perf_counter_ns() of the edge (0 if not known)
+# data: source specific payload (e.g. (distance, energy) for a test detection)
+DetectorEvent = namedtuple('DetectorEvent', 'source channel edge_ns data')
+
+
+class EventQueue:
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: (int, optional) events held before new ones are dropped. Default = 1024
+        """
+        self.maxsize = maxsize
+        self.events = deque()
+        self.ready = threading.Event()
+        self.processed_count = 0    # only our worker updates this
+        self.dropped_count = 0
+        self.drop_lock = threading.Lock()   # drops are rare, keep the common path lock free
+        self.high_water = 0
+        self.worker = None
+        self.running = False
+
+    def put(self, event):
+        """
+        Queue an event for our worker (safe from any thread)
+
+        :param event: (DetectorEvent) the event
+        :return: (bool) False if the queue was full and the event was dropped
+        """
+        depth = len(self.events)
+        if depth >= self.maxsize:
+            with self.drop_lock:
+                self.dropped_count += 1
+            return False
+        self.events.append(event)
+        if depth >= self.high_water:
+            self.high_water = depth + 1
+        self.ready.set()
+        return True
+
+    def depth(self):
+        """
+        :return: (int) events waiting for our worker
+        """
+        return len(self.events)
+
+    def drain(self, handler):
+        """
+        Hand every queued event to handler(event), in order
+
+        :return: (int) the number of events handled
+        """
+        handled = 0
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                return handled
+            handler(event)
+            self.processed_count += 1
+            handled += 1
+
+    async def drain_async(self, handler, prepare=None):
+        """
+        drain() for an asyncio event loop: prepare(event), when given, may return an awaitable
+        of the event to hand on instead (e.g. with data read off the loop).  Events are still
+        handed to handler(event) one at a time and in order (run one of these at a time).
+
+        :return: (int) the number of events handled
+        """
+        handled = 0
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                return handled
+            if prepare is not None:
+                pending = prepare(event)
+                if pending is not None:
+                    event = await pending
+            handler(event)
+            self.processed_count += 1
+            handled += 1
+
+    def start_worker(self, handler, name='event-worker'):
+        """
+        Start the single thread that hands every event to handler(event)
+        """
+        self.running = True
+        self.worker = threading.Thread(target=self._run, args=(handler,), name=name, daemon=True)
+        self.worker.start()
+
+    def stop_worker(self, timeout=None):
+        """
+        Stop our worker once it has handled what is already queued
+        """
+        self.running = False
+        self.ready.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
+
+    def _run(self, handler):
+        while self.running:
+            self.ready.wait()
+            # clear before draining: an event appended after this point sets us again
+            self.ready.clear()
+            self.drain(handler)
+        self.drain(handler)
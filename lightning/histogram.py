@@ -0,0 +1,57 @@
+"""
+    StrikeHistogram - detections counted by distance value and energy, at full resolution
+
+    Our rings fold the detector's distance values into a few bins and keep only a mean
+    energy.  For site analysis we also count detections on a 2D grid: one row per
+    distance value the detector reports (16, 63 = out of range) and one column per
+    power of two of energy (the detector's energy is a 21 bit number, so 22 columns:
+    0, 1, 2-3, 4-7, ... 1048576-2097151).  Adding or taking back a detection is one
+    array update.
+"""
+from array import array
+
+from .distances import DISTANCE_SLOTS, distance_code
+
+ENERGY_BINS = 22
+# the lowest energy of each column
+ENERGY_BIN_FLOORS = tuple([0] + list(1 << power for power in range(ENERGY_BINS - 1)))
+
+
+def energy_bin(energy):
+    """
+    :param energy: (int) the energy reported by the detector
+    :return: (int) its column [0-21]
+    """
+    return min(int(energy).bit_length(), ENERGY_BINS - 1)
+
+
+class StrikeHistogram:
+    def __init__(self):
+        self.counts = array('L', [0]) * (DISTANCE_SLOTS * ENERGY_BINS)
+        self.detections = 0
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.detections = 0
+
+    def add(self, energy, distance):
+        """
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        """
+        self.counts[distance_code(distance) * ENERGY_BINS + energy_bin(energy)] += 1
+        self.detections += 1
+
+    def remove(self, energy, distance):
+        """
+        Take back a detection previously add()ed with the same values
+        """
+        self.counts[distance_code(distance) * ENERGY_BINS + energy_bin(energy)] -= 1
+        self.detections -= 1
+
+    def rows(self):
+        """
+        :return: (list) one list of ENERGY_BINS counts per distance value (in DISTANCE_VALUES order)
+        """
+        return list(self.counts[slot * ENERGY_BINS:(slot + 1) * ENERGY_BINS].tolist() for slot in range(DISTANCE_SLOTS))
@@ -0,0 +1,182 @@
+"""
+    HistoryQuery - answer history requests from our rollup store and strike journal
+
+    A request is a dict (from an MQTT command or an HTTP query string):
+
+        query       'rings' (aggregates from the rollup store) or 'strikes' (from the journal)
+        start, end  ISO 8601 times (local time if no offset given) or seconds since the epoch
+        resolution  rings: 'minute', 'hour' or 'day' [Default: minute]
+        min_km, max_km  strikes: only those within this distance range
+        page_size   rows per page [Default: 100]
+        id          (optional) echoed back in every page
+
+    Results are produced one page at a time (a generator) so a large range is never
+    held in memory.  A bad request is refused (ValueError) before the first page.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from math import isfinite
+from urllib.parse import parse_qs
+
+from .rollup import RESOLUTIONS
+
+QUERY_RINGS = 'rings'
+QUERY_STRIKES = 'strikes'
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+RESOLUTION_NAMES = tuple(name for (name, step, slots) in RESOLUTIONS)
+
+
+def parse_time(value):
+    """
+    :param value: (str/int/float) ISO 8601 time or seconds since the epoch
+    :return: (float) seconds since the epoch, raises ValueError for anything else
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('a time must be ISO 8601 or seconds since the epoch, not {}'.format(_json_type(value)))
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()    # naive means local time
+    return moment.timestamp()
+
+
+def _json_type(value):
+    # the JSON name of value's type (for our error messages)
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'a boolean'
+    if isinstance(value, dict):
+        return 'an object'
+    if isinstance(value, list):
+        return 'an array'
+    if isinstance(value, str):
+        return 'a string'
+    return 'a number'
+
+
+def _number(request, key, default=None):
+    # a request field that must be a number (or a string of one)
+    value = request.get(key, default)
+    if value is None and key not in request:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('"{}" must be a number, not {}'.format(key, _json_type(value)))
+    number = float(value)
+    if not isfinite(number):
+        raise ValueError('"{}" must be a finite number'.format(key))
+    return number
+
+
+def _name(request, key, default):
+    # a request field that must be a string
+    value = request.get(key, default)
+    if not isinstance(value, str):
+        raise ValueError('"{}" must be a string, not {}'.format(key, _json_type(value)))
+    return value
+
+
+def request_from_query_string(query):
+    """
+    :param query: (str) an HTTP query string (e.g. 'query=rings&start=...')
+    :return: (dict) the request
+    """
+    return dict((key, values[-1]) for key, values in parse_qs(query).items())
+
+
+def _isoformat(seconds):
+    return datetime.fromtimestamp(seconds).astimezone().replace(microsecond=0).isoformat()
+
+
+class HistoryQuery:
+    def __init__(self, rollup=None, journal=None):
+        """
+        :param rollup: (RollupStore, optional) our minute/hour/day aggregates
+        :param journal: (StrikeJournal, optional) our strike journal
+        """
+        self.rollup = rollup
+        self.journal = journal
+
+    def pages(self, request):
+        """
+        Run a request
+
+        :param request: (dict) the request (see above)
+        :return: (generator) of page dicts (id, query, page, rows, last); raises ValueError for a bad request
+        """
+        queryType = _name(request, 'query', QUERY_RINGS)
+        start = parse_time(request['start']) if 'start' in request else None
+        end = parse_time(request['end']) if 'end' in request else None
+        pageSize = max(1, min(int(_number(request, 'page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        if start is not None and end is not None and end < start:
+            raise ValueError('end is before start')
+        if queryType == QUERY_RINGS:
+            if self.rollup is None:
+                raise ValueError('no rollup store configured')
+            resolution = _name(request, 'resolution', 'minute')
+            if resolution not in RESOLUTION_NAMES:
+                raise ValueError('unknown resolution "{}" (use one of {})'.format(resolution, ', '.join(RESOLUTION_NAMES)))
+            rows = self._ring_rows(resolution, start, end)
+        elif queryType == QUERY_STRIKES:
+            if self.journal is None:
+                raise ValueError('no strike journal configured')
+            minKm = _number(request, 'min_km')
+            maxKm = _number(request, 'max_km')
+            rows = self._strike_rows(start, end, minKm, maxKm)
+        else:
+            raise ValueError('unknown query "{}"'.format(queryType))
+        return self._paged(request.get('id'), queryType, rows, pageSize)
+
+    def _paged(self, requestId, queryType, rows, pageSize):
+        pageNumber = 0
+        page = []
+        for row in rows:
+            if len(page) == pageSize:
+                yield self._page(requestId, queryType, pageNumber, page, False)
+                pageNumber += 1
+                page = []
+            page.append(row)
+        yield self._page(requestId, queryType, pageNumber, page, True)
+
+    def _page(self, requestId, queryType, pageNumber, rows, last):
+        page = OrderedDict()
+        if requestId is not None:
+            page['id'] = requestId
+        page['query'] = queryType
+        page['page'] = pageNumber
+        page['rows'] = rows
+        page['last'] = last
+        return page
+
+    def _ring_rows(self, resolution, start, end):
+        outOfRangeIndex = self.rollup.out_of_range_index()
+        for (slotStart, entries) in self.rollup.slots(resolution, start, end):
+            row = OrderedDict()
+            row['start'] = _isoformat(slotStart)
+            row['count'] = [entry[0] for entry in entries[:outOfRangeIndex]]
+            row['energy'] = [entry[1] for entry in entries[:outOfRangeIndex]]
+            row['min_km'] = [entry[2] for entry in entries[:outOfRangeIndex]]
+            row['max_km'] = [entry[3] for entry in entries[:outOfRangeIndex]]
+            row['out_of_range'] = entries[outOfRangeIndex][0]
+            yield row
+
+    def _strike_rows(self, start, end, minKm, maxKm):
+        for (seconds, energy, distance, count) in self.journal.strikes(start, end):
+            if minKm is not None or maxKm is not None:
+                if distance is None:
+                    continue
+                if (minKm is not None and distance < minKm) or (maxKm is not None and distance > maxKm):
+                    continue
+            row = OrderedDict()
+            row['time'] = _isoformat(seconds)
+            row['distance_km'] = distance
+            row['energy'] = energy
+            row['count'] = count
+            yield row
@@ -0,0 +1,86 @@
+"""
+    StrikeJournal - append-only file of every accumulated strike
+
+    Fixed size records are appended in time order so the file is its own time index:
+    a query binary searches for its start time and then streams records from there.
+    When the file reaches max_records it is moved to {filename}.old (replacing the
+    previous one) and a new file started, bounding the journal to twice that.
+"""
+import os
+import struct
+
+from .distances import distance_value, distance_from_value
+
+# milliseconds since the epoch, energy, distance in km (63 = out of range), strikes it stands for
+JOURNAL_RECORD = struct.Struct('<qIBxH')
+READ_RECORDS = 256  # records read from the file at a time
+
+
+class StrikeJournal:
+    def __init__(self, filename, max_records=500000):
+        """
+        :param filename: (str) the journal file
+        :param max_records: (int, optional) records per file before it is rotated. Default = 500000 (8MB)
+        """
+        self.filename = filename
+        self.max_records = max_records
+        self.file = open(filename, 'ab', buffering=0)  # unbuffered: records are visible to queries at once
+        self.records = os.path.getsize(filename) // JOURNAL_RECORD.size
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def add_strike(self, seconds, ring_index, energy, distance, count=1):
+        """
+        Append a strike (same signature as RollupStore.add_strike so both can be fed alike)
+        """
+        if self.records >= self.max_records:
+            self.file.close()
+            os.replace(self.filename, self.filename + '.old')
+            self.file = open(self.filename, 'ab', buffering=0)
+            self.records = 0
+        self.file.write(JOURNAL_RECORD.pack(int(seconds * 1000), energy, distance_value(distance), min(count, 0xFFFF)))
+        self.records += 1
+
+    def strikes(self, start=None, end=None):
+        """
+        Read back strikes in time order (older file first)
+
+        :param start: (float, optional) only strikes at or after this (seconds since the epoch)
+        :param end: (float, optional) only strikes before this (seconds since the epoch)
+        :return: (generator) of (seconds, energy, distance, count), distance None if out of range
+        """
+        for filename in (self.filename + '.old', self.filename):
+            if os.path.exists(filename):
+                yield from _read_strikes(filename, start, end)
+
+
+def _read_strikes(filename, start, end):
+    startMs = None if start is None else int(start * 1000)
+    endMs = None if end is None else int(end * 1000)
+    with open(filename, 'rb') as journalFile:
+        count = os.fstat(journalFile.fileno()).st_size // JOURNAL_RECORD.size
+        # binary search for the first record at or after our start
+        low = 0
+        high = count
+        if startMs is not None:
+            while low < high:
+                middle = (low + high) // 2
+                journalFile.seek(middle * JOURNAL_RECORD.size)
+                (recordMs, _, _, _) = JOURNAL_RECORD.unpack(journalFile.read(JOURNAL_RECORD.size))
+                if recordMs < startMs:
+                    low = middle + 1
+                else:
+                    high = middle
+        journalFile.seek(low * JOURNAL_RECORD.size)
+        remaining = count - low
+        while remaining > 0:
+            batch = min(remaining, READ_RECORDS)
+            data = journalFile.read(batch * JOURNAL_RECORD.size)
+            remaining -= batch
+            for (recordMs, energy, distance, strikeCount) in JOURNAL_RECORD.iter_unpack(data):
+                if endMs is not None and recordMs >= endMs:
+                    return
+                yield (recordMs / 1000.0, energy, distance_from_value(distance), strikeCount)
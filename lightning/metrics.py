@@ -0,0 +1,198 @@
+"""
+    Minimal metrics registry and OpenMetrics (Prometheus) endpoint
+
+    Updating a metric is a couple of integer adds (no locks, no allocation) so we can
+    instrument the interrupt hot path.  All formatting work happens only when the
+    endpoint is scraped.
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# latency buckets (in seconds) from 50us to 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+class Counter:
+    __slots__ = ('name', 'help', 'labels', 'value', 'function')
+
+    def __init__(self, name, help, labels=(), function=None):
+        """
+        :param function: (callable, optional) when present the (ever increasing) count is fetched from it at scrape time
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        value = self.value if self.function is None else self.function()
+        yield '{}_total{} {}'.format(self.name, _format_labels(self.labels), value)
+
+
+class Gauge:
+    __slots__ = ('name', 'help', 'labels', 'value', 'function')
+
+    def __init__(self, name, help, labels=(), function=None):
+        """
+        :param function: (callable, optional) when present the gauge value is fetched from it at scrape time
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        value = self.value if self.function is None else self.function()
+        yield '{}{} {}'.format(self.name, _format_labels(self.labels), value)
+
+
+class Histogram:
+    __slots__ = ('name', 'help', 'labels', 'bounds', 'bounds_ns', 'counts', 'sum', 'sum_ns', 'count')
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.bounds = tuple(buckets)
+        self.bounds_ns = tuple(int(round(bound * 1e9)) for bound in self.bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last is +Inf
+        self.sum = 0.0
+        self.sum_ns = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_ns(self, elapsedNs):
+        """
+        Record a perf_counter_ns() difference (kept as integers, reported in seconds)
+        """
+        self.counts[bisect_left(self.bounds_ns, elapsedNs)] += 1
+        self.sum_ns += elapsedNs
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for index, bound in enumerate(self.bounds):
+            cumulative += self.counts[index]
+            yield '{}_bucket{} {}'.format(self.name, _format_labels(self.labels + (('le', repr(float(bound))),)), cumulative)
+        cumulative += self.counts[-1]
+        yield '{}_bucket{} {}'.format(self.name, _format_labels(self.labels + (('le', '+Inf'),)), cumulative)
+        yield '{}_count{} {}'.format(self.name, _format_labels(self.labels), self.count)
+        yield '{}_sum{} {}'.format(self.name, _format_labels(self.labels), self.sum + self.sum_ns / 1e9)
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.families = {}  # name -> (type, help, [metrics])
+
+    def _register(self, typeName, metric):
+        metric.name = self.prefix + metric.name
+        if metric.name not in self.families:
+            self.families[metric.name] = (typeName, metric.help, [])
+        self.families[metric.name][2].append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), function=None):
+        return self._register('counter', Counter(name, help, labels, function))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._register('gauge', Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register('histogram', Histogram(name, help, labels, buckets))
+
+    def exposition(self):
+        """
+        :return: (str) every metric in OpenMetrics text format
+        """
+        lines = []
+        for name, (typeName, help, metrics) in self.families.items():
+            lines.append('# TYPE {} {}'.format(name, typeName))
+            lines.append('# HELP {} {}'.format(name, help))
+            for metric in metrics:
+                lines.extend(metric.samples())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # needed for chunked (streamed) replies
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        route = self.server.routes.get(path)
+        if route is None:
+            self.send_error(404)
+            return
+        reply = route(query)
+        contentType, body = reply[:2]
+        self.send_response(reply[2] if len(reply) > 2 else 200)
+        self.send_header('Content-Type', contentType)
+        if isinstance(body, (str, bytes)):
+            data = body.encode('utf-8') if isinstance(body, str) else body
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            # a generator: stream it out in chunks so nothing large is held in memory
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in body:
+                data = chunk.encode('utf-8')
+                self.wfile.write('{:x}\r\n'.format(len(data)).encode('ascii') + data + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        pass    # keep scrapes out of our log
+
+
+class MetricsServer:
+    def __init__(self, registry, address='127.0.0.1', port=9935):
+        """
+        A small HTTP server (on its own thread) exposing /metrics
+
+        :param registry: (MetricsRegistry) the metrics to expose
+        :param address: (str, optional) address to listen on. Default = '127.0.0.1' (local only)
+        :param port: (int, optional) TCP port to listen on. Default = 9935
+        """
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((address, port), _RequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.routes = {'/metrics': lambda query: (OPENMETRICS_CONTENT_TYPE, self.registry.exposition())}
+        self.thread = None
+
+    def add_route(self, path, handler):
+        """
+        :param handler: (callable) handler(query_string) -> (content_type, str|bytes|generator of str)
+                        or (content_type, body, status) for a status other than 200
+        """
+        self.httpd.routes[path] = handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,133 @@
+"""
+    NoiseFloorController - step our detector's noise floor up and down with the noise
+
+    The detector raises a noise interrupt (0x01) while the noise it hears is above its
+    noise floor.  Raising the floor on every one of these leaves the detector deaf for the
+    rest of its uptime after one noisy afternoon, never raising it lets a noisy spell
+    flood us with interrupts.  We count noise interrupts over a sliding window instead:
+    when there are raise_at or more in the window we step the floor up, once a whole
+    quiet period passes without any we step it back down (never below the configured
+    floor).  The gap between the two thresholds plus a minimum time between steps keeps
+    us from see-sawing.
+
+    The controller only decides, our caller changes the chip and tells us the result.
+"""
+from collections import deque, namedtuple
+
+from .clock import NS_PER_SECOND
+
+DIRECTION_RAISE = 'raise'
+DIRECTION_LOWER = 'lower'
+
+# timestamp: perf_counter_ns() of the change
+# direction: DIRECTION_RAISE or DIRECTION_LOWER
+# old_floor, new_floor: the chip's floor before and after [0-7]
+# noise_count: noise interrupts in our window at the time
+FloorAdjustment = namedtuple('FloorAdjustment', 'timestamp direction old_floor new_floor noise_count')
+
+
+class NoiseFloorController:
+    def __init__(self, floor, min_floor=None, max_floor=7, window_seconds=60, raise_at=2,
+                 lower_after_seconds=900, min_step_seconds=10, history_size=10):
+        """
+        :param floor: (int) the chip's current noise floor [0-7]
+        :param min_floor: (int, optional) never lower it below this. Default = floor
+        :param max_floor: (int, optional) never raise it above this. Default = 7
+        :param window_seconds: (int, optional) noise interrupts are counted over this long. Default = 60
+        :param raise_at: (int, optional) raise once this many are in our window. Default = 2
+        :param lower_after_seconds: (int, optional) lower after this long without any. Default = 900
+        :param min_step_seconds: (int, optional) least time between two raises. Default = 10
+        :param history_size: (int, optional) number of recent adjustments kept. Default = 10
+        """
+        self.floor = floor
+        self.min_floor = floor if min_floor is None else min_floor
+        self.max_floor = max_floor
+        self.window_ns = window_seconds * NS_PER_SECOND
+        self.raise_at = raise_at
+        self.lower_after_ns = lower_after_seconds * NS_PER_SECOND
+        self.min_step_ns = min_step_seconds * NS_PER_SECOND
+        self.noise_times = deque()
+        self.last_noise = None
+        self.last_step = None
+        self.history = deque(maxlen=history_size)
+        self.raise_count = 0
+        self.lower_count = 0
+
+    def reset(self, timestamp, floor, min_floor=None):
+        """
+        The floor was set from outside (startup, a reload): start over from it
+
+        :param timestamp: (int) now, perf_counter_ns()
+        :param floor: (int) the chip's noise floor now
+        :param min_floor: (int, optional) our new lower limit. Default = floor
+        """
+        self.floor = floor
+        self.min_floor = floor if min_floor is None else min_floor
+        self.noise_times.clear()
+        self.last_noise = None
+        self.last_step = timestamp
+
+    def _expire(self, timestamp):
+        windowStart = timestamp - self.window_ns
+        while self.noise_times and self.noise_times[0] <= windowStart:
+            self.noise_times.popleft()
+
+    def noise_count(self, timestamp):
+        """
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (int) noise interrupts in our window
+        """
+        self._expire(timestamp)
+        return len(self.noise_times)
+
+    def note_noise(self, timestamp):
+        """
+        Count a noise interrupt
+
+        :param timestamp: (int) when it happened, perf_counter_ns()
+        :return: (bool) True if the floor should now be raised (call adjusted() once done)
+        """
+        self.noise_times.append(timestamp)
+        self.last_noise = timestamp
+        self._expire(timestamp)
+        if self.floor >= self.max_floor or len(self.noise_times) < self.raise_at:
+            return False
+        return self.last_step is None or timestamp - self.last_step >= self.min_step_ns
+
+    def should_lower(self, timestamp):
+        """
+        Check (e.g. on each safety poll) whether it has been quiet long enough
+
+        :param timestamp: (int) now, perf_counter_ns()
+        :return: (bool) True if the floor should now be lowered (call adjusted() once done)
+        """
+        if self.floor <= self.min_floor:
+            return False
+        quietSince = self.last_step
+        if self.last_noise is not None and (quietSince is None or self.last_noise > quietSince):
+            quietSince = self.last_noise
+        if quietSince is None:
+            self.last_step = timestamp  # our quiet period starts now
+            return False
+        return timestamp - quietSince >= self.lower_after_ns
+
+    def adjusted(self, timestamp, direction, new_floor):
+        """
+        Record the floor our caller set on the chip
+
+        :param timestamp: (int) now, perf_counter_ns()
+        :param direction: (str) DIRECTION_RAISE or DIRECTION_LOWER
+        :param new_floor: (int) the chip's noise floor now
+        :return: (FloorAdjustment) what changed
+        """
+        adjustment = FloorAdjustment(timestamp, direction, self.floor, new_floor, self.noise_count(timestamp))
+        self.floor = new_floor
+        self.last_step = timestamp
+        if direction == DIRECTION_RAISE:
+            self.raise_count += 1
+            # the noise that made us raise was heard at the old floor, start counting afresh
+            self.noise_times.clear()
+        else:
+            self.lower_count += 1
+        self.history.append(adjustment)
+        return adjustment
@@ -0,0 +1,133 @@
+"""
+    recompute_rings - rebuild ring snapshots from archived detections, all at once
+
+    For dashboards wanting e.g. every prings of past days: given detections as NumPy
+    arrays (time order) and the times of the snapshots wanted, this gives each
+    snapshot's per ring strike counts and mean energies, its out of range count and
+    its first and last detection, the same numbers loadDetectionsIntoBins() gives for a
+    window ending then.
+
+    Distance codes (see DISTANCE_VALUES) are turned into rings through a table built by
+    our StormAccumulator itself.  Detections are then grouped by ring (a bincount gives
+    each ring's share) and each ring's counts and energies are prefix summed, so every
+    snapshot's window (which may overlap the next) is two searchsorted() lookups and a
+    subtraction: millions of detections a second, no Python loop per detection.
+
+    Needs NumPy (optional, only for this).
+"""
+from collections import namedtuple
+import os
+
+from .accumulator import StormAccumulator
+from .clock import NS_PER_MINUTE
+from .distances import DISTANCE_VALUES, DISTANCE_OUT_OF_RANGE, DISTANCE_OUT_OF_RANGE_CODE
+from .journal import JOURNAL_RECORD
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NS_PER_MS = 1000000
+
+# counts, energies: (snapshots, number_of_rings + 1) int64, ring 0 = overhead (energy 0 when empty)
+# out_of_range: (snapshots,) detections out of range
+# first, last: (snapshots,) time of each window's first and last detection (-1 when empty)
+RingSnapshots = namedtuple('RingSnapshots', 'counts energies out_of_range first last')
+
+
+def _numpy():
+    if numpy is None:
+        raise ImportError('recomputing rings offline needs NumPy (pip3 install numpy)')
+    return numpy
+
+
+def ring_table(number_of_rings):
+    """
+    :param number_of_rings: (int) number of rings [3-7]
+    :return: (list) the ring of each distance code, number_of_rings + 1 for out of range
+    """
+    accumulator = StormAccumulator(2, number_of_rings, 10)
+    table = []
+    for code in range(len(DISTANCE_VALUES)):
+        if code == DISTANCE_OUT_OF_RANGE_CODE:
+            table.append(number_of_rings + 1)
+        else:
+            table.append(accumulator.binIndexFromDistance(DISTANCE_VALUES[code]))
+    return table
+
+
+def recompute_rings(times, codes, energies, snapshot_times, period_in_minutes, number_of_rings, counts=None):
+    """
+    :param times: (array) detection times (ns), in time order
+    :param codes: (array) their distance codes (index into DISTANCE_VALUES)
+    :param energies: (array) their energies
+    :param snapshot_times: (array) when each snapshot is taken (ns): its window holds the
+                           detections at most period_in_minutes older, up to and including it
+    :param period_in_minutes: (int) our window length
+    :param number_of_rings: (int) number of rings [3-7]
+    :param counts: (array, optional) strikes each detection stands for. Default = 1 each
+    :return: (RingSnapshots) one row per snapshot
+    """
+    np = _numpy()
+    times = np.asarray(times, dtype=np.int64)
+    energies = np.asarray(energies, dtype=np.int64)
+    counts = np.ones(len(times), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    ends = np.asarray(snapshot_times, dtype=np.int64)
+    starts = ends - period_in_minutes * NS_PER_MINUTE
+    ringCount = number_of_rings + 1
+    outOfRangeRing = ringCount
+
+    rings = np.asarray(ring_table(number_of_rings), dtype=np.uint8)[np.asarray(codes, dtype=np.intp)]
+    # group our detections by ring, each group still in time order (a stable sort of bytes is a radix sort)
+    order = np.argsort(rings, kind='stable')
+    ringEdges = np.concatenate(([0], np.cumsum(np.bincount(rings, minlength=ringCount + 1))))
+
+    snapshotCounts = np.zeros((len(ends), ringCount), dtype=np.int64)
+    snapshotEnergies = np.zeros((len(ends), ringCount), dtype=np.int64)
+    outOfRange = np.zeros(len(ends), dtype=np.int64)
+    for ring in range(ringCount + 1):
+        members = order[ringEdges[ring]:ringEdges[ring + 1]]
+        ringTimes = times[members]
+        low = np.searchsorted(ringTimes, starts, 'left')
+        high = np.searchsorted(ringTimes, ends, 'right')
+        detections = high - low
+        if ring == outOfRangeRing:
+            outOfRange = detections     # (detections, not strikes: as loadDetectionsIntoBins() counts them)
+            continue
+        cumulativeCounts = np.concatenate(([0], np.cumsum(counts[members])))
+        cumulativeEnergies = np.concatenate(([0], np.cumsum(energies[members])))
+        snapshotCounts[:, ring] = cumulativeCounts[high] - cumulativeCounts[low]
+        # mean energy per detection, truncated like int(total / detections)
+        totalEnergies = cumulativeEnergies[high] - cumulativeEnergies[low]
+        snapshotEnergies[:, ring] = np.where(detections > 0, (totalEnergies / np.maximum(detections, 1)).astype(np.int64), 0)
+
+    low = np.searchsorted(times, starts, 'left')
+    high = np.searchsorted(times, ends, 'right')
+    hasDetections = high > low
+    lastIndex = max(0, len(times) - 1)
+    first = np.where(hasDetections, times[np.minimum(low, lastIndex)] if len(times) > 0 else -1, -1)
+    last = np.where(hasDetections, times[np.clip(high - 1, 0, lastIndex)] if len(times) > 0 else -1, -1)
+    return RingSnapshots(snapshotCounts, snapshotEnergies, outOfRange, first, last)
+
+
+def journal_arrays(filename):
+    """
+    Load a StrikeJournal (its .old file first, if any) as arrays for recompute_rings()
+
+    :param filename: (str) the journal file
+    :return: (tuple) (times ns since the epoch, distance codes, energies, counts)
+    """
+    np = _numpy()
+    recordType = np.dtype([('ms', '<i8'), ('energy', '<u4'), ('distance', 'u1'), ('pad', 'u1'), ('count', '<u2')])
+    if recordType.itemsize != JOURNAL_RECORD.size:
+        raise TypeError('[CODE] our journal record layout has changed!')
+    parts = []
+    for journalFile in (filename + '.old', filename):
+        if os.path.exists(journalFile):
+            parts.append(np.fromfile(journalFile, dtype=recordType, count=os.path.getsize(journalFile) // recordType.itemsize))
+    records = np.concatenate(parts) if len(parts) > 0 else np.zeros(0, dtype=recordType)
+    codeForDistance = np.full(DISTANCE_OUT_OF_RANGE + 1, DISTANCE_OUT_OF_RANGE_CODE, dtype=np.uint8)
+    for (code, distance) in enumerate(DISTANCE_VALUES):
+        codeForDistance[distance] = code
+    return (records['ms'] * NS_PER_MS, codeForDistance[records['distance']], records['energy'].astype(np.int64), records['count'].astype(np.int64))
@@ -0,0 +1,105 @@
+"""
+    MqttOutbox - a bounded, on-disk store-and-forward queue for our MQTT publishes
+
+    While the broker is away we hold our 'detect', 'crings' and 'prings' messages
+    here (in an sqlite file so they survive a restart of the daemon) and then drain
+    them, in order, once the broker is back.
+"""
+import sqlite3
+import threading
+import time
+
+
+class MqttOutbox:
+    def __init__(self, filename, max_messages=2000, collapse_topics=()):
+        """
+        Open (or create) the outbox file.
+
+        :param filename: (str) path of the sqlite file holding the queue (':memory:' for a non-persistent queue)
+        :param max_messages: (int, optional) bound on queued messages, oldest are dropped first. Default = 2000
+        :param collapse_topics: (list, optional) topics where only the newest queued message is worth sending
+        """
+        self.filename = filename
+        self.max_messages = max_messages
+        self.collapse_topics = set(collapse_topics)
+        self.dropped_count = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                        ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                        ' queued_at REAL NOT NULL,'
+                        ' topic TEXT NOT NULL,'
+                        ' payload TEXT NOT NULL,'
+                        ' qos INTEGER NOT NULL,'
+                        ' retain INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_topic ON outbox (topic)')
+        self.queued_count = self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def close(self):
+        """
+        Release the outbox file
+        """
+        with self.lock:
+            self.db.close()
+
+    def put(self, topic, payload, qos=1, retain=False):
+        """
+        Queue a message for later delivery.
+
+        :param topic: (str) the MQTT topic
+        :param payload: (str) the (already serialized) message
+        :param qos: (int, optional) the MQTT QoS to publish with. Default = 1
+        :param retain: (bool, optional) publish as a retained message. Default = False
+        """
+        with self.lock:
+            self.db.execute('BEGIN')
+            if topic in self.collapse_topics:
+                # a newer snapshot supersedes any we are still holding
+                self.queued_count -= self.db.execute('DELETE FROM outbox WHERE topic = ?', (topic,)).rowcount
+            self.db.execute('INSERT INTO outbox (queued_at, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?)',
+                            (time.time(), topic, payload, qos, int(retain)))
+            self.queued_count += 1
+            if self.queued_count > self.max_messages:
+                overflow = self.queued_count - self.max_messages
+                self.db.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)', (overflow,))
+                self.queued_count -= overflow
+                self.dropped_count += overflow
+            self.db.execute('COMMIT')
+
+    def peek(self, limit=1):
+        """
+        Returns the oldest queued messages without removing them.
+
+        :param limit: (int, optional) the maximum number of messages to return. Default = 1
+        :return: (list) of (id, topic, payload, qos, retain) tuples, oldest first
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT id, topic, payload, qos, retain FROM outbox ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(row[0], row[1], row[2], row[3], row[4] != 0) for row in rows]
+
+    def remove(self, messageId):
+        """
+        Forget a message once it has been handed to the broker.
+
+        :param messageId: (int) the id returned by peek()
+        """
+        with self.lock:
+            self.queued_count -= self.db.execute('DELETE FROM outbox WHERE id = ?', (messageId,)).rowcount
+
+    def depth(self):
+        """
+        :return: (int) the number of messages waiting to be sent
+        """
+        return self.queued_count
+
+    def oldest_age_seconds(self):
+        """
+        :return: (float) age in seconds of the oldest waiting message, 0 if empty
+        """
+        with self.lock:
+            row = self.db.execute('SELECT MIN(queued_at) FROM outbox').fetchone()
+        if row[0] is None:
+            return 0.0
+        return max(0.0, time.time() - row[0])
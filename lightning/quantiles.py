@@ -0,0 +1,84 @@
+"""
+    EnergySketch - streaming energy quantiles over a sliding window
+
+    Energies are counted into log-scaled buckets (8 per doubling, so a quantile is
+    within about 9% of the true value) which supports removing a value as easily as
+    adding it.  The maximum is kept exactly with a monotonic queue, which relies on
+    values leaving in the order they arrived (as our sliding window evicts them).
+    Memory is fixed whatever the storm size.
+"""
+from collections import deque
+
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS     # buckets per doubling
+MAX_ENERGY_BITS = 21            # the detector reports 21 bit energies
+BUCKETS = SUB_BUCKETS + (MAX_ENERGY_BITS - SUB_BITS) * SUB_BUCKETS
+
+
+def _bucket(energy):
+    if energy < SUB_BUCKETS:
+        return energy   # small values are exact
+    if energy >> MAX_ENERGY_BITS:
+        return BUCKETS - 1
+    exponent = energy.bit_length() - 1
+    mantissa = (energy >> (exponent - SUB_BITS)) & (SUB_BUCKETS - 1)
+    return SUB_BUCKETS + (exponent - SUB_BITS) * SUB_BUCKETS + mantissa
+
+
+def _bucket_value(bucket):
+    # the middle of the energies counted in this bucket
+    if bucket < SUB_BUCKETS:
+        return bucket
+    exponent = (bucket - SUB_BUCKETS) // SUB_BUCKETS + SUB_BITS
+    mantissa = (bucket - SUB_BUCKETS) % SUB_BUCKETS
+    width = 1 << (exponent - SUB_BITS)
+    return ((SUB_BUCKETS + mantissa) * width) + (width - 1) // 2
+
+
+class EnergySketch:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.maxima = deque()   # (sequence, energy), energies decreasing
+        self.added = 0
+        self.removed = 0
+
+    def add(self, energy):
+        bucket = _bucket(energy)
+        self.counts[bucket] += 1
+        self.count += 1
+        while self.maxima and self.maxima[-1][1] <= energy:
+            self.maxima.pop()
+        self.maxima.append((self.added, energy))
+        self.added += 1
+
+    def remove(self, energy):
+        """
+        Take back our oldest value (which must be this energy)
+        """
+        self.counts[_bucket(energy)] -= 1
+        self.count -= 1
+        if self.maxima and self.maxima[0][0] == self.removed:
+            self.maxima.popleft()
+        self.removed += 1
+
+    def maximum(self):
+        """
+        :return: (int/None) the exact largest energy held (None if empty)
+        """
+        return self.maxima[0][1] if self.maxima else None
+
+    def quantile(self, fraction):
+        """
+        :param fraction: (float) e.g. 0.5 for the median, 0.9 for P90
+        :return: (int/None) the approximate quantile (None if empty)
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(fraction * self.count + 0.999999))
+        seen = 0
+        for bucket in range(BUCKETS):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(_bucket_value(bucket), self.maximum())
+        return self.maximum()
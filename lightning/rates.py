@@ -0,0 +1,146 @@
+"""
+    StrikeRates - strike rates over the last 1, 5 and 15 minutes and a lightning jump test
+
+    Strikes are counted into a ring of per-second counters covering the last hour (3600
+    of them).  Time moves the ring on lazily: when we are next told of a strike or asked
+    for our rates, the seconds that have passed are cleared (all of them at most once).
+    Each rate window keeps a running sum, adding each strike and subtracting the seconds
+    that leave it, so its rate costs O(1).
+
+    The lightning jump follows the "2 sigma" test of Schultz et al.: the strike rate is
+    averaged over 2 minute periods, its change from one period to the next (strikes per
+    minute, per minute) is compared with the spread of the changes over the 10 minutes
+    before.  A jump is a change larger than twice that spread while the rate is at least
+    jump_min_rate.
+"""
+from array import array
+from collections import OrderedDict
+import math
+
+RING_SECONDS = 3600
+RATE_WINDOWS_MINUTES = (1, 5, 15)
+JUMP_PERIOD_SECONDS = 120
+JUMP_HISTORY_PERIODS = 5    # changes the current one is compared with
+
+# rates keys
+TIMESTAMP_KEY = 'timestamp'
+RATE_KEY_FORMAT = 'per_minute_{}m'
+JUMP_KEY = 'jump'
+JUMP_RATE_CHANGE_KEY = 'rate_change'    # strikes per minute, per minute
+JUMP_SIGMA_KEY = 'sigma'    # spread of the rate changes before
+JUMP_LEVEL_KEY = 'level'    # rate_change in sigmas (None while sigma is 0)
+JUMP_ACTIVE_KEY = 'active'
+
+
+def rateKey(window_minutes):
+    # e.g. 'per_minute_5m'
+    return RATE_KEY_FORMAT.format(window_minutes)
+
+
+class StrikeRates:
+    def __init__(self, jump_min_rate=10):
+        """
+        :param jump_min_rate: (float, optional) least strikes per minute for a jump to count. Default = 10
+        """
+        self.jump_min_rate = jump_min_rate
+        self.counts = array('L', [0]) * RING_SECONDS
+        self.newest = None  # newest second (since the epoch) in our ring
+        self.window_sums = [0] * len(RATE_WINDOWS_MINUTES)
+        self.strike_count = 0   # all strikes we were told of
+
+    def advance(self, seconds):
+        """
+        Move our ring up to this time (clearing the seconds passed)
+
+        :param seconds: (float) now, seconds since the epoch
+        """
+        second = int(seconds)
+        if self.newest is None:
+            self.newest = second
+            return
+        if second <= self.newest:
+            return
+        if second - self.newest >= RING_SECONDS:
+            for index in range(RING_SECONDS):
+                self.counts[index] = 0
+            self.window_sums = [0] * len(RATE_WINDOWS_MINUTES)
+            self.newest = second
+            return
+        for passed in range(self.newest + 1, second + 1):
+            # each window loses the second now falling out of it
+            for (windowIndex, minutes) in enumerate(RATE_WINDOWS_MINUTES):
+                self.window_sums[windowIndex] -= self.counts[(passed - minutes * 60) % RING_SECONDS]
+            self.counts[passed % RING_SECONDS] = 0
+        self.newest = second
+
+    def add(self, seconds, count=1):
+        """
+        Count strikes
+
+        :param seconds: (float) when they happened, seconds since the epoch
+        :param count: (int, optional) how many. Default = 1
+        """
+        self.strike_count += count
+        self.advance(seconds)
+        second = int(seconds)
+        age = self.newest - second
+        if age >= RING_SECONDS:
+            return  # older than our ring
+        self.counts[second % RING_SECONDS] += count
+        for (windowIndex, minutes) in enumerate(RATE_WINDOWS_MINUTES):
+            if age < minutes * 60:
+                self.window_sums[windowIndex] += count
+
+    def rate(self, seconds, window_minutes):
+        """
+        :param seconds: (float) now, seconds since the epoch
+        :param window_minutes: (int) one of RATE_WINDOWS_MINUTES
+        :return: (float) strikes per minute over the last window_minutes
+        """
+        self.advance(seconds)
+        return self.window_sums[RATE_WINDOWS_MINUTES.index(window_minutes)] / window_minutes
+
+    def _period_rate(self, periods_ago):
+        # strikes per minute over one of our 2 minute periods (0 = the one ending now)
+        end = self.newest - periods_ago * JUMP_PERIOD_SECONDS
+        total = 0
+        for second in range(end - JUMP_PERIOD_SECONDS + 1, end + 1):
+            total += self.counts[second % RING_SECONDS]
+        return total * 60.0 / JUMP_PERIOD_SECONDS
+
+    def jump(self, seconds):
+        """
+        :param seconds: (float) now, seconds since the epoch
+        :return: (tuple) (rate_change, sigma, active): the change in strike rate over our
+                 last 2 minute period (strikes per minute, per minute), the spread of the
+                 changes over the 10 minutes before and whether this is a lightning jump
+        """
+        self.advance(seconds)
+        # (JUMP_HISTORY_PERIODS + 2 periods: 14 minutes of our ring, summed only when asked)
+        periodRates = list(self._period_rate(periodsAgo) for periodsAgo in range(JUMP_HISTORY_PERIODS + 2))
+        changes = list((periodRates[index] - periodRates[index + 1]) / (JUMP_PERIOD_SECONDS / 60.0) for index in range(JUMP_HISTORY_PERIODS + 1))
+        rateChange = changes[0]
+        history = changes[1:]
+        mean = sum(history) / len(history)
+        sigma = math.sqrt(sum((change - mean) * (change - mean) for change in history) / len(history))
+        active = periodRates[0] >= self.jump_min_rate and sigma > 0 and rateChange > 2 * sigma
+        return (rateChange, sigma, active)
+
+    def report(self, seconds, timestamp_text):
+        """
+        :param seconds: (float) now, seconds since the epoch
+        :param timestamp_text: (str) now, as it should be shown
+        :return: (OrderedDict) our rates and lightning jump, as published
+        """
+        ratesData = OrderedDict()
+        ratesData[TIMESTAMP_KEY] = timestamp_text
+        for minutes in RATE_WINDOWS_MINUTES:
+            ratesData[rateKey(minutes)] = round(self.rate(seconds, minutes), 2)
+        (rateChange, sigma, active) = self.jump(seconds)
+        jumpData = OrderedDict()
+        jumpData[JUMP_RATE_CHANGE_KEY] = round(rateChange, 2)
+        jumpData[JUMP_SIGMA_KEY] = round(sigma, 2)
+        jumpData[JUMP_LEVEL_KEY] = round(rateChange / sigma, 1) if sigma > 0 else None
+        jumpData[JUMP_ACTIVE_KEY] = active
+        ratesData[JUMP_KEY] = jumpData
+        return ratesData
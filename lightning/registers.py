@@ -0,0 +1,125 @@
+"""
+    RegisterRecorder - record every detector interrupt as raw registers, for replay
+
+    Each interrupt becomes one fixed size record: when its edge happened, the interrupt
+    reason and registers 0x03-0x08 exactly as read from the chip.  Replaying these through
+    our driver's own decoding (AS3935_Replay) reproduces a real storm, noise and
+    disturbers included, as fast as we can handle it.
+
+    The file starts with a header that indexes it: the record count and how many of each
+    reason, so a replay knows what it holds without reading it all.  Records follow in
+    time order, record N being at HEADER.size + N * RECORD.size.
+
+    Times are kept as a tick (microseconds, wrapping every ~72 minutes like a pigpio tick)
+    plus whole seconds since recording started, which tells the tick's wraps apart.
+"""
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b'AS3R'
+VERSION = 1
+
+# magic, version, record size, records, then records by reason: noise, disturber, lightning, other
+HEADER = struct.Struct('<4sHHIIIII8x')
+# tick (us), reason, registers 0x03-0x08, source (see RECORD_SOURCE_*), seconds since we started
+RECORD = struct.Struct('<IB6sBI')
+REGISTERS_FIRST = 0x03
+REGISTERS_COUNT = 6
+TICK_WRAP = 1 << 32
+
+RECORD_SOURCE_EDGE = 1  # the IRQ edge callback
+RECORD_SOURCE_POLL = 2  # our safety poll found IRQ raised
+
+REASON_NOISE = 0x01
+REASON_DISTURBER = 0x04
+REASON_LIGHTNING = 0x08
+
+# offset_us: microseconds since recording started (tick wraps removed)
+RegisterRecord = namedtuple('RegisterRecord', 'offset_us reason registers source')
+
+
+class RegisterRecorder:
+    def __init__(self, filename, start_ns):
+        """
+        Start a new recording (replacing any file of that name)
+
+        :param filename: (str) our record file
+        :param start_ns: (int) when our recording starts, perf_counter_ns()
+        """
+        self.filename = filename
+        self.start_ns = start_ns
+        self.file = open(filename, 'w+b', buffering=0)  # unbuffered: a crash loses nothing recorded
+        self.records = 0
+        self.reason_counts = [0, 0, 0, 0]
+        self._write_header()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_header(self):
+        os.pwrite(self.file.fileno(), HEADER.pack(MAGIC, VERSION, RECORD.size, self.records, *self.reason_counts), 0)
+
+    def add(self, edge_ns, registers, source=RECORD_SOURCE_EDGE):
+        """
+        Append an interrupt
+
+        :param edge_ns: (int) when its edge happened, perf_counter_ns()
+        :param registers: (list) registers 0x03-0x08 as read when handling it
+        :param source: (int, optional) RECORD_SOURCE_EDGE or RECORD_SOURCE_POLL. Default = RECORD_SOURCE_EDGE
+        """
+        elapsedNs = max(0, edge_ns - self.start_ns)
+        reason = registers[0] & 0x0F
+        self.file.seek(HEADER.size + self.records * RECORD.size)
+        self.file.write(RECORD.pack((elapsedNs // 1000) % TICK_WRAP, reason, bytes(registers), source, elapsedNs // 1000000000))
+        self.records += 1
+        self.reason_counts[_reason_slot(reason)] += 1
+        self._write_header()
+
+
+def _reason_slot(reason):
+    if reason == REASON_NOISE:
+        return 0
+    if reason == REASON_DISTURBER:
+        return 1
+    if reason == REASON_LIGHTNING:
+        return 2
+    return 3
+
+
+def read_header(filename):
+    """
+    :param filename: (str) a record file
+    :return: (dict) records, noise, disturber, lightning and other counts
+    """
+    with open(filename, 'rb') as recordFile:
+        return _unpack_header(recordFile.read(HEADER.size), filename)
+
+
+def _unpack_header(data, filename):
+    if len(data) < HEADER.size:
+        raise ValueError('"{}" is not a register recording (too short)'.format(filename))
+    (magic, version, recordSize, records, noise, disturber, lightning, other) = HEADER.unpack(data)
+    if magic != MAGIC or recordSize != RECORD.size:
+        raise ValueError('"{}" is not a register recording'.format(filename))
+    if version != VERSION:
+        raise ValueError('"{}" is a version {} register recording, we read version {}'.format(filename, version, VERSION))
+    return { 'records': records, 'noise': noise, 'disturber': disturber, 'lightning': lightning, 'other': other }
+
+
+def read_records(filename):
+    """
+    Read back a recording in time order
+
+    :param filename: (str) a record file
+    :return: (generator) of RegisterRecord
+    """
+    with open(filename, 'rb') as recordFile:
+        header = _unpack_header(recordFile.read(HEADER.size), filename)
+        data = recordFile.read(header['records'] * RECORD.size)
+    for (tick, reason, registers, source, seconds) in RECORD.iter_unpack(data):
+        # the tick is exact but wraps, our seconds don't wrap: pick the wrap that agrees with them
+        wraps = (seconds * 1000000 - tick + TICK_WRAP // 2) // TICK_WRAP
+        yield RegisterRecord(tick + wraps * TICK_WRAP, reason, list(registers), source)
@@ -0,0 +1,172 @@
+"""
+    RollupStore - fixed size, memory-mapped round-robin store of strike aggregates
+
+    In the spirit of RRD: for each resolution (minute, hour, day) the file holds a fixed
+    number of slots, each slot holding per ring (plus one for 'out of range') the strike
+    count, energy sum and min/max distance.  A strike updates one slot per resolution
+    (O(1), no allocation) and a slot is simply cleared when its time comes round again,
+    so the file never grows.  Slot boundaries are in UTC.
+
+    Dump a resolution as CSV with:  python3 -m lightning.rollup {rollup-file} [minute|hour|day]
+"""
+from datetime import datetime
+import mmap
+import os
+import struct
+import sys
+
+ROLLUP_MAGIC = b'LRRD'
+ROLLUP_VERSION = 1
+
+# name, seconds per slot, number of slots (1 day of minutes, 31 days of hours, 3 years of days)
+RESOLUTIONS = (('minute', 60, 1440), ('hour', 3600, 744), ('day', 86400, 1098))
+
+HEADER = struct.Struct('<4sHH')                 # magic, version, number of rings
+SLOT_START = struct.Struct('<q')                # slot start, seconds since the epoch (0 = never used)
+ENTRY = struct.Struct('<IQBBxx')                # count, energy sum, min distance, max distance
+NO_DISTANCE = 0xFF                              # min distance of an entry with no distance seen
+
+
+class RollupStore:
+    def __init__(self, filename, number_of_rings):
+        """
+        Open (creating if needed) our store.  A file built for another number of rings is
+        moved aside to {filename}.old and a new one started.
+
+        :param filename: (str) the store file
+        :param number_of_rings: (int) rings (beyond 'overhead' ring 0) we aggregate
+        """
+        self.filename = filename
+        self.number_of_rings = number_of_rings
+        self.entries_per_slot = number_of_rings + 2     # overhead + rings + out of range
+        self.slot_size = SLOT_START.size + self.entries_per_slot * ENTRY.size
+        # per resolution: (name, step, slots, offset of first slot)
+        self.resolutions = []
+        offset = HEADER.size
+        for (name, step, slots) in RESOLUTIONS:
+            self.resolutions.append((name, step, slots, offset))
+            offset += slots * self.slot_size
+        self.size = offset
+
+        if os.path.exists(filename) and not self._is_compatible(filename):
+            os.replace(filename, filename + '.old')
+        if not os.path.exists(filename):
+            with open(filename, 'wb') as newFile:
+                newFile.write(HEADER.pack(ROLLUP_MAGIC, ROLLUP_VERSION, number_of_rings))
+                newFile.truncate(self.size)
+        self.file = open(filename, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def _is_compatible(self, filename):
+        if os.path.getsize(filename) != self.size:
+            return False
+        with open(filename, 'rb') as oldFile:
+            (magic, version, rings) = HEADER.unpack(oldFile.read(HEADER.size))
+        return magic == ROLLUP_MAGIC and version == ROLLUP_VERSION and rings == self.number_of_rings
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def flush(self):
+        self.map.flush()
+
+    def out_of_range_index(self):
+        """
+        :return: (int) the entry index used for 'out of range' strikes
+        """
+        return self.number_of_rings + 1
+
+    def add_strike(self, seconds, ring_index, energy, distance, count=1):
+        """
+        Add a strike (or a strike standing for count strikes) to every resolution
+
+        :param seconds: (float) when the strike happened, seconds since the epoch
+        :param ring_index: (int) 0 = overhead, 1-N our rings, N+1 out of range
+        :param energy: (int) the energy reported by the detector
+        :param distance: (int/None) the distance in km reported by the detector (None if out of range)
+        :param count: (int, optional) strikes this detection stands for. Default = 1
+        """
+        whole_seconds = int(seconds)
+        entryOffsetInSlot = SLOT_START.size + ring_index * ENTRY.size
+        for (name, step, slots, offset) in self.resolutions:
+            slotStart = whole_seconds - (whole_seconds % step)
+            slotOffset = offset + ((slotStart // step) % slots) * self.slot_size
+            (storedStart,) = SLOT_START.unpack_from(self.map, slotOffset)
+            if storedStart != slotStart:
+                if storedStart > slotStart:
+                    continue    # too old for this resolution (slot already reused)
+                # this slot's time has come round again: clear it
+                self.map[slotOffset:slotOffset + self.slot_size] = bytes(self.slot_size)
+                SLOT_START.pack_into(self.map, slotOffset, slotStart)
+            entryOffset = slotOffset + entryOffsetInSlot
+            (entryCount, energySum, minDistance, maxDistance) = ENTRY.unpack_from(self.map, entryOffset)
+            if entryCount == 0:
+                minDistance = NO_DISTANCE
+            if distance is not None:
+                minDistance = min(minDistance, distance)
+                maxDistance = max(maxDistance, distance)
+            ENTRY.pack_into(self.map, entryOffset, entryCount + count, energySum + energy, minDistance, maxDistance)
+
+    def slots(self, resolution, start=None, end=None):
+        """
+        Read back the used slots of a resolution, oldest first
+
+        :param resolution: (str) 'minute', 'hour' or 'day'
+        :param start: (float, optional) only slots starting at or after this (seconds since the epoch)
+        :param end: (float, optional) only slots starting before this (seconds since the epoch)
+        :return: (generator) of (slot_start, [(count, energy_sum, min_distance, max_distance) per entry])
+                 min/max distance are None when no distance was seen
+        """
+        for (name, step, slots, offset) in self.resolutions:
+            if name == resolution:
+                break
+        else:
+            raise ValueError('Unknown resolution "{}"'.format(resolution))
+        used = []
+        for slotIndex in range(slots):
+            (slotStart,) = SLOT_START.unpack_from(self.map, offset + slotIndex * self.slot_size)
+            if slotStart == 0 or (start is not None and slotStart < start - (start % step)) or (end is not None and slotStart >= end):
+                continue
+            used.append((slotStart, slotIndex))
+        used.sort()
+        for (slotStart, slotIndex) in used:
+            slotOffset = offset + slotIndex * self.slot_size
+            entries = []
+            for entryIndex in range(self.entries_per_slot):
+                (entryCount, energySum, minDistance, maxDistance) = ENTRY.unpack_from(self.map, slotOffset + SLOT_START.size + entryIndex * ENTRY.size)
+                if entryCount == 0 or minDistance == NO_DISTANCE:
+                    entries.append((entryCount, energySum, None, None))
+                else:
+                    entries.append((entryCount, energySum, minDistance, maxDistance))
+            yield (slotStart, entries)
+
+
+def write_csv(outFile, store, resolution):
+    columns = ['start']
+    for entryIndex in range(store.entries_per_slot):
+        name = 'oor' if entryIndex == store.out_of_range_index() else 'ring{}'.format(entryIndex)
+        columns.extend(['{}_count'.format(name), '{}_energy'.format(name), '{}_min_km'.format(name), '{}_max_km'.format(name)])
+    outFile.write('# {}\n'.format(', '.join(columns)))
+    for (slotStart, entries) in store.slots(resolution):
+        values = [datetime.fromtimestamp(slotStart).astimezone().isoformat()]
+        for (entryCount, energySum, minDistance, maxDistance) in entries:
+            values.extend([str(entryCount), str(energySum), '' if minDistance is None else str(minDistance), '' if maxDistance is None else str(maxDistance)])
+        outFile.write(', '.join(values) + '\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print('usage: python3 -m lightning.rollup {rollup-file} [minute|hour|day]', file=sys.stderr)
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as rollupFile:
+        (magic, version, rings) = HEADER.unpack(rollupFile.read(HEADER.size))
+    if magic != ROLLUP_MAGIC or version != ROLLUP_VERSION:
+        print('{}: not a rollup file'.format(sys.argv[1]), file=sys.stderr)
+        sys.exit(1)
+    store = RollupStore(sys.argv[1], rings)
+    write_csv(sys.stdout, store, sys.argv[2] if len(sys.argv) == 3 else 'minute')
+    store.close()
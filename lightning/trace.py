@@ -0,0 +1,165 @@
+"""
+    InterruptTracer - per-stage latency tracing of our interrupt handling
+
+    Each interrupt gets a small record holding a perf_counter_ns() stamp for every stage
+    it passes through (edge, settle, reason read, ... broker ack).  Finished records are
+    kept in a fixed size ring buffer (which can be dumped as CSV on demand) and can
+    also be streamed, as fixed size binary records, to a file for offline analysis.
+
+    Convert a streamed file to CSV with:  python3 -m lightning.trace {trace-file}
+"""
+from array import array
+import struct
+import sys
+import threading
+
+TRACE_STAGES = ('edge', 'settle', 'reason', 'read', 'accumulate', 'rebuild', 'serialize', 'enqueue', 'ack')
+
+STAGE_EDGE = 0
+STAGE_SETTLE = 1
+STAGE_REASON = 2
+STAGE_READ = 3
+STAGE_ACCUMULATE = 4
+STAGE_REBUILD = 5
+STAGE_SERIALIZE = 6
+STAGE_ENQUEUE = 7
+STAGE_ACK = 8
+
+# record: sequence, channel, reason, then one stamp per stage (0 = stage not reached)
+TRACE_RECORD = struct.Struct('<IhBx{}q'.format(len(TRACE_STAGES)))
+RECORD_FIELDS = 3 + len(TRACE_STAGES)
+
+
+class InterruptTrace:
+    __slots__ = ('sequence', 'channel', 'reason', 'stamps', 'pending')
+
+    def __init__(self, sequence, channel, edge_ns):
+        self.sequence = sequence
+        self.channel = channel
+        self.reason = 0
+        self.stamps = [0] * len(TRACE_STAGES)
+        self.stamps[STAGE_EDGE] = edge_ns
+        self.pending = 1    # released by the handler, plus once per hold()
+
+    def mark(self, stage, stamp_ns):
+        self.stamps[stage] = stamp_ns
+
+
+class InterruptTracer:
+    def __init__(self, capacity=1024, stream_filename=None):
+        """
+        :param capacity: (int, optional) number of finished records kept in memory. Default = 1024
+        :param stream_filename: (str, optional) also append every finished record to this file
+        """
+        self.capacity = capacity
+        self.records = array('q', bytes(8 * capacity * RECORD_FIELDS))
+        self.written = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.stream = None
+        if stream_filename:
+            self.stream = open(stream_filename, 'ab', buffering=64 * 1024)
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+    def begin(self, channel, edge_ns):
+        """
+        Start the record for a new interrupt.
+
+        :param channel: (int) the interrupt source (GPIO pin or one of our synthetic channels)
+        :param edge_ns: (int) perf_counter_ns() at the IRQ edge (or at handler entry if unknown)
+        :return: (InterruptTrace) the in-flight record
+        """
+        with self.lock:
+            self.sequence += 1
+            return InterruptTrace(self.sequence, channel, edge_ns)
+
+    def hold(self, trace):
+        """
+        Keep the record open until a matching release() (e.g. from our publish ack)
+        """
+        with self.lock:
+            trace.pending += 1
+
+    def release(self, trace):
+        """
+        Drop one hold, the record is written when the last is gone
+        """
+        with self.lock:
+            trace.pending -= 1
+            if trace.pending > 0:
+                return
+            slot = (self.written % self.capacity) * RECORD_FIELDS
+            self.records[slot] = trace.sequence
+            self.records[slot + 1] = trace.channel
+            self.records[slot + 2] = trace.reason
+            self.records[slot + 3:slot + RECORD_FIELDS] = array('q', trace.stamps)
+            self.written += 1
+            if self.stream is not None:
+                self.stream.write(TRACE_RECORD.pack(trace.sequence & 0xFFFFFFFF, trace.channel, trace.reason & 0xFF, *trace.stamps))
+
+    def flush(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+
+    def snapshot(self):
+        """
+        :return: (list) of (sequence, channel, reason, [stamps]) tuples for the buffered records, oldest first
+        """
+        with self.lock:
+            count = min(self.written, self.capacity)
+            first = self.written - count
+            entries = []
+            for index in range(first, self.written):
+                slot = (index % self.capacity) * RECORD_FIELDS
+                fields = self.records[slot:slot + RECORD_FIELDS]
+                entries.append((fields[0], fields[1], fields[2], list(fields[3:])))
+        return entries
+
+    def dump_csv(self, filename):
+        """
+        Write the buffered records as CSV (stage times in microseconds after the edge)
+
+        :return: (int) the number of records written
+        """
+        entries = self.snapshot()
+        with open(filename, 'w') as csvFile:
+            write_csv(csvFile, entries)
+        return len(entries)
+
+
+def write_csv(outFile, entries):
+    outFile.write('# sequence, channel, reason, {} (us after edge, blank = not reached)\n'.format(', '.join(TRACE_STAGES)))
+    for (sequence, channel, reason, stamps) in entries:
+        edge_ns = stamps[STAGE_EDGE]
+        columns = [str(sequence), str(channel), '0x{:02x}'.format(reason)]
+        for stamp in stamps:
+            columns.append('' if stamp == 0 else '{:.1f}'.format((stamp - edge_ns) / 1000.0))
+        outFile.write(', '.join(columns) + '\n')
+
+
+def read_stream(filename):
+    """
+    Read back a streamed trace file
+
+    :return: (generator) of (sequence, channel, reason, [stamps]) tuples
+    """
+    with open(filename, 'rb') as streamFile:
+        while True:
+            data = streamFile.read(TRACE_RECORD.size)
+            if len(data) < TRACE_RECORD.size:
+                break
+            fields = TRACE_RECORD.unpack(data)
+            yield (fields[0], fields[1], fields[2], list(fields[3:]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python3 -m lightning.trace {trace-file}', file=sys.stderr)
+        sys.exit(1)
+    write_csv(sys.stdout, read_stream(sys.argv[1]))
@@ -0,0 +1,93 @@
+"""
+    DistanceTrend - streaming weighted linear regression of strike distance against time
+
+    Keeps only the weighted sums of the regression so a detection entering or leaving our
+    sliding window costs O(1).  From the fitted line we estimate how fast the storm is
+    approaching (positive) or receding (negative), when it would be overhead, and how
+    well the line fits (r squared, scaled down while we have only a few detections).
+"""
+
+MIN_DETECTIONS = 3          # fewer than this and we don't estimate
+FULL_CONFIDENCE_DETECTIONS = 10  # the fit's r squared is scaled down below this many detections
+
+
+class DistanceTrend:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.origin = None  # time of our first detection (keeps our sums small)
+        self.sum_w = 0.0
+        self.sum_wt = 0.0
+        self.sum_wd = 0.0
+        self.sum_wtt = 0.0
+        self.sum_wtd = 0.0
+        self.sum_wdd = 0.0
+
+    def add(self, seconds, distance, weight=1):
+        """
+        :param seconds: (float) when the strike happened, seconds since the epoch
+        :param distance: (float) the distance reported by the detector (km)
+        :param weight: (float, optional) e.g. the strikes this detection stands for. Default = 1
+        """
+        if self.origin is None:
+            self.origin = seconds
+        self._update(seconds - self.origin, distance, weight, 1)
+
+    def remove(self, seconds, distance, weight=1):
+        """
+        Take back a detection previously add()ed with the same values
+        """
+        self._update(seconds - self.origin, distance, -weight, -1)
+        if self.count == 0:
+            self.reset()    # also drops any floating point residue
+
+    def decay(self, weight):
+        """
+        Scale down every detection's weight alike (our rings are decaying, not a window)
+
+        :param weight: (float) e.g. 0.5 after a half-life
+        """
+        self.count *= weight
+        self.sum_w *= weight
+        self.sum_wt *= weight
+        self.sum_wd *= weight
+        self.sum_wtt *= weight
+        self.sum_wtd *= weight
+        self.sum_wdd *= weight
+
+    def _update(self, t, d, w, step):
+        self.count += step
+        self.sum_w += w
+        self.sum_wt += w * t
+        self.sum_wd += w * d
+        self.sum_wtt += w * t * t
+        self.sum_wtd += w * t * d
+        self.sum_wdd += w * d * d
+
+    def estimate(self, seconds):
+        """
+        :param seconds: (float) now, seconds since the epoch
+        :return: (tuple) (approach_km_per_hour, eta_overhead_minutes, confidence) or None if unknown.
+                 eta is None unless approaching, confidence is 0.0-1.0
+        """
+        if self.count < MIN_DETECTIONS or self.sum_w <= 0:
+            return None
+        timeVariance = self.sum_w * self.sum_wtt - self.sum_wt * self.sum_wt
+        if timeVariance <= 1e-9 * self.sum_w * self.sum_w:
+            return None     # all at (nearly) the same time
+        covariance = self.sum_w * self.sum_wtd - self.sum_wt * self.sum_wd
+        slope = covariance / timeVariance      # km per second
+        intercept = (self.sum_wd - slope * self.sum_wt) / self.sum_w
+        distanceVariance = self.sum_w * self.sum_wdd - self.sum_wd * self.sum_wd
+        if distanceVariance <= 1e-9 * self.sum_w * self.sum_w:
+            rSquared = 1.0 if abs(slope) < 1e-9 else 0.0
+        else:
+            rSquared = min(1.0, (covariance * covariance) / (timeVariance * distanceVariance))
+        confidence = rSquared * min(1.0, self.count / FULL_CONFIDENCE_DETECTIONS)
+        etaMinutes = None
+        if slope < 0:
+            distanceNow = max(0.0, intercept + slope * (seconds - self.origin))
+            etaMinutes = distanceNow / -slope / 60.0
+        return (-slope * 3600.0, etaMinutes, confidence)
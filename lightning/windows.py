@@ -0,0 +1,125 @@
+"""
+    WindowSums - several sliding windows (e.g. 2, 10 and 60 minutes) over one strike stream
+
+    Strikes (and the detections standing for them) are counted into fixed time buckets
+    (10 seconds by default) per detector distance value (16 of them, so independent of our ring geometry) and each window
+    keeps running sums over the buckets it spans.  A strike adds to its bucket and to
+    each window's sums, and as time moves on each window subtracts the buckets leaving
+    it, so a window costs O(distance values) per update and no memory per strike.
+    Window edges move in whole buckets.
+"""
+from array import array
+
+from .distances import DISTANCE_SLOTS, distance_code
+
+
+class _Window:
+    __slots__ = ('minutes', 'buckets', 'edge', 'counts', 'detections', 'energies')
+
+    def __init__(self, minutes, buckets):
+        self.minutes = minutes
+        self.buckets = buckets
+        self.edge = None    # oldest bucket (id) inside this window
+        self.counts = [0] * DISTANCE_SLOTS
+        self.detections = [0] * DISTANCE_SLOTS
+        self.energies = [0] * DISTANCE_SLOTS
+
+
+class WindowSums:
+    def __init__(self, windows_minutes, bucket_seconds=10):
+        """
+        :param windows_minutes: (list) the window lengths in minutes
+        :param bucket_seconds: (int, optional) our time resolution. Default = 10
+        """
+        self.bucket_seconds = bucket_seconds
+        self.windows = [_Window(minutes, (minutes * 60) // bucket_seconds) for minutes in windows_minutes]
+        self.slots = max(window.buckets for window in self.windows) + 1
+        self.bucket_ids = array('q', [-1]) * self.slots
+        self.counts = array('L', [0]) * (self.slots * DISTANCE_SLOTS)
+        self.detections = array('L', [0]) * (self.slots * DISTANCE_SLOTS)
+        self.energies = array('Q', [0]) * (self.slots * DISTANCE_SLOTS)
+        self.newest = None  # newest bucket (id) seen
+
+    def add_strike(self, seconds, ring_index, energy, distance, count=1):
+        """
+        Count a strike (same signature as RollupStore.add_strike so all our strike sinks are fed alike)
+        """
+        bucketId = int(seconds) // self.bucket_seconds
+        self.advance(seconds)
+        slot = bucketId % self.slots
+        if self.bucket_ids[slot] != bucketId:
+            if bucketId <= self.newest - self.slots:
+                return  # too old for any of our windows
+            self.bucket_ids[slot] = bucketId
+            base = slot * DISTANCE_SLOTS
+            for offset in range(DISTANCE_SLOTS):
+                self.counts[base + offset] = 0
+                self.detections[base + offset] = 0
+                self.energies[base + offset] = 0
+        distanceSlot = distance_code(distance)
+        index = slot * DISTANCE_SLOTS + distanceSlot
+        self.counts[index] += count
+        self.detections[index] += 1
+        self.energies[index] += energy
+        for window in self.windows:
+            if bucketId >= window.edge:
+                window.counts[distanceSlot] += count
+                window.detections[distanceSlot] += 1
+                window.energies[distanceSlot] += energy
+
+    def advance(self, seconds):
+        """
+        Move our windows up to this time (dropping buckets that leave them)
+
+        :param seconds: (float) now, seconds since the epoch
+        """
+        bucketId = int(seconds) // self.bucket_seconds
+        if self.newest is not None and bucketId <= self.newest:
+            return
+        self.newest = bucketId
+        for window in self.windows:
+            newEdge = bucketId - window.buckets + 1
+            if window.edge is None or newEdge - window.edge >= window.buckets:
+                # everything we held has left the window
+                window.counts = [0] * DISTANCE_SLOTS
+                window.detections = [0] * DISTANCE_SLOTS
+                window.energies = [0] * DISTANCE_SLOTS
+                window.edge = newEdge
+                continue
+            while window.edge < newEdge:
+                slot = window.edge % self.slots
+                if self.bucket_ids[slot] == window.edge:
+                    base = slot * DISTANCE_SLOTS
+                    for distanceSlot in range(DISTANCE_SLOTS):
+                        window.counts[distanceSlot] -= self.counts[base + distanceSlot]
+                        window.detections[distanceSlot] -= self.detections[base + distanceSlot]
+                        window.energies[distanceSlot] -= self.energies[base + distanceSlot]
+                window.edge += 1
+
+    def next_change(self):
+        """
+        :return: (float/None) when (seconds since the epoch) the oldest strikes one of our windows
+                 holds will leave it (None while our windows hold none)
+        """
+        nextBucket = None
+        for window in self.windows:
+            if window.edge is None or sum(window.detections) == 0:
+                continue
+            bucketId = window.edge
+            while bucketId < self.newest and self.bucket_ids[bucketId % self.slots] != bucketId:
+                bucketId += 1
+            # it leaves once our newest bucket is window.buckets past it
+            if nextBucket is None or bucketId + window.buckets < nextBucket:
+                nextBucket = bucketId + window.buckets
+        return None if nextBucket is None else float(nextBucket * self.bucket_seconds)
+
+    def window_sums(self, minutes):
+        """
+        :param minutes: (int) one of our window lengths
+        :return: (tuple) ([strike count per distance value], [detections per distance value],
+                 [energy sum per distance value]) in DISTANCE_VALUES order
+        """
+        for window in self.windows:
+            if window.minutes == minutes:
+                return (window.counts, window.detections, window.energies)
+        raise ValueError('No {} minute window'.format(minutes))